@@ -1,3 +1,10 @@
 from .sample_reader import SampleReader, SampleBuffer, main
 from .sample_processor import SampleProcessor
+from .channelizer import Channelizer, ChannelizerProcessor
 from .common import SampleConfig, ProcessConfig
+from .stats import PipelineStats
+from .chicktimer import ChickTimer, ChickTimerDecoder
+from .sink import SqliteSink
+from .scan import ChannelScanner, ScanScheduler
+from .mixer import Mixer
+from .simulated import Simulation, SimulatedSdr
@@ -0,0 +1,767 @@
+from __future__ import annotations
+from typing import Any, Callable, Sequence
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import io
+import os
+import tempfile
+import json
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+
+from kiwitracker.common import SamplesT, SampleConfig, ProcessConfig, channel_freq
+from kiwitracker.sample_processor import SampleProcessor
+from kiwitracker.channelizer import ChannelizerProcessor, make_processor
+from kiwitracker.stats import PipelineStats
+from kiwitracker.sample_reader import SampleBuffer, run_main
+from kiwitracker.capture import CaptureHeader, CaptureWriter
+from kiwitracker.simulated import Simulation
+from kiwitracker.synth import Transmitter, synthesize, iter_synthesize
+from kiwitracker.rawiq import RAW_IQ_DTYPE
+from kiwitracker import fftbackend
+
+
+def make_test_samples(
+    process_config: ProcessConfig,
+    num_samples: int|None = None,
+    snr_db: float = 20,
+) -> SamplesT:
+    """Synthesize samples with a beep from the carrier being processed
+    (beginning 0.1 seconds in)
+    """
+    sample_config = process_config.sample_config
+    if num_samples is None:
+        num_samples = process_config.num_samples_to_process
+    tx = Transmitter(
+        carrier_offset=process_config.carrier_freq - sample_config.center_freq,
+    )
+    return synthesize(
+        [tx], num_samples / sample_config.sample_rate, sample_config.sample_rate,
+        snr_db=snr_db, dtype=process_config.dtype,
+    )
+
+
+def time_calls(func: Callable, *args, repeat: int = 20) -> list[float]:
+    """Call *func* the given number of times and return the time (in
+    seconds) of each call
+    """
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start_time)
+    return times
+
+
+def time_call(func: Callable, *args, repeat: int = 20) -> float:
+    """Call *func* the given number of times and return the best time (in
+    seconds) of a single call
+    """
+    return min(time_calls(func, *args, repeat=repeat))
+
+
+def latency_stats(times: list[float]) -> dict[str, float]:
+    """Summarize a list of call times (in seconds)
+    """
+    a = np.asarray(times)
+    return {
+        'mean': float(a.mean()),
+        'p50': float(np.percentile(a, 50)),
+        'p95': float(np.percentile(a, 95)),
+        'max': float(a.max()),
+    }
+
+
+def bench_detection(process_config: ProcessConfig, repeat: int = 20) -> dict[str, float]:
+    """Compare the batched and frame-by-frame beep detection methods of
+    :class:`~.sample_processor.SampleProcessor`
+    """
+    processor = SampleProcessor(process_config)
+    samples = make_test_samples(process_config)
+    batched = processor.detect_beeps(samples).beep_freqs
+    looped, _ = processor._detect_beeps_loop(samples)
+    assert np.array_equal(batched, looped)
+
+    loop_time = time_call(processor._detect_beeps_loop, samples, repeat=repeat)
+    batch_time = time_call(processor.detect_beeps, samples, repeat=repeat)
+    return {
+        'loop': loop_time,
+        'batched': batch_time,
+        'speedup': loop_time / batch_time,
+    }
+
+
+def bench_fft(process_config: ProcessConfig, repeat: int = 20) -> dict[str, Any]:
+    """Time each available :mod:`~.fftbackend` on the batched FFTs done by
+    the detection and channelizer stages for one chunk
+    """
+    processor = SampleProcessor(process_config)
+    channelizer = ChannelizerProcessor(process_config).channelizer
+    num_samples = process_config.num_samples_to_process
+    shapes = {
+        'detection': (num_samples // processor.fft_size, processor.fft_size),
+        'channelizer': (num_samples // channelizer.decimation, channelizer.num_bins),
+    }
+    result: dict[str, Any] = {}
+    for key, shape in shapes.items():
+        times = fftbackend.time_backends(shape, process_config.dtype, repeat=repeat)
+        result[key] = {
+            'shape': list(shape),
+            'times': times,
+            'fastest': min(times, key=times.__getitem__),
+        }
+    return result
+
+
+def bench_channelizer(process_config: ProcessConfig, repeat: int = 20) -> dict[str, float]:
+    """Compare processing a single carrier with :class:`~.sample_processor.SampleProcessor`
+    to processing every channel within the sampled span with a
+    :class:`~.channelizer.ChannelizerProcessor`
+    """
+    processor = SampleProcessor(process_config)
+    processor.verbose = False
+    channelizer = ChannelizerProcessor(process_config)
+    channelizer.verbose = False
+    samples = make_test_samples(process_config)
+    single_time = time_call(processor.process, samples, repeat=repeat)
+    channelizer_time = time_call(channelizer.process, samples, repeat=repeat)
+    return {
+        'num_channels': len(channelizer.channels),
+        'single': single_time,
+        'channelizer': channelizer_time,
+    }
+
+
+def bench_process(process_config: ProcessConfig, duration: float = 30) -> dict[str, Any]:
+    """Measure throughput and per-call latency of :meth:`.SampleProcessor.process`
+    over *duration* seconds of synthesized samples from an 80 BPM transmitter
+    """
+    sample_config = process_config.sample_config
+    processor = SampleProcessor(process_config)
+    processor.verbose = False
+    tx = Transmitter(
+        carrier_offset=process_config.carrier_freq - sample_config.center_freq,
+    )
+    chunks = list(iter_synthesize(
+        [tx], duration, sample_config.sample_rate,
+        processor.num_samples_to_process, dtype=process_config.dtype,
+    ))
+    num_samples = sum(chunk.size for chunk in chunks)
+    times = []
+    num_events = 0
+    for chunk in chunks:
+        start_time = time.perf_counter()
+        num_events += len(processor.process(chunk))
+        times.append(time.perf_counter() - start_time)
+    elapsed = sum(times)
+    return {
+        'samples_per_sec': num_samples / elapsed,
+        'realtime_factor': num_samples / elapsed / sample_config.sample_rate,
+        'latency': latency_stats(times),
+        'num_events': num_events,
+    }
+
+
+def bench_escalation(
+    process_config: ProcessConfig,
+    duration: float = 30,
+    snr_db: float = -15,
+    amplitude: float = 3
+) -> dict[str, Any]:
+    """Compare the fraction of chunks escalated to full processing (and the
+    beeps found) with fixed and adaptive thresholds
+
+    A single strong transmitter is synthesized within heavy noise, as if the
+    gain was set too high.
+    """
+    sample_config = process_config.sample_config
+    tx = Transmitter(
+        carrier_offset=process_config.carrier_freq - sample_config.center_freq,
+        amplitude=amplitude,
+    )
+    results = {}
+    for adaptive in [False, True]:
+        stats = PipelineStats(sample_config.sample_rate)
+        processor = make_processor(process_config, stats=stats)
+        processor.adaptive = adaptive
+        num_events = 0
+        for chunk in iter_synthesize(
+            [tx], duration, sample_config.sample_rate,
+            processor.num_samples_to_process, snr_db=snr_db,
+            dtype=process_config.dtype,
+        ):
+            num_events += len(processor.process(chunk))
+        key = 'adaptive' if adaptive else 'fixed'
+        results[key] = {
+            'escalated_fraction': stats.escalated_fraction,
+            'num_events': num_events,
+        }
+    return results
+
+
+def bench_gate(
+    process_config: ProcessConfig,
+    duration: float = 30,
+    bpm: float = 30
+) -> dict[str, Any]:
+    """Compare :meth:`.SampleProcessor.process` with and without the energy
+    gate (:meth:`.SampleProcessor.check_energy`)
+
+    The number of chunks rejected by each stage and the beeps found are
+    included to check nothing was missed.
+    """
+    sample_config = process_config.sample_config
+    tx = Transmitter(
+        carrier_offset=process_config.carrier_freq - sample_config.center_freq,
+        bpm=bpm,
+    )
+    chunks = list(iter_synthesize(
+        [tx], duration, sample_config.sample_rate,
+        process_config.num_samples_to_process, dtype=process_config.dtype,
+    ))
+    num_samples = sum(chunk.size for chunk in chunks)
+    results = {}
+    for gate_enabled in [False, True]:
+        stats = PipelineStats(sample_config.sample_rate)
+        processor = SampleProcessor(process_config, stats=stats)
+        processor.gate_enabled = gate_enabled
+        num_events = 0
+        start_time = time.perf_counter()
+        for chunk in chunks:
+            num_events += len(processor.process(chunk))
+        elapsed = time.perf_counter() - start_time
+        key = 'gated' if gate_enabled else 'ungated'
+        results[key] = {
+            'samples_per_sec': num_samples / elapsed,
+            'num_events': num_events,
+            'counters': dict(stats.counters),
+        }
+    return results
+
+
+async def _bench_buffer(
+    buffer: SampleBuffer,
+    chunk: SamplesT,
+    window_size: int,
+    num_samples: int
+) -> tuple[float, list[int], list[float], list[float]]:
+    read_size = chunk.size
+    mem_usage, put_times, get_times = [], [], []
+    written = 0
+    start_time = time.perf_counter()
+    while written < num_samples:
+        # Keep the buffer as full as possible, as if the consumer was
+        # falling behind
+        while len(buffer) + read_size < buffer.maxsize:
+            t = time.perf_counter()
+            await buffer.put_nowait(chunk)
+            put_times.append(time.perf_counter() - t)
+            written += read_size
+        t = time.perf_counter()
+        await buffer.get(window_size)
+        get_times.append(time.perf_counter() - t)
+        mem_usage.append(tracemalloc.get_traced_memory()[0])
+    return time.perf_counter() - start_time, mem_usage, put_times, get_times
+
+
+def bench_buffer(
+    sample_config: SampleConfig,
+    window_size: int,
+    duration: float = 60
+) -> dict[str, Any]:
+    """Write :attr:`~.common.SampleConfig.read_size` chunks and read
+    *window_size* chunks through a :class:`~.sample_reader.SampleBuffer`
+    for *duration* seconds worth of samples (kept close to full)
+
+    The traced memory after each read is recorded to show it stays constant.
+    """
+    num_samples = int(sample_config.sample_rate * duration)
+    chunk = np.zeros(sample_config.read_size, dtype=sample_config.dtype)
+    tracemalloc.start()
+    try:
+        buffer = SampleBuffer(maxsize=window_size * 3, dtype=sample_config.dtype)
+        elapsed, mem_usage, put_times, get_times = asyncio.run(_bench_buffer(
+            buffer, chunk, window_size, num_samples,
+        ))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    throughput = num_samples / elapsed
+    return {
+        'samples_per_sec': throughput,
+        'realtime_factor': throughput / sample_config.sample_rate,
+        'put_latency': latency_stats(put_times),
+        'get_latency': latency_stats(get_times),
+        'mem_min': min(mem_usage),
+        'mem_max': max(mem_usage),
+        'mem_peak': peak,
+    }
+
+
+def bench_ingest(sample_config: SampleConfig, repeat: int = 20) -> dict[str, Any]:
+    """Time writing one :attr:`~.common.SampleConfig.read_size` chunk of raw
+    bytes from the sdr into a :class:`~.sample_reader.SampleBuffer`, either
+    converted by :mod:`~.rawiq` directly into the buffer or first converted
+    to a new complex128 array (as :meth:`rtlsdr.RtlSdr.read_samples` does)
+
+    Returns:
+        The best time (in seconds) for each method along with the bytes
+        allocated per chunk
+    """
+    rng = np.random.default_rng(0)
+    raw = rng.integers(0, 256, sample_config.read_size * 2, dtype=RAW_IQ_DTYPE)
+    # The oldest samples are dropped to make room, so nothing needs to read
+    buffer = SampleBuffer(
+        maxsize=sample_config.read_size * 4, dtype=sample_config.dtype,
+        overrun_policy='drop-oldest',
+    )
+
+    def convert_rtlsdr():
+        iq = raw.astype(np.float64).view(np.complex128)
+        iq /= 127.5
+        iq -= 1 + 1j
+        buffer.put_threadsafe(iq.astype(sample_config.dtype, copy=False))
+
+    def convert_raw():
+        buffer.put_threadsafe(raw)
+
+    result: dict[str, Any] = {}
+    for key, func in [('rtlsdr', convert_rtlsdr), ('raw', convert_raw)]:
+        t = time_call(func, repeat=repeat)
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        result[key] = {'time': t, 'allocated': peak}
+    result['speedup'] = result['rtlsdr']['time'] / result['raw']['time']
+    return result
+
+
+async def _bench_pipeline(
+    process_config: ProcessConfig,
+    chunks: list[SamplesT]
+) -> tuple[float, list[float]]:
+    processor = SampleProcessor(process_config)
+    processor.verbose = False
+    window_size = processor.num_samples_to_process
+    buffer = SampleBuffer(maxsize=window_size * 3, dtype=process_config.dtype)
+    num_samples = sum(chunk.size for chunk in chunks)
+    num_windows = num_samples // window_size
+
+    async def produce():
+        # Stand in for the reader, writing chunks as fast as the consumer allows
+        for chunk in chunks:
+            await buffer.put(chunk)
+
+    times = []
+    start_time = time.perf_counter()
+    producer = asyncio.create_task(produce())
+    for _ in range(num_windows):
+        t = time.perf_counter()
+        samples = await buffer.get(window_size)
+        await asyncio.to_thread(processor.process, samples)
+        times.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start_time
+    producer.cancel()
+    return elapsed, times
+
+
+def bench_pipeline(process_config: ProcessConfig, duration: float = 30) -> dict[str, Any]:
+    """Measure the reader -> :class:`~.sample_reader.SampleBuffer` ->
+    :class:`~.sample_processor.SampleProcessor` path (as used by ``run_main``)
+    with synthesized chunks standing in for the sdr
+    """
+    sample_config = process_config.sample_config
+    tx = Transmitter(
+        carrier_offset=process_config.carrier_freq - sample_config.center_freq,
+    )
+    chunks = list(iter_synthesize(
+        [tx], duration, sample_config.sample_rate, sample_config.read_size,
+        dtype=process_config.dtype,
+    ))
+    elapsed, times = asyncio.run(_bench_pipeline(process_config, chunks))
+    num_samples = len(times) * process_config.num_samples_to_process
+    return {
+        'samples_per_sec': num_samples / elapsed,
+        'realtime_factor': num_samples / elapsed / sample_config.sample_rate,
+        'latency': latency_stats(times),
+    }
+
+
+def _coroutine_handoff(
+    buffer: SampleBuffer,
+    loop: asyncio.AbstractEventLoop
+) -> tuple[Callable[[SamplesT], None], Callable[[], Any]]:
+    # The previous reader callback: a coroutine and future for every chunk,
+    # with a polling task to clean up the futures
+    futures = set()
+    wrapped = set()
+
+    async def add_to_queue(samples: SamplesT):
+        try:
+            await buffer.put_nowait(samples)
+        except asyncio.QueueFull:
+            pass
+
+    def callback(samples: SamplesT):
+        futures.add(asyncio.run_coroutine_threadsafe(add_to_queue(samples), loop))
+
+    async def cleanup_loop():
+        while True:
+            for fut in futures.copy():
+                wrapped.add(asyncio.wrap_future(fut))
+                futures.discard(fut)
+            if len(wrapped):
+                done, _ = await asyncio.wait(
+                    wrapped, timeout=.01, return_when=asyncio.FIRST_COMPLETED,
+                )
+                wrapped.difference_update(done)
+            if not len(wrapped) and not len(futures):
+                await asyncio.sleep(.1)
+
+    return callback, cleanup_loop
+
+
+async def _bench_handoff(
+    method: str,
+    chunk: SamplesT,
+    num_chunks: int,
+    interval: float
+) -> tuple[float, list[float]]:
+    loop = asyncio.get_running_loop()
+    buffer = SampleBuffer(maxsize=chunk.size * 64, dtype=chunk.dtype)
+    cleanup_task = None
+    if method == 'coroutine':
+        callback, cleanup_loop = _coroutine_handoff(buffer, loop)
+        cleanup_task = asyncio.create_task(cleanup_loop())
+    else:
+        callback = buffer.put_threadsafe
+    send_times = np.zeros(num_chunks)
+
+    def produce():
+        # Stand in for the thread running `read_samples_async()`
+        for i in range(num_chunks):
+            send_times[i] = time.perf_counter()
+            callback(chunk)
+            time.sleep(interval)
+
+    latencies = []
+    thread = threading.Thread(target=produce)
+    start_time, start_cpu = time.perf_counter(), time.thread_time()
+    thread.start()
+    for i in range(num_chunks):
+        await buffer.get(chunk.size)
+        latencies.append(time.perf_counter() - send_times[i])
+    cpu_load = (time.thread_time() - start_cpu) / (time.perf_counter() - start_time)
+    thread.join()
+    if cleanup_task is not None:
+        cleanup_task.cancel()
+    return cpu_load, latencies
+
+
+def bench_handoff(
+    sample_config: SampleConfig,
+    num_chunks: int = 500,
+    interval: float = .002
+) -> dict[str, Any]:
+    """Compare handing chunks from the sdr callback thread to the event loop
+    with a coroutine per chunk (the previous method) and with
+    :meth:`.SampleBuffer.put_threadsafe`
+
+    Chunks are sent every *interval* seconds. The event loop's CPU usage
+    (as a fraction of wall time) and the latency from the callback until the
+    chunk is returned by :meth:`.SampleBuffer.get` are measured.
+    """
+    chunk = np.zeros(sample_config.read_size, dtype=sample_config.dtype)
+    results = {}
+    for method in ['coroutine', 'threadsafe']:
+        cpu_load, latencies = asyncio.run(
+            _bench_handoff(method, chunk, num_chunks, interval)
+        )
+        results[method] = {
+            'loop_cpu': cpu_load,
+            'latency': latency_stats(latencies),
+        }
+    return results
+
+
+def bench_headroom(
+    process_config: ProcessConfig,
+    duration: float = 10,
+    rates: Sequence[float] = (1, 2, 5, 10, 20, 50)
+) -> dict[str, Any]:
+    """Run the live pipeline (``run_main``) with a :class:`~.simulated.SimulatedSdr`
+    replaying *duration* seconds of a synthesized recording at each of the
+    given multiples of real time, stopping at the first rate that overruns
+    the buffer
+
+    Returns:
+        The results for each rate and the fastest rate without any overruns
+        (as ``'max_rate'``)
+    """
+    sample_config = process_config.sample_config
+    fs = sample_config.sample_rate
+    tx = Transmitter(
+        carrier_offset=process_config.carrier_freq - sample_config.center_freq,
+    )
+    result: dict[str, Any] = {'rates': {}, 'max_rate': None}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'headroom.kcap')
+        header = CaptureHeader(
+            sample_rate=fs, center_freq=sample_config.center_freq,
+            dtype=process_config.dtype,
+        )
+        with CaptureWriter(filename, header) as writer:
+            for chunk in iter_synthesize(
+                [tx], duration, fs, sample_config.read_size, dtype=process_config.dtype,
+            ):
+                writer.write(chunk)
+
+        for rate in rates:
+            sim_config = dataclasses.replace(
+                sample_config, simulation=Simulation(filename=filename, rate=rate),
+            )
+            stats = PipelineStats(fs)
+            # Silence the events and device info printed by `run_main`
+            with contextlib.redirect_stdout(io.StringIO()):
+                asyncio.run(run_main(
+                    sim_config, dataclasses.replace(process_config, sample_config=sim_config),
+                    stats=stats,
+                ))
+            result['rates'][str(rate)] = {
+                'overruns': stats.overruns,
+                'dropped_fraction': stats.dropped_samples / max(stats.samples_read, 1),
+                'busy_fraction': stats.busy_time / (duration / rate),
+                'max_buffer_depth': stats.max_buffer_depth,
+            }
+            if stats.overruns:
+                break
+            result['max_rate'] = rate
+    return result
+
+
+HEAVY_MODULES: tuple[str, ...] = ('matplotlib', 'rtlsdr', 'pyfftw')
+"""Optional dependencies which should only be imported when they're used
+(checked by :func:`bench_import`)
+"""
+
+_IMPORT_SCRIPT = '''
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'time': elapsed,
+    'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    'modules': sorted(sys.modules),
+}}))
+'''
+
+
+def bench_import(module: str = 'kiwitracker', repeat: int = 5) -> dict[str, Any]:
+    """Import *module* in a new interpreter the given number of times
+
+    Returns:
+        The best import time (in seconds), the peak memory of the interpreter
+        (in bytes) and any :data:`HEAVY_MODULES` that were loaded
+        (as ``'heavy_modules'``)
+    """
+    # Make sure the subprocess imports this copy of the package
+    env = dict(os.environ)
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [src_dir, env.get('PYTHONPATH')]))
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, '-c', _IMPORT_SCRIPT.format(module=module)],
+            capture_output=True, text=True, check=True, env=env,
+        )
+        runs.append(json.loads(proc.stdout))
+    modules = set(runs[0]['modules'])
+    heavy = [
+        name for name in HEAVY_MODULES
+        if any(m == name or m.startswith(f'{name}.') for m in modules)
+    ]
+    return {
+        'time': min(r['time'] for r in runs),
+        'max_rss': max(r['max_rss'] for r in runs),
+        'num_modules': len(modules),
+        'heavy_modules': heavy,
+    }
+
+
+def host_info() -> dict[str, str]:
+    """Information about the machine running the benchmarks
+    """
+    return {
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+    }
+
+
+def run_suite(
+    process_config: ProcessConfig,
+    repeat: int = 20,
+    duration: float = 30
+) -> dict[str, Any]:
+    """Run all benchmarks and return their results
+    """
+    sample_config = process_config.sample_config
+    return {
+        'host': host_info(),
+        'config': {
+            'sample_rate': sample_config.sample_rate,
+            'read_size': sample_config.read_size,
+            'num_samples_to_process': process_config.num_samples_to_process,
+            'dtype': process_config.dtype.name,
+        },
+        'results': {
+            'import': bench_import(),
+            'detection': bench_detection(process_config, repeat=repeat),
+            'fft': bench_fft(process_config, repeat=repeat),
+            'channelizer': bench_channelizer(process_config, repeat=repeat),
+            'process': bench_process(process_config, duration=duration),
+            'escalation': bench_escalation(process_config, duration=duration),
+            'gate': bench_gate(process_config, duration=duration),
+            'buffer': bench_buffer(
+                sample_config, process_config.num_samples_to_process, duration=duration,
+            ),
+            'ingest': bench_ingest(sample_config, repeat=repeat),
+            'pipeline': bench_pipeline(process_config, duration=duration),
+            'handoff': bench_handoff(sample_config),
+            'headroom': bench_headroom(process_config),
+        },
+    }
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        '-s', '--sample-rate', dest='sample_rate', type=float,
+        default=SampleConfig.sample_rate,
+        help='Sample rate (default: %(default)s)',
+    )
+    p.add_argument(
+        '-c', '--chunk-size', dest='chunk_size', type=int,
+        default=SampleConfig.read_size,
+        help='Chunk size read from the sdr (default: %(default)s)',
+    )
+    p.add_argument(
+        '-n', '--num-samples', dest='num_samples', type=int,
+        default=ProcessConfig.num_samples_to_process,
+        help='Number of samples per chunk (default: %(default)s)',
+    )
+    p.add_argument(
+        '--dtype', dest='dtype', choices=['complex64', 'complex128'],
+        default='complex128',
+        help='Data type for samples (default: %(default)s)',
+    )
+    p.add_argument(
+        '-r', '--repeat', dest='repeat', type=int, default=20,
+        help='Number of iterations for each benchmark (default: %(default)s)',
+    )
+    p.add_argument(
+        '-d', '--duration', dest='duration', type=float, default=30,
+        help='Seconds of samples for the throughput benchmarks (default: %(default)s)',
+    )
+    p.add_argument(
+        '-o', '--output', dest='output',
+        help='Write the results to the given filename as JSON',
+    )
+    args = p.parse_args()
+
+    sample_config = SampleConfig(
+        sample_rate=args.sample_rate, read_size=args.chunk_size,
+        dtype=np.dtype(args.dtype),
+    )
+    # Use a carrier within the sampled span
+    carrier = channel_freq(sample_config.channels_in_span()[0])
+    process_config = ProcessConfig(
+        sample_config=sample_config, carrier_freq=carrier,
+        num_samples_to_process=args.num_samples,
+    )
+
+    suite = run_suite(process_config, repeat=args.repeat, duration=args.duration)
+    results = suite['results']
+
+    result = results['import']
+    print(
+        f'import kiwitracker  : {result["time"]*1000: 8.1f} ms, '
+        f'{result["max_rss"]/2**20:.1f} MB rss, {result["num_modules"]} modules'
+    )
+    if result['heavy_modules']:
+        print(f'  (WARNING: imported {", ".join(result["heavy_modules"])})')
+
+    result = results['detection']
+    print(f'detection (loop)    : {result["loop"]*1000: 8.3f} ms')
+    print(f'detection (batched) : {result["batched"]*1000: 8.3f} ms')
+    print(f'speedup             : {result["speedup"]: 8.2f}x')
+
+    for key, result in results['fft'].items():
+        times = ', '.join(f'{name} {t*1000:.3f} ms' for name, t in result['times'].items())
+        print(f'fft ({key:<11})   : {times} (fastest: {result["fastest"]})')
+
+    result = results['channelizer']
+    print(f'single carrier      : {result["single"]*1000: 8.3f} ms')
+    print(f'channelizer         : {result["channelizer"]*1000: 8.3f} ms ({result["num_channels"]} channels)')
+
+    for key in ['process', 'buffer', 'pipeline']:
+        result = results[key]
+        print(f'{key:<20}: {result["samples_per_sec"]/1e6: 8.2f} MS/s ({result["realtime_factor"]:.1f}x realtime)')
+
+    result = results['buffer']
+    print(f'buffer memory       : {result["mem_min"]/2**20: 8.2f} - {result["mem_max"]/2**20:.2f} MB (peak {result["mem_peak"]/2**20:.2f} MB)')
+
+    result = results['ingest']
+    for key in ['rtlsdr', 'raw']:
+        r = result[key]
+        print(f'ingest ({key:<6})     : {r["time"]*1e6: 8.1f} us/chunk, {r["allocated"]/2**10:.0f} KB allocated')
+    print(f'speedup             : {result["speedup"]: 8.2f}x')
+
+    for key, result in results['escalation'].items():
+        print(f'escalated ({key:<8}) : {result["escalated_fraction"]*100: 8.1f}% of chunks ({result["num_events"]} beeps)')
+
+    for key, result in results['gate'].items():
+        counters = result['counters']
+        print(
+            f'{key:<20}: {result["samples_per_sec"]/1e6: 8.2f} MS/s ({result["num_events"]} beeps, '
+            f'{counters.get("gate_rejected", 0)} gate / {counters.get("detect_rejected", 0)} fft rejected)'
+        )
+
+    for key, result in results['handoff'].items():
+        print(f'handoff ({key:<10}): {result["latency"]["mean"]*1e6: 8.1f} us mean latency, {result["loop_cpu"]*100:.1f}% loop cpu')
+
+    result = results['headroom']
+    for rate, r in result['rates'].items():
+        print(
+            f'headroom ({rate:>4}x)    : {r["busy_fraction"]*100: 8.1f}% busy, '
+            f'{r["overruns"]} overruns ({r["dropped_fraction"]*100:.1f}% dropped)'
+        )
+    print(f'max rate            : {result["max_rate"]}x realtime without overruns')
+
+    if args.output is not None:
+        with open(args.output, 'w') as fd:
+            json.dump(suite, fd, indent=2)
+
+    # Fail if startup has regressed (so this can be used in CI)
+    if results['import']['heavy_modules']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
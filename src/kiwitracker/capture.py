@@ -0,0 +1,336 @@
+from __future__ import annotations
+from typing import Any, Iterator, Self
+from dataclasses import dataclass, field
+import dataclasses
+from pathlib import Path
+import json
+import struct
+
+import numpy as np
+import numpy.typing as npt
+
+from kiwitracker.common import SamplesT, ProcessConfig
+from kiwitracker.rawiq import (
+    RAW_IQ_DTYPE, RawIQT, is_raw_iq, num_samples, convert_raw_iq, to_raw_iq,
+)
+
+
+CAPTURE_MAGIC = b'KIWICAP\x00'
+"""Magic bytes at the start of a capture file"""
+
+CAPTURE_VERSION = 1
+
+_HEADER_STRUCT = struct.Struct('<8sH16sddq')
+
+HEADER_SIZE = 64
+"""Size (in bytes) of the capture file header. Sample data begins at this
+offset
+"""
+
+INDEX_SUFFIX = '.idx'
+"""Suffix of the segment index stored alongside a segmented capture file
+(see :class:`CaptureSegment`)
+"""
+
+
+def index_filename(filename: str|Path) -> Path:
+    """Get the segment index filename for the given capture filename"""
+    return Path(filename).with_suffix(INDEX_SUFFIX)
+
+
+@dataclass
+class CaptureHeader:
+    """Metadata stored at the start of a capture file
+    """
+
+    sample_rate: float
+    """Sample rate of the capture"""
+
+    center_freq: float
+    """Center frequency of the capture"""
+
+    dtype: np.dtype
+    """Data type of the stored samples (:data:`~.rawiq.RAW_IQ_DTYPE` for raw
+    interleaved 8-bit I/Q as read from the sdr)
+    """
+
+    start_index: int = 0
+    """Index of the first sample in the file relative to the start of the
+    stream it was taken from
+    """
+
+    def pack(self) -> bytes:
+        data = _HEADER_STRUCT.pack(
+            CAPTURE_MAGIC, CAPTURE_VERSION, self.dtype.str.encode(),
+            self.sample_rate, self.center_freq, self.start_index,
+        )
+        return data.ljust(HEADER_SIZE, b'\x00')
+
+    @classmethod
+    def unpack(cls, data: bytes) -> Self:
+        magic, version, dtype, sample_rate, center_freq, start_index = _HEADER_STRUCT.unpack(
+            data[:_HEADER_STRUCT.size]
+        )
+        if magic != CAPTURE_MAGIC:
+            raise ValueError('Not a capture file')
+        if version > CAPTURE_VERSION:
+            raise ValueError(f'Unsupported capture version: {version}')
+        return cls(
+            sample_rate=sample_rate,
+            center_freq=center_freq,
+            dtype=np.dtype(dtype.rstrip(b'\x00').decode()),
+            start_index=start_index,
+        )
+
+    @classmethod
+    def from_file(cls, filename: str|Path) -> Self|None:
+        """Read the header from the given file, returning ``None`` if it is
+        not a capture file
+        """
+        with open(filename, 'rb') as fd:
+            data = fd.read(HEADER_SIZE)
+        if not data.startswith(CAPTURE_MAGIC):
+            return None
+        return cls.unpack(data)
+
+
+@dataclass
+class CaptureSegment:
+    """A run of consecutive samples in a segmented capture file
+
+    A segmented capture holds only parts of a stream (such as those written
+    by :class:`~.recorder.TriggeredRecorder`), stored back to back. Their
+    positions within the stream are kept in an index file next to it (see
+    :func:`index_filename`) with one JSON object per line.
+    """
+
+    offset: int
+    """Index of the segment's first sample within the file"""
+
+    position: int
+    """Index of the segment's first sample from the start of the stream"""
+
+    count: int
+    """Number of samples in the segment"""
+
+    time: float|None = None
+    """Wall-clock (unix) time of the segment's first sample (if known)"""
+
+    kind: str = 'beep'
+    """Why the segment was recorded (``'beep'`` or ``'noise'``)"""
+
+    channels: list[int|None] = field(default_factory=list)
+    """Channels of the beeps within the segment"""
+
+    @property
+    def stop(self) -> int:
+        """Index (from the start of the stream) just past the last sample"""
+        return self.position + self.count
+
+    def to_json(self) -> str:
+        return json.dumps(dataclasses.asdict(self))
+
+    @classmethod
+    def from_json(cls, data: str|bytes) -> Self:
+        kw: dict[str, Any] = json.loads(data)
+        return cls(**kw)
+
+    @classmethod
+    def read_index(cls, filename: str|Path) -> list[Self]:
+        """Read the segments from an index file"""
+        with open(filename) as fd:
+            return [cls.from_json(line) for line in fd if line.strip()]
+
+
+class CaptureWriter:
+    """Append samples to a capture file as they arrive
+
+    The file consists of a :class:`CaptureHeader` followed by the raw
+    samples, so nothing needs to be held in memory and the length is never
+    needed up front.
+    """
+
+    filename: Path
+    header: CaptureHeader
+
+    num_samples: int
+    """Number of samples written"""
+
+    def __init__(self, filename: str|Path, header: CaptureHeader) -> None:
+        self.filename = Path(filename)
+        self.header = header
+        self.num_samples = 0
+        self._fd = None
+
+    def open(self):
+        assert self._fd is None
+        fd = self._fd = open(self.filename, 'wb')
+        fd.write(self.header.pack())
+
+    def close(self):
+        fd = self._fd
+        if fd is None:
+            return
+        self._fd = None
+        fd.close()
+
+    def write(self, samples: SamplesT|RawIQT):
+        """Append *samples* (complex samples or raw bytes) to the file,
+        converting them to the :attr:`~CaptureHeader.dtype` of the file
+        """
+        if self._fd is None:
+            raise RuntimeError('CaptureWriter not open')
+        count = num_samples(samples)
+        if self.header.dtype == RAW_IQ_DTYPE:
+            if not is_raw_iq(samples):
+                samples = to_raw_iq(samples)
+            samples = samples[:count*2]
+        elif is_raw_iq(samples):
+            samples = convert_raw_iq(samples, dtype=self.header.dtype)
+        else:
+            samples = samples.astype(self.header.dtype, copy=False)
+        samples.tofile(self._fd)
+        self.num_samples += count
+
+    def flush(self):
+        if self._fd is not None:
+            self._fd.flush()
+
+    def __enter__(self) -> Self:
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CaptureFile:
+    """Read samples from disk without loading the entire file into memory
+
+    The following formats are supported:
+
+    * Capture files written by :class:`CaptureWriter` (with complex samples
+      or raw bytes)
+    * Numpy ``.npy`` files (as written by :func:`numpy.save`)
+    * Raw ``.bin`` files from the ``rtl_sdr`` command line utility
+      (interleaved unsigned 8-bit I/Q)
+
+    Only capture files contain the :attr:`sample_rate` and :attr:`center_freq`
+    (they will be ``None`` for the other formats).
+
+    If a segment index exists for the file (see :class:`CaptureSegment`),
+    :attr:`segments` holds its contents and :meth:`iter_stream` gives the
+    position of each chunk within the original stream.
+    """
+
+    filename: Path
+    header: CaptureHeader|None
+
+    segments: list[CaptureSegment]|None
+    """The segments of a segmented capture (``None`` for a continuous one)"""
+
+    def __init__(self, filename: str|Path) -> None:
+        self.filename = Path(filename)
+        self.header = CaptureHeader.from_file(self.filename)
+        self._raw_iq = False
+        self._data: npt.NDArray
+        if self.header is not None:
+            self._data = np.memmap(
+                self.filename, dtype=self.header.dtype, mode='r', offset=HEADER_SIZE,
+            )
+            self._raw_iq = self.header.dtype == RAW_IQ_DTYPE
+        elif self.filename.suffix == '.npy':
+            self._data = np.load(self.filename, mmap_mode='r').reshape(-1)
+        elif self.filename.suffix == '.bin':
+            self._data = np.memmap(self.filename, dtype=np.uint8, mode='r')
+            self._raw_iq = True
+        else:
+            raise ValueError(f'Unknown file format: {self.filename}')
+        self.segments = None
+        index_file = index_filename(self.filename)
+        if index_file.exists():
+            self.segments = CaptureSegment.read_index(index_file)
+
+    @property
+    def sample_rate(self) -> float|None:
+        return None if self.header is None else self.header.sample_rate
+
+    @property
+    def center_freq(self) -> float|None:
+        return None if self.header is None else self.header.center_freq
+
+    @property
+    def start_index(self) -> int:
+        return 0 if self.header is None else self.header.start_index
+
+    @property
+    def size(self) -> int:
+        """Number of samples in the file"""
+        if self._raw_iq:
+            return self._data.size // 2
+        return self._data.size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def apply_to_config(self, process_config: ProcessConfig) -> ProcessConfig:
+        """Get a copy of *process_config* using the sample rate and center
+        frequency this file was recorded with (if known)
+        """
+        if self.header is None:
+            return process_config
+        sample_config = dataclasses.replace(
+            process_config.sample_config,
+            sample_rate=self.header.sample_rate,
+            center_freq=self.header.center_freq,
+        )
+        return dataclasses.replace(process_config, sample_config=sample_config)
+
+    def read(
+        self,
+        start: int,
+        count: int,
+        dtype: npt.DTypeLike = np.complex128
+    ) -> SamplesT:
+        """Read *count* samples beginning at *start* and convert them to *dtype*
+
+        The result is always a copy (never a view of the file).
+        """
+        stop = min(start + count, self.size)
+        if not self._raw_iq:
+            return np.array(self._data[start:stop], dtype=dtype)
+        return convert_raw_iq(self._data[start*2:stop*2], dtype=dtype)
+
+    def iter_chunks(
+        self,
+        chunk_size: int,
+        dtype: npt.DTypeLike = np.complex128
+    ) -> Iterator[SamplesT]:
+        """Iterate over the file in chunks of *chunk_size* samples (the last
+        chunk may be shorter)
+        """
+        for start in range(0, self.size, chunk_size):
+            yield self.read(start, chunk_size, dtype)
+
+    def iter_stream(
+        self,
+        chunk_size: int,
+        dtype: npt.DTypeLike = np.complex128
+    ) -> Iterator[tuple[int, SamplesT]]:
+        """Iterate over the file in chunks of at most *chunk_size* samples
+        along with the stream index of each chunk's first sample
+
+        For a segmented capture, chunks never span two segments and the
+        indices skip over the samples that were not recorded between them.
+        Otherwise this is the same as :meth:`iter_chunks` (with indices
+        starting at zero).
+        """
+        if self.segments is None:
+            for start in range(0, self.size, chunk_size):
+                yield start, self.read(start, chunk_size, dtype)
+            return
+        for segment in self.segments:
+            count = min(segment.count, self.size - segment.offset)
+            for start in range(0, count, chunk_size):
+                size = min(chunk_size, count - start)
+                yield segment.position + start, self.read(segment.offset + start, size, dtype)
@@ -0,0 +1,430 @@
+from __future__ import annotations
+from typing import Sequence
+import math
+
+import numpy as np
+import numpy.typing as npt
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+
+from kiwitracker.common import (
+    SamplesT, FloatArray, ProcessConfig, CHANNEL_SPACING, channel_freq,
+)
+from kiwitracker.sample_processor import SampleProcessor, BeepEvent
+from kiwitracker.stats import PipelineStats
+from kiwitracker.levels import LevelTracker
+from kiwitracker.mixer import Mixer, lowpass_taps
+from kiwitracker.fftbackend import get_backend
+
+
+class Channelizer:
+    """Polyphase filterbank which splits the input into :attr:`num_bins`
+    equally spaced sub-bands using a single FFT per output sample
+
+    The filterbank is oversampled by a factor of two (each bin is decimated
+    by ``num_bins // 2``) so signals near the edge of a bin are not aliased.
+    State is kept between calls to :meth:`process` so the input may be
+    streamed in chunks of any length.
+    """
+
+    sample_rate: float
+    """Input sample rate"""
+
+    num_bins: int
+    """Number of sub-bands (the FFT size)"""
+
+    taps_per_bin: int
+    """Number of prototype filter taps for each polyphase branch"""
+
+    def __init__(
+        self,
+        sample_rate: float,
+        num_bins: int,
+        taps_per_bin: int = 8,
+        dtype: npt.DTypeLike = np.complex128
+    ) -> None:
+        if num_bins % 2 != 0:
+            raise ValueError('num_bins must be even')
+        self.sample_rate = sample_rate
+        self.num_bins = num_bins
+        self.taps_per_bin = taps_per_bin
+        num_taps = num_bins * taps_per_bin
+        # Passband is 1.5x the bin width so adjacent bins overlap
+        h = lowpass_taps(num_taps, 1.5 / num_bins, np.finfo(dtype).dtype)
+        # The windows are multiplied in forward order, so reverse the
+        # prototype and split it into its polyphase branches
+        self._branches = h[::-1].reshape(taps_per_bin, num_bins)
+        self._pending: SamplesT = np.zeros(num_taps - self.decimation, dtype=dtype)
+        self._out_count = 0
+
+    def seek(self, sample_index: int):
+        """Reset the filter state and set the position of the next input
+        sample to *sample_index* (which must be a multiple of :attr:`decimation`)
+        """
+        if sample_index % self.decimation != 0:
+            raise ValueError(f'sample_index must be a multiple of {self.decimation}')
+        self._pending = np.zeros_like(self._pending)
+        self._out_count = sample_index // self.decimation
+
+    @property
+    def decimation(self) -> int:
+        """Decimation factor of each bin"""
+        return self.num_bins // 2
+
+    @property
+    def output_rate(self) -> float:
+        """Sample rate of each bin"""
+        return self.sample_rate / self.decimation
+
+    @property
+    def output_index(self) -> int:
+        """Index (from the start of the stream) of the next output sample"""
+        return self._out_count
+
+    @property
+    def bin_width(self) -> float:
+        """Spacing between bin center frequencies (in Hz)"""
+        return self.sample_rate / self.num_bins
+
+    def bin_for_freq(self, freq_offset: float) -> tuple[int, float]:
+        """Get the bin index nearest to the given offset from the center
+        frequency (in Hz)
+
+        Returns:
+            A tuple of the bin index and the remaining offset (in Hz) from
+            the center of the bin
+        """
+        n = round(freq_offset / self.bin_width)
+        return n % self.num_bins, freq_offset - n * self.bin_width
+
+    def skip(self, num_samples: int) -> int:
+        """Advance by *num_samples* without computing any output
+
+        The filter state is cleared.
+
+        Returns:
+            The number of output samples (per bin) that would have been produced
+        """
+        num_taps = self.num_bins * self.taps_per_bin
+        total = self._pending.size + num_samples
+        num_out = 0 if total < num_taps else (total - num_taps) // self.decimation + 1
+        self._pending = np.zeros(total - num_out * self.decimation, dtype=self._pending.dtype)
+        self._out_count += num_out
+        return num_out
+
+    def process(self, samples: SamplesT) -> SamplesT:
+        """Channelize the given samples
+
+        Returns:
+            An array of shape ``(num_outputs, num_bins)`` where each column is
+            the baseband signal for one bin
+        """
+        M, D = self.num_bins, self.decimation
+        num_taps = M * self.taps_per_bin
+        buf = np.concatenate((self._pending, samples))
+        if buf.size < num_taps:
+            self._pending = buf
+            return np.zeros((0, M), dtype=buf.dtype)
+        num_out = (buf.size - num_taps) // D + 1
+        windows = sliding_window_view(buf, num_taps)[::D][:num_out]
+        windows = windows.reshape(num_out, self.taps_per_bin, M)
+
+        # Sum the weighted polyphase branches, then one FFT across them
+        # gives the output for every bin
+        folded = np.einsum('mpk,pk->mk', windows, self._branches)
+        out = get_backend().fft(folded, axis=1)
+
+        # With a decimation of M/2, the odd bins alternate in sign on
+        # every other output sample
+        start = 1 - self._out_count % 2
+        out[start::2,1::2] *= -1
+
+        self._out_count += num_out
+        self._pending = buf[num_out*D:]
+        return out
+
+
+class ChannelizerProcessor:
+    """Process many channels at once using a :class:`Channelizer`
+
+    Each channel is taken from its nearest bin, mixed down by its remaining
+    offset and filtered at the decimated rate before being given to its own
+    :class:`~.sample_processor.SampleProcessor` for edge detection.
+    """
+
+    config: ProcessConfig
+    channels: list[int]
+    processors: dict[int, SampleProcessor]
+    """A :class:`~.sample_processor.SampleProcessor` for each channel"""
+
+    channel_filter_taps: int = 33
+
+    gate_factor: float = 6.0
+    """Multiple of a bin's noise floor its peak must reach for the channel
+    to be processed (if :attr:`adaptive`)
+    """
+
+    stats: PipelineStats
+    """Timers for each processing stage (``'channelize'``, ``'detect'``,
+    ``'mix'``, ``'filter'`` and ``'edge'``), shared with the :attr:`processors`
+    """
+
+    def __init__(
+        self,
+        config: ProcessConfig,
+        channels: Sequence[int]|None = None,
+        stats: PipelineStats|None = None
+    ) -> None:
+        self.config = config
+        sample_config = config.sample_config
+        if stats is None:
+            stats = PipelineStats(sample_config.sample_rate)
+        self.stats = stats
+        if channels is None:
+            channels = config.channels
+        if channels is None:
+            channels = sample_config.channels_in_span()
+        self.channels = list(channels)
+
+        # Use enough bins that each is no wider than the channel spacing
+        num_bins = 2 ** math.ceil(math.log2(self.sample_rate / CHANNEL_SPACING))
+        self.channelizer = Channelizer(self.sample_rate, num_bins, dtype=config.dtype)
+
+        bins, residuals = [], []
+        self.processors = {}
+        for ch in self.channels:
+            freq = channel_freq(ch)
+            b, r = self.channelizer.bin_for_freq(freq - sample_config.center_freq)
+            bins.append(b)
+            residuals.append(r)
+            ch_config = ProcessConfig(
+                sample_config=sample_config,
+                carrier_freq=freq,
+                num_samples_to_process=config.num_samples_to_process,
+            )
+            self.processors[ch] = SampleProcessor(ch_config, channel=ch, stats=stats)
+        self._bins = np.array(bins, dtype=int)
+        output_rate = self.channelizer.output_rate
+        # Channels usually share a handful of residual offsets, so the
+        # mixers' phasor tables are shared through the cache as well
+        self._mixers = [Mixer(output_rate, -r, config.dtype) for r in residuals]
+
+        self._channel_fir = lowpass_taps(
+            self.channel_filter_taps, 0.3 * CHANNEL_SPACING / (output_rate / 2),
+            np.dtype(config.real_dtype),
+        )
+        self._channel_zi = np.zeros(
+            (self.channel_filter_taps - 1, len(self.channels)), dtype=config.dtype,
+        )
+        self._bin_noise = LevelTracker(SampleProcessor.level_alpha)
+        self._enabled = np.ones(len(self.channels), dtype=bool)
+
+    @property
+    def sample_rate(self): return self.config.sample_config.sample_rate
+
+    @property
+    def num_samples_to_process(self): return self.config.num_samples_to_process
+
+    @property
+    def verbose(self) -> bool:
+        """If True, print each beep as it is found (see
+        :attr:`.SampleProcessor.verbose`)
+        """
+        return all(p.verbose for p in self.processors.values())
+    @verbose.setter
+    def verbose(self, value: bool):
+        for p in self.processors.values():
+            p.verbose = value
+
+    @property
+    def adaptive(self) -> bool:
+        """If True, the thresholds follow running estimates of the noise
+        floor for each channel (see :attr:`.SampleProcessor.adaptive`)
+        """
+        return all(p.adaptive for p in self.processors.values())
+    @adaptive.setter
+    def adaptive(self, value: bool):
+        for p in self.processors.values():
+            p.adaptive = value
+
+    @property
+    def enabled_channels(self) -> list[int]:
+        """The channels beeps are searched for (all of :attr:`channels` by
+        default)
+
+        Disabled channels skip everything after channelization, so the cost
+        of processing scales with the number of enabled channels rather than
+        the span (see :class:`.scan.ScanScheduler`). Channels not in
+        :attr:`channels` are ignored.
+        """
+        return [ch for ch, en in zip(self.channels, self._enabled) if en]
+    @enabled_channels.setter
+    def enabled_channels(self, value: Sequence[int]):
+        value = set(value)
+        self._enabled = np.array([ch in value for ch in self.channels], dtype=bool)
+
+    def gate_thresholds(self) -> FloatArray:
+        """Get the bin magnitude each channel must reach to be processed
+        """
+        noise = self._bin_noise.level
+        if not self.adaptive or noise is None:
+            return np.array([self.processors[ch].threshold for ch in self.channels])
+        return self.gate_factor * noise
+
+    @property
+    def beep_pending(self) -> bool:
+        """True if any channel is waiting on the falling edge of a beep"""
+        return any(p.beep_pending for p in self.processors.values())
+
+    @property
+    def output_rate(self) -> float:
+        """Sample rate of each channel after channelization"""
+        return self.channelizer.output_rate
+
+    def _mix_and_filter(self, bin_samples: SamplesT, index: npt.NDArray[np.intp]) -> SamplesT:
+        # Mix the given channel columns down by their residual offsets
+        # (advancing their mixers), then apply the channel filter
+        with self.stats.stage('mix'):
+            out = np.empty_like(bin_samples)
+            for col, i in enumerate(index):
+                out[:,col] = self._mixers[i].process(bin_samples[:,col])
+        with self.stats.stage('filter'):
+            out, self._channel_zi[:,index] = signal.lfilter(
+                self._channel_fir, self._channel_fir.dtype.type(1), out,
+                axis=0, zi=self._channel_zi[:,index],
+            )
+        return out
+
+    def _skip_mixers(self, num_samples: int, index: Sequence[int]|npt.NDArray[np.intp]):
+        for i in index:
+            self._mixers[i].skip(num_samples)
+
+    def channelize(self, samples: SamplesT) -> SamplesT:
+        """Split the samples into each of the :attr:`channels`, mixed down to
+        baseband and filtered
+
+        Returns:
+            An array of shape ``(num_outputs, len(channels))``
+        """
+        bin_samples = self.channelizer.process(samples)[:,self._bins]
+        return self._mix_and_filter(bin_samples, np.arange(len(self.channels)))
+
+    def seek(self, sample_index: int):
+        """Set the position of the next chunk to *sample_index* (in
+        samples at the input rate) and reset the processing state
+        """
+        self.channelizer.seek(sample_index)
+        out_index = sample_index // self.channelizer.decimation
+        for mixer in self._mixers:
+            mixer.seek(out_index)
+        self._channel_zi[...] = 0
+        for processor in self.processors.values():
+            processor.skip_decimated(0)
+            processor.stateful_index = out_index
+            processor.stateful_rising_edge = None
+
+    def skip(self, num_samples: int):
+        """Advance past *num_samples* (at the input rate) without processing
+        them, such as those dropped by an overrun
+
+        Any beeps in progress are abandoned.
+        """
+        self.skip_bins(self.channelizer.skip(num_samples))
+
+    def skip_bins(self, num_outputs: int):
+        """Advance the channels past *num_outputs* samples of channelizer
+        output without processing them (the :attr:`channelizer` itself is
+        not advanced)
+
+        Any beeps in progress are abandoned.
+        """
+        self._skip_mixers(num_outputs, range(len(self.channels)))
+        self._channel_zi[...] = 0
+        for processor in self.processors.values():
+            processor.skip_decimated(num_outputs)
+
+    def channelize_bins(self, samples: SamplesT) -> SamplesT:
+        """Run the :attr:`channelizer` over *samples* and select the bin
+        for each of the :attr:`channels`
+
+        This is the first stage of :meth:`process`, and the result may be
+        given to :meth:`process_bins` of another instance (such as one in a
+        separate process handling only some of the channels).
+
+        Returns:
+            An array of shape ``(num_outputs, len(channels))``
+        """
+        with self.stats.stage('channelize'):
+            return self.channelizer.process(samples)[:,self._bins]
+
+    def process(self, samples: SamplesT) -> list[BeepEvent]:
+        return self.process_bins(self.channelize_bins(samples))
+
+    def process_bins(self, bin_samples: SamplesT) -> list[BeepEvent]:
+        """Find the beeps within the channelizer outputs for each of the
+        :attr:`channels` (from :meth:`channelize_bins`, with a column per
+        channel in the same order)
+        """
+        num_samples = bin_samples.shape[0]
+
+        # Only channels with any samples above the edge threshold can
+        # contain a beep, the rest can skip straight to the next chunk.
+        # The bins are wider than the channel filter, so this is checked
+        # before filtering (and mixing) to avoid doing either for most of them.
+        with self.stats.stage('detect'):
+            # Channels waiting on the falling edge of a beep are always processed
+            pending = np.array([self.processors[ch].beep_pending for ch in self.channels])
+            if self._bin_noise.level is None or self._enabled.all():
+                candidates = None
+                mags = np.abs(bin_samples)
+            else:
+                # Disabled channels are left out entirely (their noise
+                # floors are picked up again once they are enabled)
+                candidates = np.flatnonzero(self._enabled | pending)
+                mags = np.abs(bin_samples[:,candidates])
+            peaks = np.zeros(len(self.channels))
+            if candidates is None:
+                peaks[:] = np.max(mags, axis=0, initial=0)
+            else:
+                peaks[candidates] = np.max(mags, axis=0, initial=0)
+            if num_samples and mags.shape[1]:
+                self._bin_noise.update(np.median(mags, axis=0), candidates)
+            thresholds = self.gate_thresholds()
+            inactive = ((peaks < thresholds) | ~self._enabled) & ~pending
+            active = np.flatnonzero(~inactive)
+        self._channel_zi[:,inactive] = 0
+
+        if len(active):
+            channel_samples = self._mix_and_filter(bin_samples[:,active], active)
+        self._skip_mixers(num_samples, np.flatnonzero(inactive))
+
+        self.stats.increment('chunks', len(self.channels))
+        self.stats.increment('detect_rejected', len(self.channels) - len(active))
+        self.stats.increment('escalated', len(active))
+
+        events: list[BeepEvent] = []
+        for i, ch in enumerate(self.channels):
+            processor = self.processors[ch]
+            if inactive[i]:
+                processor.skip_decimated(num_samples)
+                continue
+            if peaks[i] >= thresholds[i]:
+                processor.update_beep_level(float(peaks[i]))
+            j = np.searchsorted(active, i)
+            events.extend(
+                processor.process_decimated(channel_samples[:,j], self.output_rate)
+            )
+        return events
+
+
+def make_processor(
+    process_config: ProcessConfig,
+    stats: PipelineStats|None = None
+) -> SampleProcessor|ChannelizerProcessor:
+    """Create a :class:`ChannelizerProcessor` if
+    :attr:`~.common.ProcessConfig.channels` is set, otherwise a
+    :class:`~.sample_processor.SampleProcessor`
+    """
+    if process_config.channels is not None:
+        return ChannelizerProcessor(process_config, stats=stats)
+    return SampleProcessor(process_config, stats=stats)
@@ -1,10 +1,33 @@
-from dataclasses import dataclass
+from __future__ import annotations
+from typing import Iterable, TYPE_CHECKING
+from dataclasses import dataclass, field, astuple
+
+if TYPE_CHECKING:
+    from kiwitracker.sample_processor import BeepEvent
+
+CT_REPEAT_INTERVAL: float = 600
+"""Time (in seconds) between the start of each Chick Timer sequence"""
+
+CT_PAUSE: float = 3.0
+"""Pause (in seconds) before a Chick Timer sequence and between each group"""
+
+CT_DIGIT_GAP: float = 1.5
+"""Gap (in seconds) between the two digits of a group"""
+
+CT_BEEP_INTERVAL: float = 0.3
+"""Time (in seconds) between the beeps of a single digit"""
+
+CT_NUM_GROUPS: int = 8
+"""Number of two digit groups in a Chick Timer sequence"""
 
 @dataclass
 class ChickTimer():
 
     # eights sets of integers of two digits. Theese are the actual values not the transmitted values
     # so the 2 has already been subtracted.
+    #
+    # Each digit is transmitted as (digit + 1) beeps so that zero can be sent,
+    # which adds 2 beeps to each group.
 
     days_since_change_of_state : int
     days_since_hatch : int
@@ -17,3 +40,149 @@ class ChickTimer():
     activity_two_days_ago : int
     mean_activity_last_four_days : int
 
+    @classmethod
+    def from_values(cls, values: list[int]) -> 'ChickTimer':
+        """Create a ChickTimer from the eight group values (in transmitted order)
+        """
+        return cls(*values)
+
+    def to_values(self) -> list[int]:
+        """Get the eight group values (in transmitted order)
+        """
+        return list(astuple(self))
+
+    def to_beep_counts(self) -> list[tuple[int, int]]:
+        """Get the number of beeps transmitted for both digits of each group
+        """
+        return [(v // 10 + 1, v % 10 + 1) for v in self.to_values()]
+
+
+@dataclass
+class ChickTimerEvent:
+    """A Chick Timer sequence decoded by :class:`ChickTimerDecoder`
+    """
+
+    channel: int|None
+    """The channel the sequence was found on (if processing multiple channels)"""
+
+    time: float
+    """Time of the first beep of the sequence (in seconds from the start of
+    the stream)
+    """
+
+    chick_timer: ChickTimer
+
+    def __str__(self) -> str:
+        prefix = '' if self.channel is None else f" CH{self.channel:02d} |"
+        values = ' '.join(f'{v:02d}' for v in self.chick_timer.to_values())
+        return f"{prefix} CT : {values}"
+
+
+@dataclass
+class _DecoderState:
+    last_time: float|None = None
+    active: bool = False
+    start_time: float = 0
+    values: list[int] = field(default_factory=list)
+    tens: int|None = None
+    """Beep count of the first digit of the current group (once complete)"""
+    count: int = 0
+    """Beeps counted so far for the current digit"""
+
+
+class ChickTimerDecoder:
+    """Decode Chick Timer sequences from beep times
+
+    Each beep is classified only by the gap since the previous beep on the
+    same channel (a beep interval, the gap between digits or the pause
+    between groups), so the work per beep is constant. Any gap that does not
+    fit the sequence abandons it, and a sequence begins again at the next
+    :data:`CT_PAUSE`.
+    """
+
+    tolerance: float = 0.25
+    """Allowed error (in seconds) when matching a gap to
+    :data:`CT_BEEP_INTERVAL`, :data:`CT_DIGIT_GAP` or :data:`CT_PAUSE`
+    """
+
+    max_beeps: int = 10
+    """Most beeps possible for a single digit"""
+
+    def __init__(self) -> None:
+        self._states: dict[int|None, _DecoderState] = {}
+
+    def _matches(self, gap: float, expected: float) -> bool:
+        return abs(gap - expected) <= self.tolerance
+
+    def _start(self, state: _DecoderState, t: float, gap: float):
+        # Begin a new sequence if this gap is the pause before one
+        state.active = self._matches(gap, CT_PAUSE)
+        state.start_time = t
+        state.values = []
+        state.tens = None
+        state.count = 1
+
+    def add_beep(self, t: float, channel: int|None = None) -> ChickTimerEvent|None:
+        """Add the beep at time *t* (in seconds) found on *channel*
+
+        Returns:
+            A :class:`ChickTimerEvent` if this beep completed a sequence
+            (it is the first beep after the final group)
+        """
+        state = self._states.get(channel)
+        if state is None:
+            state = self._states[channel] = _DecoderState()
+        last_time, state.last_time = state.last_time, t
+        if last_time is None:
+            return None
+        gap = t - last_time
+        if not state.active:
+            self._start(state, t, gap)
+            return None
+
+        if self._matches(gap, CT_BEEP_INTERVAL):
+            state.count += 1
+            if state.count > self.max_beeps:
+                state.active = False
+            return None
+        if self._matches(gap, CT_DIGIT_GAP) and state.tens is None:
+            state.tens, state.count = state.count, 1
+            return None
+        if state.tens is None:
+            self._start(state, t, gap)
+            return None
+
+        # The gap ends the group
+        state.values.append((state.tens - 1) * 10 + state.count - 1)
+        if len(state.values) == CT_NUM_GROUPS:
+            state.active = False
+            return ChickTimerEvent(
+                channel=channel,
+                time=state.start_time,
+                chick_timer=ChickTimer.from_values(state.values),
+            )
+        if self._matches(gap, CT_PAUSE):
+            state.tens, state.count = None, 1
+        else:
+            self._start(state, t, gap)
+        return None
+
+    def process(self, events: Iterable[BeepEvent]) -> list[ChickTimerEvent]:
+        """Add beeps from :class:`~.sample_processor.BeepEvent` objects (in
+        time order for each channel)
+
+        Returns:
+            Any sequences completed
+        """
+        results = []
+        for event in events:
+            result = self.add_beep(event.time, event.channel)
+            if result is not None:
+                results.append(result)
+        return results
+
+    def reset(self, channel: int|None = None):
+        """Clear the state for *channel* (for example after a gap in the
+        samples)
+        """
+        self._states.pop(channel, None)
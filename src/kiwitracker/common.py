@@ -1,12 +1,46 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
 from dataclasses import dataclass
 import numpy as np
 import numpy.typing as npt
 
-SamplesT = npt.NDArray[np.complex128]
+if TYPE_CHECKING:
+    from kiwitracker.simulated import Simulation
+
+SamplesT = npt.NDArray[np.complexfloating]
 """Alias for sample arrays"""
 
 FloatArray = npt.NDArray[np.float64]
 
+CHANNEL_BASE_FREQ: float = 160_120_000
+"""Frequency of channel 00 (in Hz)"""
+
+CHANNEL_SPACING: float = 10_000
+"""Frequency spacing between channels (in Hz)"""
+
+NUM_CHANNELS: int = 100
+"""Number of channels (00 through 99)"""
+
+
+def channel_freq(channel: int) -> float:
+    """Get the frequency (in Hz) for the given channel number
+    """
+    if not 0 <= channel < NUM_CHANNELS:
+        raise ValueError(f'Invalid channel: {channel}')
+    return CHANNEL_BASE_FREQ + channel * CHANNEL_SPACING
+
+
+def freq_to_channel(freq: float) -> int|None:
+    """Get the channel number nearest to the given frequency (in Hz)
+
+    If the frequency is further than half of :data:`CHANNEL_SPACING` from
+    any channel, ``None`` is returned
+    """
+    channel = round((freq - CHANNEL_BASE_FREQ) / CHANNEL_SPACING)
+    if not 0 <= channel < NUM_CHANNELS:
+        return None
+    return channel
+
 @dataclass
 class SampleConfig:
     sample_rate: float = 1.024e6
@@ -24,6 +58,43 @@ class SampleConfig:
     bias_tee_enable: bool = False
     """Enable bias tee"""
 
+    dtype: npt.DTypeLike = np.complex128
+    """Data type for samples. Using :class:`numpy.complex64` halves the memory
+    used by the buffers and processing
+    """
+
+    device_index: int = 0
+    """Index of the sdr to open (if :attr:`serial_number` is not set)"""
+
+    serial_number: str|None = None
+    """Serial number of the sdr to open"""
+
+    simulation: Simulation|None = None
+    """If set, a :class:`~.simulated.SimulatedSdr` is used instead of a real
+    device
+    """
+
+    raw_iq: bool = True
+    """If True, raw 8-bit samples are read from the sdr and converted into
+    :attr:`dtype` by :mod:`~.rawiq` (instead of by :mod:`rtlsdr`, which
+    creates a new complex128 array for every chunk). Simulated devices always
+    produce complex samples
+    """
+
+    @property
+    def real_dtype(self) -> np.dtype:
+        """The real (floating point) counterpart of :attr:`dtype`"""
+        return np.finfo(self.dtype).dtype
+
+    def channels_in_span(self) -> list[int]:
+        """Get all channel numbers within the sampled bandwidth
+        """
+        lo = self.center_freq - self.sample_rate / 2
+        hi = self.center_freq + self.sample_rate / 2
+        return [
+            ch for ch in range(NUM_CHANNELS) if lo < channel_freq(ch) < hi
+        ]
+
 
 @dataclass
 class ProcessConfig:
@@ -34,3 +105,27 @@ class ProcessConfig:
 
     num_samples_to_process: int = int(2.56e5)
     """Number of samples needed to process"""
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Data type for samples (from :attr:`SampleConfig.dtype`)"""
+        return np.dtype(self.sample_config.dtype)
+
+    @property
+    def real_dtype(self) -> np.dtype:
+        """The real counterpart of :attr:`dtype` (used for filter taps and
+        magnitudes)
+        """
+        return self.sample_config.real_dtype
+
+    batch_detection: bool = True
+    """If True, compute the beep detection FFTs for all frames of a chunk at
+    once (see :meth:`.SampleProcessor.detect_beeps`). Otherwise each frame is
+    processed individually
+    """
+
+    channels: list[int]|None = None
+    """If set, process all of these channel numbers at once using a
+    :class:`~.channelizer.ChannelizerProcessor` (instead of only the
+    :attr:`carrier_freq`)
+    """
@@ -0,0 +1,134 @@
+from __future__ import annotations
+from typing import Sequence
+import math
+
+import numpy as np
+import numpy.typing as npt
+from scipy import signal
+
+from kiwitracker.common import SamplesT, FloatArray
+from kiwitracker.mixer import lowpass_taps
+
+
+class DecimatorStage:
+    """A single polyphase FIR decimation stage
+
+    Only the output samples that are kept are computed and the filter history
+    is carried between calls to :meth:`process`, so the input may be
+    streamed in chunks of any length without losing samples at the edges.
+    """
+
+    factor: int
+    """Decimation factor"""
+
+    taps: FloatArray
+    """Lowpass filter coefficients"""
+
+    def __init__(
+        self,
+        factor: int,
+        taps: FloatArray|None = None,
+        dtype: npt.DTypeLike = np.complex128
+    ) -> None:
+        self.factor = factor
+        real_dtype = np.finfo(dtype).dtype
+        if taps is None:
+            taps = self.design_taps(factor, dtype=real_dtype)
+        # Taps from the cache are shared, so they are only copied if the
+        # dtype differs
+        self.taps = taps.astype(real_dtype, copy=False)
+        # Number of input samples spanned by the filter, rounded up to the
+        # next multiple of the factor (plus one extra).
+        # See `process()` for why this is needed.
+        self._span = (math.ceil(len(taps) / factor) + 1) * factor
+        self._history: SamplesT = np.zeros(self._span - 1, dtype=dtype)
+
+    @staticmethod
+    def design_taps(
+        factor: int,
+        taps_per_phase: int = 8,
+        dtype: npt.DTypeLike = np.float64
+    ) -> FloatArray:
+        """Design a lowpass filter with its cutoff at the output Nyquist rate
+
+        The (read-only) taps come from :func:`~.mixer.lowpass_taps`, so they
+        are shared by every stage with the same factor.
+        """
+        return lowpass_taps(taps_per_phase * factor + 1, 1 / factor, np.dtype(dtype))
+
+    def _num_outputs(self, num_samples: int) -> int:
+        # Outputs are produced at index `span - 1` of the history + input
+        # and every `factor` samples after that
+        total = self._history.size + num_samples
+        if total < self._span:
+            return 0
+        return (total - self._span) // self.factor + 1
+
+    def process(self, samples: SamplesT) -> SamplesT:
+        """Filter and decimate the given samples
+        """
+        q = self.factor
+        num_out = self._num_outputs(samples.size)
+        buf = np.concatenate((self._history, samples))
+        if num_out == 0:
+            self._history = buf
+            return np.zeros(0, dtype=buf.dtype)
+
+        # `upfirdn` computes outputs at multiples of `q` from the start of its
+        # input (treating anything before it as zeros), so the first `q - 1`
+        # samples are skipped to line up with `span - 1`. The extra factor
+        # added to `span` makes sure all of the samples needed for the first
+        # output are still present.
+        first = self._span // q - 1
+        out = signal.upfirdn(self.taps, buf[q-1:], 1, q)[first:first+num_out]
+        self._history = buf[num_out*q:]
+        return out
+
+    def skip(self, num_samples: int) -> int:
+        """Advance the stage by *num_samples* without computing any output
+
+        The filter history is cleared.
+
+        Returns:
+            The number of output samples that would have been produced
+        """
+        num_out = self._num_outputs(num_samples)
+        size = self._history.size + num_samples - num_out * self.factor
+        self._history = np.zeros(size, dtype=self._history.dtype)
+        return num_out
+
+
+class Decimator:
+    """Multi-stage streaming decimator made of :class:`DecimatorStage` objects
+    """
+
+    stages: list[DecimatorStage]
+
+    def __init__(
+        self,
+        factors: Sequence[int],
+        dtype: npt.DTypeLike = np.complex128
+    ) -> None:
+        self.stages = [DecimatorStage(q, dtype=dtype) for q in factors]
+
+    @property
+    def factor(self) -> int:
+        """Total decimation factor of all stages"""
+        return math.prod(stage.factor for stage in self.stages)
+
+    def process(self, samples: SamplesT) -> SamplesT:
+        """Filter and decimate the given samples through each stage
+        """
+        for stage in self.stages:
+            samples = stage.process(samples)
+        return samples
+
+    def skip(self, num_samples: int) -> int:
+        """Advance all stages by *num_samples* without computing any output
+
+        Returns:
+            The number of output samples that would have been produced
+        """
+        for stage in self.stages:
+            num_samples = stage.skip(num_samples)
+        return num_samples
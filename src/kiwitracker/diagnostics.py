@@ -0,0 +1,255 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from dataclasses import dataclass, field
+from pathlib import Path
+import argparse
+
+import numpy as np
+
+from kiwitracker.common import SamplesT, FloatArray, SampleConfig, ProcessConfig
+from kiwitracker.capture import CaptureFile
+from kiwitracker.sample_processor import SampleProcessor, DetectionResult, BeepEvent
+from kiwitracker.fftbackend import get_backend
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+
+FIGURE_SIZE = (10, 9)
+
+
+@dataclass
+class ChunkRecord:
+    """The intermediate values collected by a :class:`Probe` for one chunk
+    """
+
+    index: int
+    """Index of the chunk within the stream"""
+
+    start: int
+    """Index of the chunk's first sample (at the input rate)"""
+
+    detection: DetectionResult|None = None
+    """Results of :meth:`.SampleProcessor.detect_beeps` (``None`` if the chunk
+    was rejected by the energy gate)
+    """
+
+    spectrum: FloatArray|None = None
+    """Normalized (fftshifted) magnitudes of the detection frame with the
+    strongest peak
+    """
+
+    smoothed: FloatArray|None = None
+    """The smoothed magnitudes used for edge detection (``None`` if the chunk
+    was not escalated past detection)
+    """
+
+    smoothed_start: int = 0
+    """Index (in decimated samples) of the first :attr:`smoothed` value"""
+
+    decimated_rate: float = 0
+    """Sample rate of :attr:`smoothed`"""
+
+    edge_threshold: float = 0
+    """The :attr:`.SampleProcessor.edge_threshold` used for the chunk"""
+
+    events: list[BeepEvent] = field(default_factory=list)
+    """Beeps found in the chunk"""
+
+
+class Probe:
+    """Collects the FFT detection and edge detection values from a
+    :class:`~.sample_processor.SampleProcessor` so they can be plotted
+
+    Set it as the processor's :attr:`~.sample_processor.SampleProcessor.probe`
+    and call :meth:`start` before each chunk is processed.
+    """
+
+    records: list[ChunkRecord]
+
+    def __init__(self) -> None:
+        self.records = []
+
+    @property
+    def current(self) -> ChunkRecord:
+        return self.records[-1]
+
+    def start(self, index: int, start: int) -> ChunkRecord:
+        """Begin a new :class:`ChunkRecord`"""
+        record = ChunkRecord(index=index, start=start)
+        self.records.append(record)
+        return record
+
+    def add_detection(
+        self,
+        processor: SampleProcessor,
+        samples: SamplesT,
+        result: DetectionResult
+    ):
+        record = self.current
+        record.detection = result
+        if not len(result.peak_mags):
+            return
+        fft_size = processor.fft_size
+        frame = int(np.argmax(result.peak_mags))
+        fft = get_backend().fft(samples[frame*fft_size:(frame+1)*fft_size])
+        record.spectrum = np.abs(np.fft.fftshift(fft)) / fft_size
+
+    def add_smoothed(
+        self,
+        processor: SampleProcessor,
+        smoothed: FloatArray,
+        sample_rate: float
+    ):
+        record = self.current
+        record.smoothed = smoothed
+        record.smoothed_start = processor.stateful_index
+        record.decimated_rate = sample_rate
+        record.edge_threshold = processor.edge_threshold
+
+
+def plot_chunk(
+    processor: SampleProcessor,
+    record: ChunkRecord,
+    fig: Figure|None = None
+) -> Figure:
+    """Plot the detection frames, the strongest frame's spectrum and the
+    smoothed magnitudes (with the edges of any beeps found) for a chunk
+
+    A new :class:`~matplotlib.figure.Figure` is created if *fig* is not given.
+    """
+    if fig is None:
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=FIGURE_SIZE, layout='constrained')
+    ax_peaks, ax_fft, ax_edges = fig.subplots(3, 1)
+    fig.suptitle(f'Chunk {record.index} ({record.start / processor.sample_rate:.3f} sec)')
+
+    detection = record.detection
+    if detection is not None:
+        frame_time = processor.fft_size / processor.sample_rate
+        t = record.start / processor.sample_rate + np.arange(len(detection.peak_mags)) * frame_time
+        ax_peaks.plot(t, detection.peak_mags, '.-', label='peak')
+        ax_peaks.axhline(detection.threshold, color='r', linestyle='--', label='threshold')
+        ax_peaks.legend()
+    ax_peaks.set_title('Detection frames')
+    ax_peaks.set_xlabel('Time (sec)')
+    ax_peaks.set_ylabel('Peak magnitude')
+
+    if record.spectrum is not None:
+        ax_fft.plot(processor.fft_freqs / 1e3, record.spectrum)
+        ax_fft.axvline(-processor.freq_offset / 1e3, color='g', linestyle=':', label='carrier')
+        if detection is not None:
+            ax_fft.axhline(detection.threshold, color='r', linestyle='--', label='threshold')
+        ax_fft.legend()
+    ax_fft.set_title('Strongest frame')
+    ax_fft.set_xlabel('Frequency offset (kHz)')
+    ax_fft.set_ylabel('Magnitude')
+
+    if record.smoothed is not None:
+        fs = record.decimated_rate
+        t = (record.smoothed_start + np.arange(record.smoothed.size)) / fs
+        ax_edges.plot(t, record.smoothed, label='smoothed')
+        ax_edges.axhline(record.edge_threshold, color='r', linestyle='--', label='threshold')
+        for event in record.events:
+            ax_edges.axvspan(event.time, event.time + event.duration, color='g', alpha=0.3)
+        ax_edges.legend()
+    ax_edges.set_title('Edge detection')
+    ax_edges.set_xlabel('Time (sec)')
+    ax_edges.set_ylabel('Magnitude')
+    return fig
+
+
+def run_diagnostics(
+    process_config: ProcessConfig,
+    filename: str,
+    outdir: str|None = None,
+    max_plots: int = 10,
+    all_chunks: bool = False
+):
+    """Process a recording with a :class:`~.sample_processor.SampleProcessor`
+    and plot the chunks containing beeps (or every chunk if *all_chunks* is
+    True) with :func:`plot_chunk`
+
+    The plots are saved as PNG files in *outdir* if given, otherwise they
+    are shown one at a time.
+
+    Raises:
+        ImportError: If matplotlib is not installed
+    """
+    # Import matplotlib first so a missing install is found before processing
+    if outdir is not None:
+        import matplotlib.figure
+        Path(outdir).mkdir(parents=True, exist_ok=True)
+    else:
+        from matplotlib import pyplot as plt
+
+    capture = CaptureFile(filename)
+    process_config = capture.apply_to_config(process_config)
+    processor = SampleProcessor(process_config)
+    probe = processor.probe = Probe()
+    chunk_size = processor.num_samples_to_process
+    chunks = capture.iter_chunks(chunk_size, process_config.dtype)
+    num_plots = 0
+    for i, chunk in enumerate(chunks):
+        record = probe.start(i, i * chunk_size)
+        record.events = processor.process(chunk)
+        # Only the latest record is needed
+        probe.records.clear()
+        if not all_chunks:
+            if record.detection is None or not np.any(record.detection.beep_mask):
+                continue
+        if outdir is not None:
+            fig = plot_chunk(processor, record)
+            path = Path(outdir) / f'chunk_{i:05d}.png'
+            fig.savefig(path)
+            print(f'wrote {path}')
+        else:
+            fig = plt.figure(figsize=FIGURE_SIZE, layout='constrained')
+            plot_chunk(processor, record, fig)
+            plt.show()
+        num_plots += 1
+        if num_plots >= max_plots:
+            break
+
+
+def main():
+    p = argparse.ArgumentParser(
+        description='Plot the beep detection and edge detection stages for a recording',
+    )
+    p.add_argument(
+        '-f', '--from-file', dest='infile', required=True,
+        help='The recording to process (a capture file, ".npy" or raw "rtl_sdr" ".bin" file)',
+    )
+    p.add_argument(
+        '-o', '--outdir', dest='outdir',
+        help='Save the plots as PNG files in the given directory (instead of showing them)',
+    )
+    p.add_argument(
+        '-n', '--max-plots', dest='max_plots', type=int, default=10,
+        help='Maximum number of chunks to plot (default: %(default)s)',
+    )
+    p.add_argument(
+        '--all', dest='all_chunks', action='store_true',
+        help='Plot every chunk (not just those where a beep was detected)',
+    )
+    p.add_argument(
+        '--carrier', dest='carrier', type=float,
+        default=ProcessConfig.carrier_freq,
+        help='Carrier frequency to process (default: %(default)s)',
+    )
+    args = p.parse_args()
+
+    process_config = ProcessConfig(
+        sample_config=SampleConfig(), carrier_freq=args.carrier,
+    )
+    try:
+        run_diagnostics(
+            process_config, args.infile, outdir=args.outdir,
+            max_plots=args.max_plots, all_chunks=args.all_chunks,
+        )
+    except ImportError as exc:
+        p.exit(1, f'{exc}\nThe diagnostics need matplotlib: pip install kiwitracker[plot]\n')
+
+
+if __name__ == '__main__':
+    main()
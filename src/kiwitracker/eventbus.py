@@ -0,0 +1,202 @@
+from __future__ import annotations
+from typing import Iterable, Self
+import asyncio
+import collections
+import enum
+
+from kiwitracker.sample_processor import BeepEvent
+
+
+class DropPolicy(enum.Enum):
+    """What :meth:`EventBus.publish` does when a :class:`Subscription` is
+    full
+
+    Publishing never waits, so there is no blocking policy.
+    """
+
+    DROP_NEWEST = 'drop-newest'
+    """Discard the incoming events"""
+
+    DROP_OLDEST = 'drop-oldest'
+    """Discard the oldest events waiting in the subscription to make room"""
+
+
+class Subscription:
+    """A bounded stream of :class:`~.sample_processor.BeepEvent` objects
+    from an :class:`EventBus`
+
+    Events are read with ``async for`` (or :meth:`get`), which ends once
+    the subscription or the bus is closed and the waiting events have been
+    read. If the subscriber falls behind by :attr:`maxsize` events, events
+    are dropped according to :attr:`policy` and counted in :attr:`dropped`.
+    """
+
+    name: str
+
+    maxsize: int
+    """Maximum number of events waiting to be read"""
+
+    policy: DropPolicy
+
+    dropped: int
+    """Number of events dropped because the subscription was full"""
+
+    closed: bool
+    """True once no more events will be added"""
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = 1000,
+        policy: DropPolicy|str = DropPolicy.DROP_OLDEST
+    ) -> None:
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = DropPolicy(policy)
+        self.dropped = 0
+        self.closed = False
+        self._bus: EventBus|None = None
+        self._events: collections.deque[BeepEvent] = collections.deque()
+        self._available = asyncio.Event()
+
+    def _put(self, events: list[BeepEvent]):
+        if self.closed:
+            return
+        room = self.maxsize - len(self._events)
+        if len(events) > room:
+            if self.policy == DropPolicy.DROP_NEWEST:
+                self.dropped += len(events) - room
+                events = events[:room]
+            else:
+                # Anything beyond maxsize drops out of the front
+                excess = len(events) - room
+                self.dropped += excess
+                if excess > len(self._events):
+                    events = events[excess-len(self._events):]
+                    excess = len(self._events)
+                for _ in range(excess):
+                    self._events.popleft()
+        if events:
+            self._events.extend(events)
+            self._available.set()
+
+    def qsize(self) -> int:
+        return len(self._events)
+
+    def get_nowait(self) -> BeepEvent:
+        """Get the next event without waiting
+
+        Raises:
+            asyncio.QueueEmpty: If no events are waiting
+        """
+        if not self._events:
+            raise asyncio.QueueEmpty()
+        event = self._events.popleft()
+        if not self._events and not self.closed:
+            self._available.clear()
+        return event
+
+    async def get(self) -> BeepEvent|None:
+        """Wait for the next event
+
+        Returns ``None`` once the subscription is closed and empty.
+        """
+        while not self._events:
+            if self.closed:
+                return None
+            await self._available.wait()
+        return self.get_nowait()
+
+    def close(self):
+        """Stop receiving events (any waiting events can still be read)"""
+        if self._bus is not None:
+            self._bus.unsubscribe(self)
+        self._finish()
+
+    def _finish(self):
+        self.closed = True
+        self._available.set()
+
+    def __aiter__(self) -> Self:
+        return self
+
+    async def __anext__(self) -> BeepEvent:
+        event = await self.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+
+class EventBus:
+    """Publish the beeps found by a processor to any number of subscribers
+    within the event loop
+
+    Each subscriber gets its own bounded :class:`Subscription`, so one that
+    is slow (or has stopped reading) only loses its own events and never
+    holds up the processing or the other subscribers.
+
+    :meth:`publish` must be called from the event loop the subscribers
+    run in.
+    """
+
+    subscriptions: list[Subscription]
+
+    closed: bool
+
+    def __init__(self) -> None:
+        self.subscriptions = []
+        self.closed = False
+
+    def subscribe(
+        self,
+        name: str|None = None,
+        maxsize: int = 1000,
+        policy: DropPolicy|str = DropPolicy.DROP_OLDEST
+    ) -> Subscription:
+        """Create a :class:`Subscription` for events published from now on
+
+        Arguments:
+            name: Name to identify the subscriber by (defaults to its number)
+            maxsize: Maximum number of events waiting to be read
+            policy: What to do with events once *maxsize* are waiting
+        """
+        if name is None:
+            name = f'subscriber{len(self.subscriptions)}'
+        sub = Subscription(name, maxsize=maxsize, policy=policy)
+        if self.closed:
+            sub.close()
+            return sub
+        sub._bus = self
+        self.subscriptions.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        if sub in self.subscriptions:
+            self.subscriptions.remove(sub)
+        sub._bus = None
+
+    def publish(self, events: Iterable[BeepEvent]):
+        """Add *events* to every subscription (without waiting)"""
+        events = list(events)
+        if not events:
+            return
+        for sub in self.subscriptions:
+            sub._put(events)
+
+    @property
+    def dropped(self) -> dict[str, int]:
+        """Number of events dropped by each subscription"""
+        return {sub.name: sub.dropped for sub in self.subscriptions}
+
+    def close(self):
+        """Close every subscription, ending their iterators once the waiting
+        events have been read
+
+        The subscriptions are kept in :attr:`subscriptions` (so their
+        :attr:`dropped` counts can still be checked).
+        """
+        self.closed = True
+        for sub in self.subscriptions:
+            sub._finish()
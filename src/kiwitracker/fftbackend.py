@@ -0,0 +1,218 @@
+from __future__ import annotations
+from typing import ClassVar, TYPE_CHECKING
+import abc
+import collections
+import importlib.util
+import os
+import threading
+import time
+
+import numpy as np
+import numpy.typing as npt
+import scipy.fft
+
+from kiwitracker.common import SamplesT
+
+if TYPE_CHECKING:
+    import pyfftw
+
+
+class FFTBackend(abc.ABC):
+    """Computes the forward FFTs used for detection, scanning and
+    channelization
+
+    Use :func:`get_backend` to get the current backend and :func:`set_backend`
+    to change it.
+    """
+
+    name: ClassVar[str]
+
+    workers: int
+    """Number of threads used for each transform"""
+
+    def __init__(self, workers: int|None = None) -> None:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+
+    @classmethod
+    def available(cls) -> bool:
+        """True if the libraries needed for the backend are installed"""
+        return True
+
+    @abc.abstractmethod
+    def fft(self, x: SamplesT, axis: int = -1) -> SamplesT:
+        """Compute the FFT of *x* along *axis*
+
+        The result has the same precision as *x*.
+        """
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}: workers={self.workers}>'
+
+
+class NumpyBackend(FFTBackend):
+    """:func:`numpy.fft.fft` (single threaded)
+    """
+
+    name = 'numpy'
+
+    def __init__(self, workers: int|None = None) -> None:
+        super().__init__(1)
+
+    def fft(self, x: SamplesT, axis: int = -1) -> SamplesT:
+        return np.fft.fft(x, axis=axis)
+
+
+class ScipyBackend(FFTBackend):
+    """:func:`scipy.fft.fft`, which splits batched transforms across
+    :attr:`~FFTBackend.workers` threads and caches its twiddle factors for
+    each size
+    """
+
+    name = 'scipy'
+
+    def fft(self, x: SamplesT, axis: int = -1) -> SamplesT:
+        return scipy.fft.fft(x, axis=axis, workers=self.workers)
+
+
+class FFTWBackend(FFTBackend):
+    """pyFFTW (if installed) with a plan cached for each input shape, dtype
+    and axis
+
+    :mod:`pyfftw` is only imported once the backend is created.
+
+    A plan holds its own input and output arrays, so one can't be executed
+    by two threads at once (such as the processor and the scanner in
+    :func:`~.sample_reader.run_main`). Each thread has its own cache, which
+    keeps at most :attr:`max_plans` plans (the least recently used is
+    dropped first).
+    """
+
+    name = 'fftw'
+
+    max_plans: int = 16
+
+    _plan_lock: ClassVar[threading.Lock] = threading.Lock()
+    """Held while creating a plan (the FFTW planner isn't thread-safe)"""
+
+    def __init__(self, workers: int|None = None) -> None:
+        super().__init__(workers)
+        import pyfftw.builders
+        self._pyfftw = pyfftw
+        self._local = threading.local()
+
+    @property
+    def _plans(self) -> collections.OrderedDict[tuple, pyfftw.FFTW]:
+        # The plan cache for the current thread
+        plans = getattr(self._local, 'plans', None)
+        if plans is None:
+            plans = self._local.plans = collections.OrderedDict()
+        return plans
+
+    @classmethod
+    def available(cls) -> bool:
+        return importlib.util.find_spec('pyfftw') is not None
+
+    def _get_plan(self, x: SamplesT, axis: int) -> pyfftw.FFTW:
+        key = (x.shape, x.dtype, axis)
+        plans = self._plans
+        plan = plans.get(key)
+        if plan is not None:
+            plans.move_to_end(key)
+            return plan
+        pyfftw = self._pyfftw
+        with self._plan_lock:
+            plan = pyfftw.builders.fft(
+                pyfftw.empty_aligned(x.shape, dtype=x.dtype), axis=axis,
+                threads=self.workers, planner_effort='FFTW_MEASURE',
+            )
+        plans = self._plans
+        plans[key] = plan
+        if len(plans) > self.max_plans:
+            plans.popitem(last=False)
+        return plan
+
+    def fft(self, x: SamplesT, axis: int = -1) -> SamplesT:
+        plan = self._get_plan(x, axis)
+        # The plan's own output array is reused on every call, so give it
+        # a new one
+        out = self._pyfftw.empty_aligned(plan.output_shape, dtype=plan.output_dtype)
+        plan(x, out)
+        return out
+
+
+BACKENDS: dict[str, type[FFTBackend]] = {
+    cls.name: cls for cls in [NumpyBackend, ScipyBackend, FFTWBackend]
+}
+"""All backend classes by name"""
+
+_backend: FFTBackend = ScipyBackend()
+
+
+def available_backends() -> list[str]:
+    """Names of the backends that can be used on this host"""
+    return [name for name, cls in BACKENDS.items() if cls.available()]
+
+
+def get_backend() -> FFTBackend:
+    """Get the current :class:`FFTBackend`"""
+    return _backend
+
+
+def set_backend(backend: str|FFTBackend, workers: int|None = None) -> FFTBackend:
+    """Set the current :class:`FFTBackend` by name (or instance)
+
+    Raises:
+        ValueError: If the backend is unknown or not installed
+    """
+    global _backend
+    if isinstance(backend, str):
+        cls = BACKENDS.get(backend)
+        if cls is None:
+            raise ValueError(f'Unknown FFT backend: {backend!r}')
+        if not cls.available():
+            raise ValueError(f'FFT backend {backend!r} is not installed')
+        backend = cls(workers)
+    _backend = backend
+    return backend
+
+
+def time_backends(
+    shape: tuple[int, int],
+    dtype: npt.DTypeLike = np.complex128,
+    repeat: int = 10,
+    workers: int|None = None
+) -> dict[str, float]:
+    """Time each available backend on a batch of FFTs (along the last axis)
+    of the given shape
+
+    Returns:
+        The best time (in seconds) of a single call for each backend name
+    """
+    rng = np.random.default_rng(0)
+    x = (rng.standard_normal(shape) + 1j*rng.standard_normal(shape)).astype(dtype)
+    result = {}
+    for name in available_backends():
+        backend = BACKENDS[name](workers)
+        backend.fft(x) # warm up any plans or caches
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            backend.fft(x)
+            best = min(best, time.perf_counter() - start)
+        result[name] = best
+    return result
+
+
+def select_fastest(
+    shape: tuple[int, int],
+    dtype: npt.DTypeLike = np.complex128,
+    repeat: int = 10,
+    workers: int|None = None
+) -> FFTBackend:
+    """Use :func:`time_backends` to find the fastest backend on this host for
+    the given shape and make it the current one
+    """
+    times = time_backends(shape, dtype, repeat=repeat, workers=workers)
+    return set_backend(min(times, key=times.__getitem__), workers)
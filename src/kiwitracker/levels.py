@@ -0,0 +1,59 @@
+from __future__ import annotations
+import math
+
+import numpy as np
+import numpy.typing as npt
+
+from kiwitracker.common import FloatArray
+
+
+class LevelTracker:
+    """Running estimate of a signal level, updated once per chunk
+
+    The estimate is an exponential moving average, so only the current
+    :attr:`level` is stored. It may be a scalar or an array (one level per
+    channel).
+    """
+
+    alpha: float
+    """Weight given to each new value (between 0 and 1)"""
+
+    level: float|FloatArray|None
+    """The current estimate (``None`` until the first :meth:`update`)"""
+
+    def __init__(self, alpha: float = 0.05) -> None:
+        self.alpha = alpha
+        self.level = None
+
+    def update(
+        self,
+        value: float|FloatArray,
+        index: npt.NDArray[np.intp]|None = None
+    ) -> float|FloatArray:
+        """Add a new measurement and return the updated :attr:`level`
+
+        The first measurement is used as the level directly. If *index* is
+        given, *value* holds measurements for only those elements of the
+        (already set) array level.
+        """
+        level = self.level
+        if index is not None:
+            if level is None:
+                raise ValueError('level must be set before updating by index')
+            level = np.copy(level)
+            level[index] += self.alpha * (value - level[index])
+        elif level is None:
+            level = np.copy(value) if isinstance(value, np.ndarray) else value
+        else:
+            level = level + self.alpha * (value - level)
+        self.level = level
+        return level
+
+    def settling_updates(self, tolerance: float = 0.01) -> int:
+        """Number of updates after which the :attr:`level` from before them
+        has at most *tolerance* weight in the estimate
+        """
+        return math.ceil(math.log(tolerance) / math.log(1 - self.alpha))
+
+    def reset(self):
+        self.level = None
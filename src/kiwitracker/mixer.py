@@ -0,0 +1,104 @@
+from __future__ import annotations
+import functools
+
+import numpy as np
+import numpy.typing as npt
+from scipy import signal
+
+from kiwitracker.common import SamplesT, FloatArray
+
+
+PHASOR_CACHE_SIZE = 64
+"""Maximum number of tables kept by :func:`phasor_table`"""
+
+FILTER_CACHE_SIZE = 32
+"""Maximum number of filters kept by :func:`lowpass_taps`"""
+
+
+@functools.lru_cache(maxsize=PHASOR_CACHE_SIZE)
+def phasor_table(
+    sample_rate: float,
+    freq: float,
+    length: int,
+    dtype: np.dtype
+) -> SamplesT:
+    """Get a table of *length* samples of a complex sinusoid at *freq* (in Hz)
+    starting from zero phase
+
+    Tables are kept in a least-recently-used cache shared by every
+    :class:`Mixer`, so processors tuned to the same offset (or reading the
+    same chunk sizes) only build them once. The returned array is read-only.
+    """
+    n = np.arange(length)
+    table = np.exp(2j*np.pi*n*(freq/sample_rate)).astype(dtype)
+    table.flags.writeable = False
+    return table
+
+
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def lowpass_taps(num_taps: int, cutoff: float, dtype: np.dtype) -> FloatArray:
+    """Design (or get from the cache) a lowpass FIR filter using
+    :func:`scipy.signal.firwin`
+
+    Arguments:
+        num_taps: Length of the filter
+        cutoff: Cutoff frequency relative to the Nyquist rate
+        dtype: The (real) dtype of the coefficients
+
+    The returned array is shared and read-only.
+    """
+    taps = signal.firwin(num_taps, cutoff).astype(dtype)
+    taps.flags.writeable = False
+    return taps
+
+
+class Mixer:
+    """Numerically controlled oscillator which shifts a stream of samples by
+    :attr:`freq`
+
+    The phase is carried between calls to :meth:`process`, so the output is
+    continuous no matter how the input is split into chunks (and chunks of
+    any length may be given).
+    """
+
+    sample_rate: float
+
+    freq: float
+    """Frequency shift (in Hz)"""
+
+    dtype: np.dtype
+
+    phase: float
+    """Phase (in cycles) applied to the next sample"""
+
+    def __init__(
+        self,
+        sample_rate: float,
+        freq: float,
+        dtype: npt.DTypeLike = np.complex128
+    ) -> None:
+        self.sample_rate = sample_rate
+        self.freq = freq
+        self.dtype = np.dtype(dtype)
+        self.phase = 0.
+
+    def seek(self, sample_index: int):
+        """Set the phase to that of the sample at *sample_index*
+        """
+        self.phase = (self.freq / self.sample_rate * sample_index) % 1
+
+    def skip(self, num_samples: int):
+        """Advance the phase by *num_samples* without mixing anything
+        """
+        self.phase = (self.phase + self.freq / self.sample_rate * num_samples) % 1
+
+    def process(self, samples: SamplesT) -> SamplesT:
+        """Mix the given samples and advance the phase
+        """
+        num_samples = samples.size
+        table = phasor_table(self.sample_rate, self.freq, num_samples, self.dtype)
+        out = samples * table
+        if self.phase:
+            out *= self.dtype.type(np.exp(2j*np.pi*self.phase))
+        self.skip(num_samples)
+        return out
@@ -0,0 +1,258 @@
+from __future__ import annotations
+from typing import Hashable, Iterable, Sequence
+from dataclasses import dataclass
+import asyncio
+import heapq
+import itertools
+import multiprocessing
+import queue
+import time
+
+from kiwitracker.common import SampleConfig, ProcessConfig
+from kiwitracker.channelizer import ChannelizerProcessor, make_processor
+from kiwitracker.sample_processor import SampleProcessor, BeepEvent
+from kiwitracker.sample_reader import (
+    SampleReader, SampleBuffer, OverrunPolicy, report_events, process_window,
+)
+from kiwitracker.chicktimer import ChickTimerDecoder
+from kiwitracker.sink import SqliteSink
+from kiwitracker import fftbackend
+
+
+WATERMARK_DELAY: float = 0.1
+"""Time (in seconds) subtracted from the end of each processed window to
+allow for beeps found slightly after their rising edge (due to the filter
+and smoothing delays)
+"""
+
+
+@dataclass
+class DeviceConfig:
+    """Configuration for one sdr when running several at once (see
+    :func:`run_devices`)
+    """
+
+    process_config: ProcessConfig
+    """Processing settings, including the :class:`~.common.SampleConfig`
+    (which selects the device and its center frequency)
+    """
+
+    overrun_policy: OverrunPolicy = OverrunPolicy.DROP_NEWEST
+    """The :attr:`.SampleBuffer.overrun_policy` for the device"""
+
+    @property
+    def sample_config(self) -> SampleConfig:
+        return self.process_config.sample_config
+
+    @property
+    def name(self) -> str:
+        """A name for the device (from its serial number or index)"""
+        config = self.sample_config
+        if config.simulation is not None:
+            return f'sim{config.device_index}'
+        if config.serial_number is not None:
+            return config.serial_number
+        return f'#{config.device_index}'
+
+
+@dataclass
+class DeviceUpdate:
+    """Message sent from a device's worker process after each window
+    """
+
+    device: int
+    """Index of the device within the list given to :func:`run_devices`"""
+
+    events: list[BeepEvent]
+    """Beeps found in the window (with their
+    :attr:`~.sample_processor.BeepEvent.wall_time` set)
+    """
+
+    watermark: float|None
+    """Wall-clock time before which no more events will be sent, or ``None``
+    if the device has stopped
+    """
+
+    error: str|None = None
+    """Description of the exception that stopped the worker (if any)"""
+
+
+class EventMerger:
+    """Merge the events from several devices into a single stream ordered
+    by :attr:`~.sample_processor.BeepEvent.wall_time`
+
+    Events are held until every running device has reported a watermark past
+    them, so an event is never released before an earlier one from a device
+    that is running behind.
+    """
+
+    def __init__(self, devices: Iterable[Hashable]) -> None:
+        self._watermarks = {device: float('-inf') for device in devices}
+        self._heap: list[tuple[float, int, BeepEvent]] = []
+        self._counter = itertools.count()
+
+    def add(
+        self,
+        device: Hashable,
+        events: Iterable[BeepEvent],
+        watermark: float
+    ) -> list[BeepEvent]:
+        """Add the events from a device along with its new *watermark*
+
+        Returns:
+            The events that can now be released (in order)
+        """
+        for event in events:
+            assert event.wall_time is not None
+            heapq.heappush(self._heap, (event.wall_time, next(self._counter), event))
+        self._watermarks[device] = max(self._watermarks[device], watermark)
+        return self._release()
+
+    def finish(self, device: Hashable) -> list[BeepEvent]:
+        """Mark a device as stopped
+
+        Returns:
+            The events that can now be released (in order)
+        """
+        self._watermarks.pop(device, None)
+        return self._release()
+
+    def _release(self) -> list[BeepEvent]:
+        limit = min(self._watermarks.values(), default=float('inf'))
+        result = []
+        while self._heap and self._heap[0][0] <= limit:
+            result.append(heapq.heappop(self._heap)[2])
+        return result
+
+
+def stamp_events(
+    processor: SampleProcessor|ChannelizerProcessor,
+    events: list[BeepEvent],
+    stream_start: float,
+    end_position: int,
+    watermark: float
+) -> float:
+    """Set the :attr:`~.sample_processor.BeepEvent.wall_time` of the *events*
+    found by *processor* in a window and advance the *watermark* to the end
+    of it
+
+    Arguments:
+        processor: The processor the events came from
+        events: The events found in the window
+        stream_start: Wall-clock time of the first sample of the stream
+        end_position: Stream index just past the last sample of the window
+            (:attr:`.SampleBuffer.read_position`)
+        watermark: The watermark after the previous window
+
+    Returns:
+        The new watermark (for :meth:`EventMerger.add`). A beep still waiting
+        on its falling edge will be reported with an earlier time, so the
+        watermark isn't advanced while there is one.
+    """
+    for event in events:
+        event.wall_time = stream_start + event.time
+    if processor.beep_pending:
+        return watermark
+    return stream_start + end_position / processor.sample_rate - WATERMARK_DELAY
+
+
+async def _run_device(device: int, config: DeviceConfig, updates: multiprocessing.Queue):
+    process_config = config.process_config
+    sample_config = config.sample_config
+    reader = SampleReader(sample_config)
+    processor = make_processor(process_config, stats=reader.stats)
+    processor.verbose = False
+    window_size = processor.num_samples_to_process
+    buffer = SampleBuffer(
+        maxsize=window_size * 3, dtype=sample_config.dtype,
+        overrun_policy=config.overrun_policy,
+    )
+    reader.buffer = buffer
+    stream_start: float|None = None
+    watermark = float('-inf')
+    async with reader:
+        await reader.open_stream()
+        while True:
+            samples = await reader.get_window(window_size)
+            if samples is None:
+                break
+            if stream_start is None:
+                stream_start = time.time() - samples.size / sample_config.sample_rate
+            events = await asyncio.to_thread(
+                process_window, processor, samples, buffer.last_gaps,
+            )
+            watermark = stamp_events(
+                processor, events, stream_start, buffer.read_position, watermark,
+            )
+            updates.put(DeviceUpdate(device, events, watermark))
+
+
+def device_worker(
+    device: int,
+    config: DeviceConfig,
+    updates: multiprocessing.Queue,
+    fft_backend: str
+):
+    """Entry point of the worker process for one device
+
+    The reader, buffer and processor all run within the process, and a
+    :class:`DeviceUpdate` is put on *updates* after each window (with a final
+    one when the device stops).
+    """
+    # Each device has its own process, so single threaded FFTs are used
+    fftbackend.set_backend(fft_backend, 1)
+    error = None
+    try:
+        asyncio.run(_run_device(device, config, updates))
+    except KeyboardInterrupt:
+        pass
+    except Exception as exc:
+        error = f'{exc.__class__.__name__}: {exc}'
+    updates.put(DeviceUpdate(device, [], None, error))
+
+
+def run_devices(devices: Sequence[DeviceConfig], sink: SqliteSink|None = None):
+    """Run each device in its own process and print the merged, time-ordered
+    beep events from all of them
+    """
+    ctx = multiprocessing.get_context('spawn')
+    updates = ctx.Queue()
+    backend = fftbackend.get_backend().name
+    processes = [
+        ctx.Process(
+            target=device_worker, args=(i, config, updates, backend),
+            name=f'kiwitracker-{config.name}', daemon=True,
+        )
+        for i, config in enumerate(devices)
+    ]
+    merger = EventMerger(range(len(devices)))
+    running = set(range(len(devices)))
+    decoder = ChickTimerDecoder()
+    for p in processes:
+        p.start()
+    try:
+        while running:
+            try:
+                update: DeviceUpdate = updates.get(timeout=1)
+            except queue.Empty:
+                # Check for any workers that died without sending a final update
+                for i in list(running):
+                    p = processes[i]
+                    if not p.is_alive() and p.exitcode != 0:
+                        print(f'{devices[i].name}: worker exited with code {p.exitcode}')
+                        running.discard(i)
+                        report_events(merger.finish(i), decoder, sink)
+                continue
+            if update.watermark is None:
+                if update.error is not None:
+                    print(f'{devices[update.device].name}: {update.error}')
+                running.discard(update.device)
+                released = merger.finish(update.device)
+            else:
+                released = merger.add(update.device, update.events, update.watermark)
+            report_events(released, decoder, sink)
+    finally:
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+            p.join()
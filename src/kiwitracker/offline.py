@@ -0,0 +1,239 @@
+from __future__ import annotations
+from typing import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+import dataclasses
+import time
+
+from kiwitracker.common import ProcessConfig
+from kiwitracker.capture import CaptureFile
+from kiwitracker.channelizer import ChannelizerProcessor, make_processor
+from kiwitracker.sample_processor import SampleProcessor, BeepEvent, calculate_bpm
+from kiwitracker.chicktimer import ChickTimerDecoder
+from kiwitracker.levels import LevelTracker
+from kiwitracker import fftbackend
+
+
+CAPTURE_SUFFIXES = ('.npy', '.bin', '.kcap')
+"""File extensions included when processing a directory of recordings"""
+
+
+@dataclass
+class Segment:
+    """A range of samples within a recording to be processed by one worker
+    """
+
+    filename: Path
+    start: int
+    """Index of the first sample owned by the segment"""
+
+    stop: int
+    """Index after the last sample owned by the segment"""
+
+
+@dataclass
+class OfflineResult:
+    """Results from :func:`process_recordings`
+    """
+
+    recordings: dict[Path, list[BeepEvent]] = field(default_factory=dict)
+    """The beep events found for each recording (ordered by time)"""
+
+    duration: float = 0
+    """Total duration of the processed recordings (in seconds)"""
+
+    elapsed: float = 0
+    """Time taken to process the recordings (in seconds)"""
+
+    @property
+    def realtime_factor(self) -> float:
+        """How many times faster than real time the recordings were processed
+        """
+        if self.elapsed == 0:
+            return 0
+        return self.duration / self.elapsed
+
+
+def find_recordings(paths: Iterable[str|Path]) -> list[Path]:
+    """Expand any directories in *paths* into the recordings within them
+    """
+    result = []
+    for p in paths:
+        p = Path(p)
+        if p.is_dir():
+            result.extend(sorted(
+                f for f in p.iterdir() if f.suffix in CAPTURE_SUFFIXES
+            ))
+        else:
+            result.append(p)
+    return result
+
+
+def split_segments(
+    filename: Path,
+    num_samples: int,
+    segment_size: int,
+    chunk_size: int
+) -> list[Segment]:
+    """Split a recording of *num_samples* into segments of approximately
+    *segment_size*, aligned to *chunk_size*
+
+    Keeping the segments aligned to the chunk size means each chunk is
+    processed exactly as it would be when processing the file serially.
+    """
+    segment_size = max(segment_size // chunk_size, 1) * chunk_size
+    return [
+        Segment(filename, start, min(start + segment_size, num_samples))
+        for start in range(0, num_samples, segment_size)
+    ]
+
+
+def make_offline_processor(
+    process_config: ProcessConfig
+) -> SampleProcessor|ChannelizerProcessor:
+    """Create a processor the way :func:`process_segment` does (the same
+    as :func:`~.sample_reader.run_from_disk`, without printing the events)
+    """
+    processor = make_processor(process_config)
+    processor.verbose = False
+    return processor
+
+
+def default_warmup_chunks() -> int:
+    """Number of chunks :func:`process_segment` processes before each
+    segment by default
+
+    This is enough for the adaptive noise and beep level estimates (see
+    :class:`~.levels.LevelTracker`) to be within 1% of those from a serial
+    run, whatever they started from.
+    """
+    return LevelTracker(SampleProcessor.level_alpha).settling_updates(0.01)
+
+
+def process_segment(
+    process_config: ProcessConfig,
+    segment: Segment,
+    warmup_chunks: int|None = None,
+    max_extra_chunks: int = 4
+) -> list[BeepEvent]:
+    """Process a single :class:`Segment`
+
+    Processing begins *warmup_chunks* (by default
+    :func:`default_warmup_chunks`) before the segment so the filter, edge
+    and adaptive threshold state match a serial run by the time the segment
+    starts, and continues past its end (by at most *max_extra_chunks*)
+    until any beep in progress is complete. Only beeps with a rising edge
+    inside of the segment are returned.
+
+    The :attr:`~.sample_processor.BeepEvent.bpm` values of the events are
+    not meaningful until they are passed to :func:`stitch_events`.
+    """
+    capture = CaptureFile(segment.filename)
+    process_config = capture.apply_to_config(process_config)
+    processor = make_offline_processor(process_config)
+    chunk_size = processor.num_samples_to_process
+    dtype = process_config.dtype
+    if warmup_chunks is None:
+        warmup_chunks = default_warmup_chunks()
+
+    start = max(segment.start - warmup_chunks * chunk_size, 0)
+    processor.seek(start)
+    extra_chunks = 0
+    events: list[BeepEvent] = []
+    for ix in range(start, capture.size, chunk_size):
+        if ix >= segment.stop:
+            if extra_chunks >= max_extra_chunks or not processor.beep_pending:
+                break
+            extra_chunks += 1
+        events.extend(processor.process(capture.read(ix, chunk_size, dtype)))
+    owned = []
+    for event in events:
+        sample_index = round(event.time * process_config.sample_config.sample_rate)
+        if segment.start <= sample_index < segment.stop:
+            owned.append(event)
+    return owned
+
+
+def stitch_events(events: Iterable[BeepEvent]) -> list[BeepEvent]:
+    """Order the events from multiple segments of a recording and calculate
+    the BPM for each from the previous event on the same channel
+
+    The results match those from processing the recording serially.
+    """
+    events = sorted(events, key=lambda e: (e.index / e.sample_rate, e.channel or 0))
+    last_rising_edge: dict[int|None, int] = {}
+    result = []
+    for event in events:
+        prev = last_rising_edge.get(event.channel)
+        bpm = calculate_bpm(event.index, prev, event.sample_rate)
+        last_rising_edge[event.channel] = event.index
+        result.append(dataclasses.replace(event, bpm=bpm))
+    return result
+
+
+def process_recordings(
+    process_config: ProcessConfig,
+    paths: Iterable[str|Path],
+    segment_duration: float = 60,
+    max_workers: int|None = None,
+    warmup_chunks: int|None = None
+) -> OfflineResult:
+    """Process recordings in parallel using a :class:`~concurrent.futures.ProcessPoolExecutor`
+
+    Each recording (directories are expanded using :func:`find_recordings`)
+    is split into segments of *segment_duration* seconds which are handed
+    out to the workers (see :func:`process_segment` for *warmup_chunks*),
+    then the results are put back together using :func:`stitch_events`.
+    """
+    start_time = time.perf_counter()
+    result = OfflineResult()
+    segments: list[Segment] = []
+    for filename in find_recordings(paths):
+        capture = CaptureFile(filename)
+        config = capture.apply_to_config(process_config)
+        sample_rate = config.sample_config.sample_rate
+        segments.extend(split_segments(
+            filename, capture.size, int(segment_duration * sample_rate),
+            config.num_samples_to_process,
+        ))
+        result.recordings[filename] = []
+        result.duration += capture.size / sample_rate
+
+    # The workers already run in parallel, so each uses the current FFT
+    # backend with a single thread
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=fftbackend.set_backend,
+        initargs=(fftbackend.get_backend().name, 1),
+    ) as executor:
+        futures = [
+            executor.submit(process_segment, process_config, segment, warmup_chunks)
+            for segment in segments
+        ]
+        for segment, fut in zip(segments, futures):
+            result.recordings[segment.filename].extend(fut.result())
+
+    for filename, events in result.recordings.items():
+        result.recordings[filename] = stitch_events(events)
+    result.elapsed = time.perf_counter() - start_time
+    return result
+
+
+def run_offline(process_config: ProcessConfig, filename: str, max_workers: int|None):
+    """Process a recording (or directory of recordings) in parallel and
+    print the results
+    """
+    result = process_recordings(process_config, [filename], max_workers=max_workers)
+    for recording, events in result.recordings.items():
+        print(f'{recording}:')
+        decoder = ChickTimerDecoder()
+        for event in events:
+            print(f' {event.time: 10.4f} sec |{event}')
+            ct_event = decoder.add_beep(event.time, event.channel)
+            if ct_event is not None:
+                print(f' {ct_event.time: 10.4f} sec |{ct_event}')
+    print(
+        f'processed {result.duration:.1f} sec in {result.elapsed:.1f} sec '
+        f'({result.realtime_factor:.1f}x realtime)'
+    )
@@ -0,0 +1,635 @@
+from __future__ import annotations
+from typing import Any, TextIO
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from multiprocessing.synchronize import Event
+import asyncio
+import dataclasses
+import math
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+import numpy.typing as npt
+
+from kiwitracker.common import SamplesT, SampleConfig, ProcessConfig
+from kiwitracker.channelizer import ChannelizerProcessor, make_processor
+from kiwitracker.sample_processor import BeepEvent
+from kiwitracker.sample_reader import (
+    SampleReader, SampleBuffer, OverrunPolicy, Gap, report_events, process_window,
+)
+from kiwitracker.multi import EventMerger, stamp_events
+from kiwitracker.stats import PipelineStats, StatsWriter
+from kiwitracker.chicktimer import ChickTimerDecoder
+from kiwitracker.sink import SqliteSink
+from kiwitracker.eventbus import EventBus
+from kiwitracker import fftbackend
+
+
+CHANNELIZER_WORKER = -1
+"""Worker number of the channelizer process in its :class:`WindowResult`
+messages
+"""
+
+
+class SharedRing:
+    """A ring of fixed size sample arrays in shared memory
+
+    The process that creates the ring writes each window into the slot for
+    its sequence number (see :meth:`slot`) and worker processes read them
+    in place, so the samples are never copied between processes. Only the
+    writer keeps track of which slots are free (from the sequence numbers
+    the readers report back with :meth:`release`).
+
+    Instances can be pickled (for passing to worker processes), which
+    attaches to the same shared memory block.
+    """
+
+    num_slots: int
+    slot_shape: tuple[int, ...]
+    """Shape of each slot (the number of samples for a window of input
+    samples, or ``(num_outputs, num_channels)`` for channelizer outputs)
+    """
+
+    dtype: np.dtype
+
+    num_readers: int
+    """Number of readers which must :meth:`release` each slot before it is
+    reused
+    """
+
+    write_seq: int
+    """Sequence number of the next window to be written"""
+
+    def __init__(
+        self,
+        num_slots: int,
+        slot_shape: int|tuple[int, ...],
+        dtype: npt.DTypeLike,
+        num_readers: int = 1,
+        name: str|None = None
+    ) -> None:
+        self.num_slots = num_slots
+        self.slot_shape = (slot_shape,) if isinstance(slot_shape, int) else tuple(slot_shape)
+        self.dtype = np.dtype(dtype)
+        self.num_readers = num_readers
+        self.write_seq = 0
+        self._done = {reader: 0 for reader in range(num_readers)}
+        shape = (num_slots, *self.slot_shape)
+        nbytes = math.prod(shape) * self.dtype.itemsize
+        self._owner = name is None
+        self._shm = shared_memory.SharedMemory(name=name, create=self._owner, size=nbytes)
+        self._data: SamplesT = np.ndarray(shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    @property
+    def name(self) -> str:
+        """Name of the shared memory block"""
+        return self._shm.name
+
+    @property
+    def full(self) -> bool:
+        """True if the slot for :attr:`write_seq` is still being read"""
+        done = min(self._done.values(), default=self.write_seq)
+        return self.write_seq - done >= self.num_slots
+
+    def slot(self, seq: int) -> SamplesT:
+        """Get the array for window *seq* (a view into the shared memory)"""
+        return self._data[seq % self.num_slots]
+
+    def release(self, reader: int, seq: int):
+        """Record that *reader* has finished with window *seq* (and all
+        before it)
+        """
+        if reader in self._done:
+            self._done[reader] = max(self._done[reader], seq + 1)
+
+    def remove_reader(self, reader: int):
+        """Stop waiting for *reader* to release slots (if it has stopped)"""
+        self._done.pop(reader, None)
+
+    def close(self):
+        """Detach from the shared memory (and free it if this is the writer)
+        """
+        # The array must be released before the memory can be closed
+        del self._data
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __getstate__(self) -> dict[str, Any]:
+        return dict(
+            num_slots=self.num_slots, slot_shape=self.slot_shape,
+            dtype=self.dtype, num_readers=self.num_readers, name=self.name,
+        )
+
+    def __setstate__(self, state: dict[str, Any]):
+        self.__init__(**state)
+
+
+@dataclass
+class WindowMessage:
+    """Sent to each DSP worker when a window has been written to the
+    :class:`SharedRing`
+    """
+
+    seq: int
+    """Sequence number of the window (windows are numbered consecutively)"""
+
+    size: int
+    """Number of samples in the window (or channelizer outputs, see
+    :func:`channelize_window`)
+    """
+
+    gaps: list[Gap]
+    """Samples dropped within (or just before) the window (in the same
+    units as :attr:`size`)
+    """
+
+    end_position: int
+    """Stream index just past the last sample of the window"""
+
+    stream_start: float
+    """Wall-clock time of the first sample of the stream"""
+
+
+@dataclass
+class WindowResult:
+    """Sent from a DSP worker after it has processed a window
+    """
+
+    worker: int
+
+    seq: int|None
+    """Sequence number of the window, or ``None`` if the worker has stopped"""
+
+    events: list[BeepEvent] = field(default_factory=list)
+    """Beeps found (with their :attr:`~.sample_processor.BeepEvent.wall_time` set)"""
+
+    watermark: float = float('-inf')
+    """Wall-clock time before which the worker will send no more events"""
+
+    busy_time: float = 0
+    """Time (in seconds) spent processing the window"""
+
+    error: str|None = None
+    """Description of the exception that stopped the worker (if any)"""
+
+    window: WindowMessage|None = None
+    """The channelized window to pass on to the DSP workers (only sent by
+    the channelizer process)
+    """
+
+
+@dataclass
+class _PendingWindow:
+    """A window being processed by :func:`run_pipeline`
+    """
+
+    size: int
+    """Number of input samples"""
+
+    waiting: set[int]
+    """DSP workers yet to finish with the window"""
+
+    front_time: float = 0
+    """Time spent channelizing the window"""
+
+    busy_time: float = 0
+    """Time spent by the slowest DSP worker so far"""
+
+
+def split_channels(process_config: ProcessConfig, num_workers: int) -> list[ProcessConfig]:
+    """Divide the :attr:`~.common.ProcessConfig.channels` of *process_config*
+    between at most *num_workers* configs
+
+    A config without channels (processing a single carrier) can't be divided,
+    so it's returned as the only item.
+    """
+    channels = process_config.channels
+    if not channels:
+        return [process_config]
+    num_workers = max(1, min(num_workers, len(channels)))
+    return [
+        dataclasses.replace(process_config, channels=channels[i::num_workers])
+        for i in range(num_workers)
+    ]
+
+
+def channelize_window(
+    processor: ChannelizerProcessor,
+    samples: SamplesT,
+    gaps: list[Gap],
+    out: SamplesT
+) -> tuple[int, list[Gap]]:
+    """Channelize a window of samples from a :class:`~.sample_reader.SampleBuffer`
+    into *out* (a :class:`SharedRing` slot), skipping over the *gaps* within it
+
+    Returns:
+        The number of outputs written and the gaps converted to channelizer
+        outputs (for :func:`process_bin_window`)
+    """
+    channelizer = processor.channelizer
+    num_out = 0
+    out_gaps = []
+
+    def add(chunk: SamplesT):
+        nonlocal num_out
+        bins = processor.channelize_bins(chunk)
+        out[num_out:num_out+bins.shape[0]] = bins
+        num_out += bins.shape[0]
+
+    start = 0
+    for gap in gaps:
+        if gap.offset > start:
+            add(samples[start:gap.offset])
+        position = channelizer.output_index
+        out_gaps.append(Gap(position, channelizer.skip(gap.count), num_out))
+        start = gap.offset
+    if start < samples.size:
+        add(samples[start:])
+    return num_out, out_gaps
+
+
+def process_bin_window(
+    processor: ChannelizerProcessor,
+    bin_samples: SamplesT,
+    gaps: list[Gap]
+) -> list[BeepEvent]:
+    """The equivalent of :func:`~.sample_reader.process_window` for the
+    outputs of :func:`channelize_window`
+    """
+    events = []
+    start = 0
+    for gap in gaps:
+        if gap.offset > start:
+            events.extend(processor.process_bins(bin_samples[start:gap.offset]))
+        processor.skip_bins(gap.count)
+        start = gap.offset
+    if start < bin_samples.shape[0]:
+        events.extend(processor.process_bins(bin_samples[start:]))
+    return events
+
+
+def _run_channelizer(
+    process_config: ProcessConfig,
+    in_ring: SharedRing,
+    out_ring: SharedRing,
+    windows: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    ready: Event
+):
+    processor = ChannelizerProcessor(process_config)
+    ready.set()
+    while True:
+        msg: WindowMessage|None = windows.get()
+        if msg is None:
+            break
+        start_time = time.perf_counter()
+        size, gaps = channelize_window(
+            processor, in_ring.slot(msg.seq)[:msg.size], msg.gaps, out_ring.slot(msg.seq),
+        )
+        busy_time = time.perf_counter() - start_time
+        window = dataclasses.replace(msg, size=size, gaps=gaps)
+        results.put(WindowResult(
+            CHANNELIZER_WORKER, msg.seq, busy_time=busy_time, window=window,
+        ))
+
+
+def channelizer_worker(
+    process_config: ProcessConfig,
+    in_ring: SharedRing,
+    out_ring: SharedRing,
+    windows: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    ready: Event,
+    fft_backend: str,
+    fft_workers: int
+):
+    """Entry point of the channelizer process
+
+    Each window of samples it gets from *windows* is read from *in_ring*,
+    and the channelizer outputs for every channel of *process_config* are
+    written to the same slot of *out_ring* (see :func:`channelize_window`).
+    A :class:`WindowResult` with the message for the DSP workers is then put
+    on *results*, with a final one (where ``seq`` is ``None``) when it stops.
+    """
+    fftbackend.set_backend(fft_backend, fft_workers)
+    error = None
+    try:
+        _run_channelizer(process_config, in_ring, out_ring, windows, results, ready)
+    except KeyboardInterrupt:
+        pass
+    except Exception as exc:
+        error = f'{exc.__class__.__name__}: {exc}'
+    finally:
+        in_ring.close()
+        out_ring.close()
+    results.put(WindowResult(CHANNELIZER_WORKER, None, error=error))
+
+
+def _run_dsp(
+    worker: int,
+    process_config: ProcessConfig,
+    ring: SharedRing,
+    windows: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    ready: Event,
+    columns: list[int]|None
+):
+    processor = make_processor(process_config)
+    processor.verbose = False
+    ready.set()
+    expected_seq = 0
+    watermark = float('-inf')
+    while True:
+        msg: WindowMessage|None = windows.get()
+        if msg is None:
+            break
+        if msg.seq != expected_seq:
+            raise RuntimeError(f'Expected window {expected_seq}, got {msg.seq}')
+        expected_seq += 1
+        start_time = time.perf_counter()
+        slot = ring.slot(msg.seq)
+        if columns is None:
+            events = process_window(processor, slot[:msg.size], msg.gaps)
+        else:
+            assert isinstance(processor, ChannelizerProcessor)
+            events = process_bin_window(processor, slot[:msg.size,columns], msg.gaps)
+        busy_time = time.perf_counter() - start_time
+        watermark = stamp_events(
+            processor, events, msg.stream_start, msg.end_position, watermark,
+        )
+        results.put(WindowResult(worker, msg.seq, events, watermark, busy_time))
+
+
+def dsp_worker(
+    worker: int,
+    process_config: ProcessConfig,
+    ring: SharedRing,
+    windows: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    ready: Event,
+    fft_backend: str,
+    columns: list[int]|None = None
+):
+    """Entry point of a DSP worker process
+
+    *ready* is set once the processor has been created. A :class:`WindowResult`
+    is then put on *results* after each window it gets from *windows*, with a
+    final one (where ``seq`` is ``None``) when it stops.
+
+    If *columns* is given, the ring holds channelizer outputs (see
+    :func:`channelize_window`) and these are the columns for the worker's
+    channels. Otherwise it holds the input samples.
+    """
+    fftbackend.set_backend(fft_backend, 1)
+    error = None
+    try:
+        _run_dsp(worker, process_config, ring, windows, results, ready, columns)
+    except KeyboardInterrupt:
+        pass
+    except Exception as exc:
+        error = f'{exc.__class__.__name__}: {exc}'
+    finally:
+        ring.close()
+    results.put(WindowResult(worker, None, error=error))
+
+
+async def run_pipeline(
+    sample_config: SampleConfig,
+    process_config: ProcessConfig,
+    num_workers: int = 2,
+    num_slots: int = 4,
+    stats_fd: TextIO|None = None,
+    stats_interval: float = 10,
+    sink: SqliteSink|None = None,
+    stats: PipelineStats|None = None,
+    overrun_policy: OverrunPolicy|str = OverrunPolicy.DROP_NEWEST,
+    bus: EventBus|None = None
+):
+    """Read samples from the sdr in this process and process them in
+    separate worker processes
+
+    When processing :attr:`~.common.ProcessConfig.channels`, each window is
+    copied from the :class:`~.sample_reader.SampleBuffer` into a
+    :class:`SharedRing` slot and channelized once by a dedicated process
+    (see :func:`channelizer_worker`), as that is the most expensive stage.
+    It writes the outputs to a slot of a second ring, and the channels are
+    divided between the DSP workers (see :func:`split_channels`), each
+    reading only its own columns in place for the rest of the processing.
+    A single carrier is processed by one DSP worker, reading the samples
+    from the first ring. The events are merged back into time order (see
+    :class:`~.multi.EventMerger`).
+
+    This process only reads from the device and passes messages between the
+    workers, so reading is never held up by processing: while every slot is
+    in use, samples wait in the buffer (and are dropped there according to
+    *overrun_policy* if it fills). If a DSP worker stops, the others carry
+    on without its channels.
+
+    Only the reader's statistics and the time spent channelizing plus the
+    time spent by the slowest DSP worker on each window are kept in *stats*
+    (the stage timings stay in the workers).
+
+    The merged events are published to *bus* (if given), which is closed
+    when the stream ends.
+    """
+    if stats is None:
+        stats = PipelineStats(sample_config.sample_rate)
+    configs = split_channels(process_config, num_workers)
+    window_size = process_config.num_samples_to_process
+    reader = SampleReader(sample_config, stats=stats)
+    buffer = SampleBuffer(
+        maxsize=window_size * 3, dtype=sample_config.dtype,
+        overrun_policy=overrun_policy,
+    )
+    reader.buffer = buffer
+    stats.buffer_maxsize = buffer.maxsize
+
+    ctx = multiprocessing.get_context('spawn')
+    backend = fftbackend.get_backend()
+    results = ctx.Queue()
+    channelizing = process_config.channels is not None
+    # Without the channelizer, the DSP workers read the input samples directly
+    in_ring = SharedRing(
+        num_slots, window_size, sample_config.dtype,
+        num_readers=1 if channelizing else len(configs),
+    )
+    ring = in_ring
+    columns: list[list[int]|None] = [None] * len(configs)
+    front: multiprocessing.process.BaseProcess|None = None
+    if channelizing:
+        layout = ChannelizerProcessor(process_config)
+        channels = layout.channels
+        columns = [[channels.index(ch) for ch in config.channels or []] for config in configs]
+        # Each output uses `decimation` new samples, plus up to a full
+        # filter length of samples held over from the last window
+        channelizer = layout.channelizer
+        max_outputs = window_size // channelizer.decimation + 2 * channelizer.taps_per_bin + 1
+        ring = SharedRing(
+            num_slots, (max_outputs, len(channels)), sample_config.dtype,
+            num_readers=len(configs),
+        )
+        front_windows = ctx.Queue()
+        front_ready = ctx.Event()
+        front = ctx.Process(
+            target=channelizer_worker,
+            args=(
+                process_config, in_ring, ring, front_windows, results, front_ready,
+                backend.name, backend.workers,
+            ),
+            name='kiwitracker-channelizer', daemon=True,
+        )
+    windows = [ctx.Queue() for _ in configs]
+    ready = [ctx.Event() for _ in configs]
+    processes = [
+        ctx.Process(
+            target=dsp_worker,
+            args=(i, config, ring, windows[i], results, ready[i], backend.name, columns[i]),
+            name=f'kiwitracker-dsp{i}', daemon=True,
+        )
+        for i, config in enumerate(configs)
+    ]
+    if front is not None:
+        ready.append(front_ready)
+        processes.append(front)
+    for p in processes:
+        p.start()
+
+    merger = EventMerger(range(len(configs)))
+    running = set(range(len(configs)))
+    front_running = front is not None
+    decoder = ChickTimerDecoder()
+    pending: dict[int, _PendingWindow] = {}
+    slot_freed = asyncio.Event()
+
+    def dispatch(msg: WindowMessage|None):
+        # Only the workers still running are sent windows
+        for i in running:
+            windows[i].put(msg)
+
+    def finish_window(seq: int):
+        window = pending[seq]
+        if not window.waiting:
+            del pending[seq]
+            stats.record_processed(window.size, window.front_time + window.busy_time)
+
+    def handle_front_result(result: WindowResult):
+        nonlocal front_running
+        if result.seq is None:
+            if result.error is not None:
+                print(f'channelizer: {result.error}')
+            front_running = False
+            dispatch(None)
+        elif result.seq in pending:
+            assert result.window is not None
+            pending[result.seq].front_time = result.busy_time
+            dispatch(result.window)
+        slot_freed.set()
+
+    def handle_result(result: WindowResult):
+        worker = result.worker
+        if worker == CHANNELIZER_WORKER:
+            handle_front_result(result)
+            return
+        if result.seq is None:
+            if result.error is not None:
+                print(f'dsp{worker}: {result.error}')
+            running.discard(worker)
+            ring.remove_reader(worker)
+            # The windows it had yet to finish are no longer waiting on it
+            for seq in list(pending):
+                pending[seq].waiting.discard(worker)
+                finish_window(seq)
+            released = merger.finish(worker)
+        else:
+            ring.release(worker, result.seq)
+            window = pending[result.seq]
+            window.busy_time = max(window.busy_time, result.busy_time)
+            window.waiting.discard(worker)
+            finish_window(result.seq)
+            released = merger.add(worker, result.events, result.watermark)
+        slot_freed.set()
+        report_events(released, decoder, sink)
+        if bus is not None:
+            bus.publish(released)
+
+    def streaming() -> bool:
+        # Without a channelizer process, the DSP workers are fed directly
+        return bool(running) and (front is None or front_running)
+
+    async def collect():
+        while running or front_running:
+            try:
+                result = await asyncio.to_thread(results.get, timeout=1)
+            except queue.Empty:
+                # Check for any workers that died without sending a final result
+                for i in list(running):
+                    if not processes[i].is_alive():
+                        handle_result(WindowResult(
+                            i, None, error=f'exited with code {processes[i].exitcode}',
+                        ))
+                if front_running and front is not None and not front.is_alive():
+                    handle_result(WindowResult(
+                        CHANNELIZER_WORKER, None, error=f'exited with code {front.exitcode}',
+                    ))
+                continue
+            handle_result(result)
+
+    writer = writer_task = None
+    if stats_fd is not None:
+        writer = StatsWriter(stats, stats_fd, interval=stats_interval)
+        writer_task = asyncio.create_task(writer.run())
+    collector = asyncio.create_task(collect())
+    stream_start: float|None = None
+    try:
+        # Workers take a while to start, so wait for them instead of dropping
+        # the first windows
+        while streaming() and not all(event.is_set() for event in ready):
+            await asyncio.sleep(0.1)
+        async with reader:
+            await reader.open_stream()
+            while streaming():
+                # A slot of the second ring is only released once the
+                # channelizer has finished with the same slot of the first
+                while ring.full and streaming():
+                    slot_freed.clear()
+                    await slot_freed.wait()
+                seq = ring.write_seq
+                samples = await reader.get_window(window_size, out=in_ring.slot(seq))
+                if samples is None:
+                    break
+                if stream_start is None:
+                    stream_start = time.time() - samples.size / sample_config.sample_rate
+                msg = WindowMessage(
+                    seq, samples.size, buffer.last_gaps, buffer.read_position, stream_start,
+                )
+                pending[seq] = _PendingWindow(samples.size, set(running))
+                ring.write_seq += 1
+                if front is None:
+                    dispatch(msg)
+                else:
+                    front_windows.put(msg)
+        if front is None:
+            dispatch(None)
+        else:
+            # The channelizer passes this on once it has finished
+            front_windows.put(None)
+        await collector
+        if writer is not None:
+            writer.write()
+    finally:
+        collector.cancel()
+        if writer_task is not None:
+            writer_task.cancel()
+        for p in processes:
+            p.join(timeout=1)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        if ring is not in_ring:
+            ring.close()
+        in_ring.close()
+        if bus is not None:
+            bus.close()
@@ -0,0 +1,65 @@
+from __future__ import annotations
+import numpy as np
+import numpy.typing as npt
+
+from kiwitracker.common import SamplesT
+
+
+RAW_IQ_DTYPE = np.dtype(np.uint8)
+"""Data type of raw samples from the sdr (interleaved unsigned 8-bit I/Q,
+so two elements per sample)
+"""
+
+RawIQT = npt.NDArray[np.uint8]
+
+
+def is_raw_iq(data: npt.NDArray) -> bool:
+    """True if *data* holds raw bytes rather than complex samples"""
+    return data.dtype == RAW_IQ_DTYPE
+
+
+def num_samples(data: SamplesT|RawIQT) -> int:
+    """Number of samples in *data* (complex samples or raw bytes)"""
+    return data.size // 2 if is_raw_iq(data) else data.size
+
+
+def convert_raw_iq(
+    raw: RawIQT,
+    out: SamplesT|None = None,
+    dtype: npt.DTypeLike = np.complex64
+) -> SamplesT:
+    """Convert raw interleaved I/Q bytes to complex samples
+
+    This uses the same scaling as :meth:`rtlsdr.RtlSdr.read_samples` (``0``
+    to ``255`` becomes ``-1`` to ``1``), but the bytes are converted straight
+    into the result's dtype without any temporary arrays.
+
+    Arguments:
+        raw: The raw bytes (any trailing odd byte is ignored)
+        out: A contiguous array to write the samples into (of at least
+            ``raw.size // 2`` samples). Its dtype is used instead of *dtype*.
+        dtype: The complex dtype of the result if *out* is not given
+
+    Returns:
+        The converted samples (the start of *out* if it was given)
+    """
+    count = raw.size // 2
+    if out is None:
+        out = np.empty(count, dtype=dtype)
+    else:
+        out = out[:count]
+    # Each byte becomes one float of the complex output
+    real = out.view(np.finfo(out.dtype).dtype)
+    np.multiply(raw[:count*2], real.dtype.type(1 / 127.5), out=real)
+    real -= 1
+    return out
+
+
+def to_raw_iq(samples: SamplesT) -> RawIQT:
+    """Quantize complex samples to raw interleaved I/Q bytes (the inverse of
+    :func:`convert_raw_iq`, clipping anything outside of ``-1`` to ``1``)
+    """
+    real = samples.view(np.finfo(samples.dtype).dtype)
+    raw = np.rint((real + 1) * 127.5)
+    np.clip(raw, 0, 255, out=raw)
+    return raw.astype(RAW_IQ_DTYPE)
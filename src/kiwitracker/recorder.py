@@ -0,0 +1,282 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Self, TextIO
+from dataclasses import dataclass, field
+from pathlib import Path
+import time
+
+import numpy as np
+import numpy.typing as npt
+
+from kiwitracker.common import SamplesT, SampleConfig
+from kiwitracker.capture import (
+    CaptureHeader, CaptureWriter, CaptureSegment, index_filename,
+)
+
+if TYPE_CHECKING:
+    from kiwitracker.sample_processor import BeepEvent
+    from kiwitracker.sample_reader import Gap
+
+
+@dataclass
+class _Trigger:
+    """A range of samples waiting to be written by a :class:`TriggeredRecorder`
+    """
+
+    start: int
+    stop: int
+    kind: str
+    channels: list[int|None] = field(default_factory=list)
+
+
+class TriggeredRecorder:
+    """Record only the samples around each beep (and a short snapshot of the
+    noise every :attr:`noise_interval` seconds) from a live stream
+
+    The most recent samples are kept in a ring so the recording can begin
+    :attr:`pre_trigger` seconds before a beep's rising edge, which is
+    usually in an earlier window than the one the beep is reported in.
+    Overlapping ranges (such as beeps on several channels at once) are
+    merged into a single :class:`~.capture.CaptureSegment`, so each range
+    is held for a window after its samples have arrived in case an
+    overlapping beep is reported late.
+
+    The segments are written back to back to capture files in
+    :attr:`directory` (a new one every :attr:`file_duration` seconds), each
+    with an index of the segments' positions, times and channels. These
+    can be processed with :func:`~.sample_reader.run_from_disk`, which
+    skips over the samples between segments so beep timing is kept.
+    """
+
+    directory: Path
+    sample_config: SampleConfig
+
+    dtype: np.dtype
+    """Data type the samples are stored as"""
+
+    pre_trigger: float
+    """Seconds of samples to record before each beep"""
+
+    post_trigger: float
+    """Seconds of samples to record after each beep"""
+
+    noise_interval: float|None
+    """Seconds between each noise snapshot (``None`` to disable them)"""
+
+    noise_duration: float
+    """Length of each noise snapshot in seconds"""
+
+    file_duration: float
+    """Seconds of the stream covered by each file"""
+
+    num_segments: int
+    """Total number of segments written"""
+
+    num_samples: int
+    """Total number of samples written"""
+
+    def __init__(
+        self,
+        directory: str|Path,
+        sample_config: SampleConfig,
+        window_size: int,
+        dtype: npt.DTypeLike|None = None,
+        pre_trigger: float = 0.1,
+        post_trigger: float = 0.1,
+        noise_interval: float|None = 600,
+        noise_duration: float = 0.25,
+        file_duration: float = 3600
+    ) -> None:
+        self.directory = Path(directory)
+        self.sample_config = sample_config
+        self.dtype = np.dtype(sample_config.dtype if dtype is None else dtype)
+        self.pre_trigger = pre_trigger
+        self.post_trigger = post_trigger
+        self.noise_interval = noise_interval
+        self.noise_duration = noise_duration
+        self.file_duration = file_duration
+        self.num_segments = 0
+        self.num_samples = 0
+        fs = sample_config.sample_rate
+        # A beep can be reported up to a window after its rising edge and
+        # is written once the samples after it have arrived
+        capacity = int((pre_trigger + post_trigger + noise_duration) * fs) + 3 * window_size
+        # An overlapping beep starts at most `pre_trigger` after a range
+        # ends and is reported within a window of its rising edge
+        self._merge_delay = window_size + int(pre_trigger * fs)
+        self._history: SamplesT = np.zeros(capacity, dtype=sample_config.dtype)
+        self._history_start = 0
+        self._history_end = 0
+        self._written_end = 0
+        self._triggers: list[_Trigger] = []
+        self._next_noise: int|None = None
+        self._stream_start: float|None = None
+        self._writer: CaptureWriter|None = None
+        self._index_fd: TextIO|None = None
+        self._file_start = 0
+
+    def add(
+        self,
+        samples: SamplesT,
+        end_position: int,
+        gaps: list[Gap],
+        events: list[BeepEvent],
+        stream_start: float|None = None
+    ):
+        """Add a window of samples and the beeps found so far
+
+        Arguments:
+            samples: The window (from :meth:`.SampleBuffer.get`). It is
+                copied, so may be reused afterwards.
+            end_position: Stream index just past the last sample of the
+                window (:attr:`.SampleBuffer.read_position`)
+            gaps: Any samples dropped within the window
+                (:attr:`.SampleBuffer.last_gaps`)
+            events: Beeps returned by the processor for the window
+            stream_start: Wall-clock time of the first sample of the stream
+        """
+        if stream_start is not None:
+            self._stream_start = stream_start
+        start = 0
+        for gap in gaps:
+            if gap.offset > start:
+                self._store(samples[start:gap.offset], gap.position - (gap.offset - start))
+            start = gap.offset
+        if start < samples.size:
+            self._store(samples[start:], end_position - (samples.size - start))
+
+        fs = self.sample_config.sample_rate
+        for event in events:
+            rising = round(event.time * fs)
+            self._trigger(
+                rising - int(self.pre_trigger * fs),
+                rising + int((event.duration + self.post_trigger) * fs),
+                'beep', [event.channel],
+            )
+        if self.noise_interval is not None:
+            if self._next_noise is None or self._history_end >= self._next_noise:
+                stop = self._history_end
+                self._trigger(stop - int(self.noise_duration * fs), stop, 'noise')
+                self._next_noise = self._history_end + int(self.noise_interval * fs)
+        self._write_ready()
+
+    def _store(self, samples: SamplesT, position: int):
+        if position != self._history_end:
+            # Anything waiting on samples that were dropped is cut short
+            self._write_ready(flush=True)
+            self._history_start = self._history_end = position
+        capacity = self._history.size
+        if samples.size > capacity:
+            position += samples.size - capacity
+            samples = samples[-capacity:]
+        i = position % capacity
+        n = min(samples.size, capacity - i)
+        self._history[i:i+n] = samples[:n]
+        self._history[:samples.size-n] = samples[n:]
+        self._history_end = position + samples.size
+        self._history_start = max(self._history_start, self._history_end - capacity)
+
+    def _extract(self, start: int, stop: int) -> SamplesT:
+        capacity = self._history.size
+        i, j = start % capacity, stop % capacity
+        if i < j or stop == start:
+            return self._history[i:j]
+        return np.concatenate([self._history[i:], self._history[:j]])
+
+    def _trigger(self, start: int, stop: int, kind: str, channels: list[int|None]|None = None):
+        start = max(start, self._history_start, self._written_end)
+        if stop <= start:
+            return
+        channels = channels or []
+        triggers = self._triggers
+        for trigger in triggers:
+            if start <= trigger.stop and stop >= trigger.start:
+                trigger.start = min(trigger.start, start)
+                trigger.stop = max(trigger.stop, stop)
+                trigger.channels.extend(ch for ch in channels if ch not in trigger.channels)
+                if kind == 'beep':
+                    trigger.kind = kind
+                return
+        triggers.append(_Trigger(start, stop, kind, list(channels)))
+        triggers.sort(key=lambda trigger: trigger.start)
+
+    def _write_ready(self, flush: bool = False):
+        """Write the triggers whose samples have all arrived (or everything
+        that has arrived if *flush* is True)
+        """
+        while self._triggers:
+            trigger = self._triggers[0]
+            if trigger.stop + self._merge_delay > self._history_end:
+                if not flush:
+                    break
+                trigger.stop = min(trigger.stop, self._history_end)
+            del self._triggers[0]
+            # Merging can extend a trigger over the start of the next one
+            start = max(trigger.start, self._history_start, self._written_end)
+            if trigger.stop > start:
+                self._write(trigger, start)
+
+    def _write(self, trigger: _Trigger, start: int):
+        fs = self.sample_config.sample_rate
+        if self._writer is None or start - self._file_start >= self.file_duration * fs:
+            self._open_file(start)
+        writer = self._writer
+        assert writer is not None and self._index_fd is not None
+        wall_time = None
+        if self._stream_start is not None:
+            wall_time = self._stream_start + start / fs
+        segment = CaptureSegment(
+            offset=writer.num_samples, position=start, count=trigger.stop - start,
+            time=wall_time, kind=trigger.kind, channels=trigger.channels,
+        )
+        writer.write(self._extract(start, trigger.stop))
+        writer.flush()
+        # The index is written after the samples so it never refers to
+        # missing data
+        self._index_fd.write(segment.to_json() + '\n')
+        self._index_fd.flush()
+        self._written_end = trigger.stop
+        self.num_segments += 1
+        self.num_samples += segment.count
+
+    def _open_file(self, position: int):
+        self._close_file()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fs = self.sample_config.sample_rate
+        if self._stream_start is not None:
+            stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime(self._stream_start + position / fs))
+            filename = self.directory / f'kiwi-{stamp}.kcap'
+        else:
+            filename = self.directory / f'kiwi-{position}.kcap'
+        if filename.exists() or index_filename(filename).exists():
+            filename = filename.with_name(f'{filename.stem}-{position}.kcap')
+        header = CaptureHeader(
+            sample_rate=fs,
+            center_freq=self.sample_config.center_freq,
+            dtype=self.dtype,
+            start_index=position,
+        )
+        self._writer = CaptureWriter(filename, header)
+        self._writer.open()
+        self._index_fd = open(index_filename(filename), 'w')
+        self._file_start = position
+
+    def _close_file(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._index_fd is not None:
+            self._index_fd.close()
+            self._index_fd = None
+
+    def close(self):
+        """Write whatever has arrived of any pending segments and close the
+        current file
+        """
+        self._write_ready(flush=True)
+        self._close_file()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
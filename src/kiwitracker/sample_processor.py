@@ -1,7 +1,8 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
+from dataclasses import dataclass
 import asyncio
-from matplotlib import pyplot as plt
+import math
 
 import numpy as np
 import numpy.typing as npt
@@ -9,6 +10,101 @@ from scipy import signal
 import time
 
 from kiwitracker.common import SamplesT, FloatArray, ProcessConfig
+from kiwitracker.decimator import Decimator
+from kiwitracker.mixer import Mixer
+from kiwitracker.fftbackend import get_backend
+from kiwitracker.stats import PipelineStats
+from kiwitracker.levels import LevelTracker
+
+if TYPE_CHECKING:
+    from kiwitracker.diagnostics import Probe
+
+
+@dataclass
+class DetectionResult:
+    """Per-frame results of the FFT beep detection stage
+    """
+
+    peak_bins: npt.NDArray[np.intp]
+    """Index of the peak (fftshifted) bin for each frame"""
+
+    peak_mags: FloatArray
+    """Normalized magnitude of the peak bin for each frame"""
+
+    peak_freqs: FloatArray
+    """Frequency (in Hz, relative to the sdr's center frequency) of the peak
+    bin for each frame
+    """
+
+    threshold: float
+    """The magnitude threshold a frame's peak must exceed to be a beep"""
+
+    @property
+    def beep_mask(self) -> npt.NDArray[np.bool_]:
+        """Boolean mask of the frames with a peak above :attr:`threshold`"""
+        return self.peak_mags > self.threshold
+
+    @property
+    def beep_freqs(self) -> FloatArray:
+        """Peak frequencies of the frames containing a beep"""
+        return self.peak_freqs[self.beep_mask]
+
+
+@dataclass(slots=True)
+class BeepEvent:
+    """A beep found by :meth:`SampleProcessor.process`
+
+    Events are created for every beep on every channel, so ``__slots__``
+    are used to keep them small.
+    """
+
+    index: int
+    """Index of the rising edge (in decimated samples from the start of the
+    stream)
+    """
+
+    sample_rate: float
+    """Sample rate of the decimated samples"""
+
+    bpm: float
+    """Beats per minute calculated from the previous beep (``nan`` if there
+    was no previous beep on the channel)
+    """
+
+    snr: float
+    """Signal to noise ratio (in dB)"""
+
+    duration: float
+    """Duration of the beep (in seconds)"""
+
+    channel: int|None = None
+    """The channel the beep was found on (if processing multiple channels)"""
+
+    carrier_freq: float|None = None
+    """Carrier frequency (in Hz) of the processor that found the beep"""
+
+    wall_time: float|None = None
+    """Wall-clock (unix) time of the rising edge, if the time the stream
+    started is known
+    """
+
+    @property
+    def time(self) -> float:
+        """Time of the rising edge (in seconds from the start of the stream)"""
+        return self.index / self.sample_rate
+
+    def __str__(self) -> str:
+        prefix = '' if self.channel is None else f" CH{self.channel:02d} |"
+        return f"{prefix} BPM : {self.bpm: 5.2f} |  SNR : {self.snr: 5.2f}  | BEEP_DURATION : {self.duration: 5.4f} sec"
+
+
+def calculate_bpm(rising_edge: int, prev_rising_edge: int|None, sample_rate: float) -> float:
+    """Beats per minute between two rising edges (in samples at
+    *sample_rate*), or ``nan`` if there is no previous edge
+    """
+    if prev_rising_edge is None or rising_edge <= prev_rising_edge:
+        return math.nan
+    return 60 * sample_rate / (rising_edge - prev_rising_edge)
 
 
 def snr(samples, rising_edge_idx, falling_edge_idx):
@@ -20,16 +116,109 @@ def snr(samples, rising_edge_idx, falling_edge_idx):
 class SampleProcessor:
     config: ProcessConfig
     threshold: float = 0.6
+    """Fixed edge threshold (used if :attr:`adaptive` is False)"""
+
+    fft_thresh: float = 0.1
+    """Fixed beep detection threshold (used if :attr:`adaptive` is False)"""
+
+    adaptive: bool = True
+    """If True, the detection and edge thresholds follow running estimates
+    of the noise floor and beep level (see :attr:`detect_threshold` and
+    :attr:`edge_threshold`) instead of :attr:`fft_thresh` and :attr:`threshold`
+    """
+
+    detect_factor: float = 4.0
+    """Multiple of the noise floor a detection frame's peak must exceed"""
+
+    edge_factor: float = 2.0
+    """Minimum multiple of the (smoothed) noise floor for the edge threshold"""
+
+    level_alpha: float = 0.05
+    """Weight of each chunk in the running level estimates"""
+
+    gate_enabled: bool = True
+    """If True (and :attr:`adaptive`), check each chunk with
+    :meth:`check_energy` before any FFTs are done
+    """
+
+    gate_stride: int = 8
+    """Only every nth sample is used by :meth:`check_energy`"""
+
+    gate_sigma: float = 6.0
+    """How many standard deviations of the noise power estimate a frame
+    must exceed to pass :meth:`check_energy`
+    """
+
+    gate_audit_interval: int = 13
+    """Every nth chunk rejected by :meth:`check_energy` is still passed to
+    the FFT detection. If a beep is found in one of them, the miss is counted
+    (as ``'gate_missed'``) and the gate is disabled since the beeps are too
+    weak for it.
+
+    This is a prime number so the audited chunks don't line up with the beep
+    period (3, 5 and 8 chunks for 80, 48 and 30 BPM with the default chunk size).
+    """
+
     beep_duration: float = 0.017 # seconds
+    decimation_factors: tuple[int, ...] = (10, 10)
+    """Decimation factor for each stage of the :attr:`decimator`"""
+
+    smoothing_len: int = 10
+    """Length of the moving average applied to the decimated magnitudes"""
+
+    verbose: bool = False
+    """If True, print each :class:`BeepEvent` as it is found
+
+    Printing is done within :meth:`process` (usually on the processing
+    thread), so callers should normally print the returned events instead.
+    """
+
+    probe: Probe|None = None
+    """If set, the detection results and smoothed magnitudes of each chunk
+    are passed to it for plotting (see :mod:`~.diagnostics`)
+    """
+
     stateful_index: int
+    """Index (in decimated samples) of the start of the next chunk"""
+
+    stateful_rising_edge: int|None
+    """Index (in decimated samples) of the last beep's rising edge (``None``
+    until the first beep, which has no BPM)
+    """
+
+    channel: int|None
+    """The channel number being processed (if processing one of many
+    channels)
+    """
+
+    stats: PipelineStats
+    """Timers for each processing stage (``'gate'``, ``'detect'``, ``'mix'``,
+    ``'decimate'`` and ``'edge'``) and counters for the chunks rejected by
+    the first two (``'gate_rejected'`` and ``'detect_rejected'``)
+    """
 
-    def __init__(self, config: ProcessConfig) -> None:
+    def __init__(
+        self,
+        config: ProcessConfig,
+        channel: int|None = None,
+        stats: PipelineStats|None = None
+    ) -> None:
         self.config = config
+        self.channel = channel
+        if stats is None:
+            stats = PipelineStats(config.sample_config.sample_rate)
+        self.stats = stats
         self.stateful_index = 0
-        self._time_array = None
-        self._fir = None
-        self._phasor = None
-        self.stateful_rising_edge = 0
+        self._mixer: Mixer|None = None
+        self._fft_freqs = None
+        self._decimator: Decimator|None = None
+        self.stateful_rising_edge = None
+        self._gate_noise = LevelTracker(self.level_alpha)
+        self._gate_rejects = 0
+        self._detect_noise = LevelTracker(self.level_alpha)
+        self._edge_noise = LevelTracker(self.level_alpha)
+        self._beep_level: float|None = None
+        self._reset_edge_state()
 
     @property
     def sample_rate(self): return self.config.sample_config.sample_rate
@@ -51,127 +240,338 @@ class SampleProcessor:
         return fc - self.carrier_freq
 
     @property
-    def time_array(self) -> FloatArray:
-        t = self._time_array
-        if t is None:
-            t = np.arange(self.num_samples_to_process)/self.sample_rate
-            self._time_array = t
-        return t
+    def decimator(self) -> Decimator:
+        """Streaming :class:`~.decimator.Decimator` used to filter and decimate
+        the mixed samples
+        """
+        d = self._decimator
+        if d is None:
+            d = self._decimator = Decimator(
+                self.decimation_factors, dtype=self.config.dtype,
+            )
+        return d
 
     @property
-    def fir(self) -> FloatArray:
-        h = self._fir
-        if h is None:
-            h = self._fir = signal.firwin(501, 0.02, pass_zero=True)
-        return h
+    def decimated_rate(self) -> float:
+        """Sample rate after decimation"""
+        return self.sample_rate / self.decimator.factor
 
     @property
-    def phasor(self) -> npt.NDArray[np.complex128]:
-        p = self._phasor
-        if p is None:
-            t = self.time_array
-            p = np.exp(2j*np.pi*t*self.freq_offset)
-            self._phasor = p
-        return p
+    def beep_pending(self) -> bool:
+        """True if a rising edge has been found without its falling edge
+        (the beep continues into the next chunk)
+        """
+        return self._rising_edge is not None
+
+    @property
+    def mixer(self) -> Mixer:
+        """The :class:`~.mixer.Mixer` used to shift the carrier down to
+        baseband
+        """
+        m = self._mixer
+        if m is None:
+            m = self._mixer = Mixer(
+                self.sample_rate, self.freq_offset, dtype=self.config.dtype,
+            )
+        return m
+
+    @property
+    def detect_threshold(self) -> float:
+        """The magnitude a detection frame's peak must exceed to contain a beep
+
+        This is :attr:`detect_factor` times the typical peak of a frame
+        containing only noise.
+        """
+        noise = self._detect_noise.level
+        if not self.adaptive or noise is None:
+            return self.fft_thresh
+        return self.detect_factor * noise
+
+    @property
+    def edge_threshold(self) -> float:
+        """Threshold for the smoothed, decimated magnitudes
+
+        This is halfway between the noise floor and the beep level (so the
+        measured duration is not affected by the beep's strength), but at
+        least :attr:`edge_factor` times the noise floor.
+        """
+        noise = self._edge_noise.level
+        if not self.adaptive or noise is None:
+            return self.threshold
+        floor = self.edge_factor * noise
+        level = self._beep_level
+        if level is None:
+            return floor
+        return max(noise + (level - noise) / 2, floor)
+
+    def update_beep_level(self, level: float):
+        """Set the magnitude of the most recently detected beep (used for
+        :attr:`edge_threshold`)
+
+        Only the latest value is kept, so the threshold follows changes in a
+        transmitter's strength from one beep to the next.
+        """
+        self._beep_level = level
 
     @property
     def fft_size(self) -> int:
         # this makes sure there's at least 1 full chunk within each beep
         return int(self.beep_duration * self.sample_rate / 2)
 
-    def process(self, samples: SamplesT):
+    @property
+    def fft_freqs(self) -> FloatArray:
+        """Frequency axis (in Hz) for the fftshifted bins of each detection
+        frame
+        """
+        f = self._fft_freqs
+        if f is None:
+            fft_size = self.fft_size
+            f = np.linspace(self.sample_rate/-2, self.sample_rate/2, fft_size)
+            self._fft_freqs = f
+        return f
+
+    def check_energy(self, samples: SamplesT) -> bool:
+        """Cheap first stage of detection which returns False if *samples*
+        clearly contain no beep
+
+        The power of each :attr:`fft_size` frame is estimated from every
+        :attr:`gate_stride` sample and compared to the running noise power.
+        Since a frame's power estimate from noise alone has a relative standard
+        deviation of ``1 / sqrt(n)`` (for ``n`` samples), the threshold is set
+        :attr:`gate_sigma` deviations above the noise.
+        """
+        fft_size = self.fft_size
+        num_frames = len(samples) // fft_size
+        if not self.adaptive or not self.gate_enabled or num_frames == 0:
+            return True
+        frames = samples[:num_frames*fft_size].reshape(num_frames, fft_size)
+        frames = frames[:,::self.gate_stride]
+        # `real` and `imag` are views, so nothing is copied
+        re, im = frames.real, frames.imag
+        power = np.einsum('ij,ij->i', re, re) + np.einsum('ij,ij->i', im, im)
+        noise = self._gate_noise.update(float(np.median(power)))
+        n = frames.shape[1]
+        return bool(np.max(power) > noise * (1 + self.gate_sigma / np.sqrt(n)))
+
+    def detect_beeps(self, samples: SamplesT) -> DetectionResult:
+        """Look for the presence of a beep within *samples*
+
+        The samples are split into frames of :attr:`fft_size` (any remainder
+        is ignored) and a single FFT is computed across all of them.
+        """
+        fft_size = self.fft_size
+        num_ffts = len(samples) // fft_size # // is an integer division which rounds down
+        frames = samples[:num_ffts*fft_size].reshape(num_ffts, fft_size)
+        fft = np.abs(get_backend().fft(frames, axis=1))
+        fft /= fft_size
+        peak_idx = np.argmax(fft, axis=1)
+        peak_mags = np.take_along_axis(fft, peak_idx[:,np.newaxis], axis=1)[:,0]
+
+        # The peak was found on the unshifted spectrum, so convert the
+        # indices to their location after `fftshift`
+        peak_bins = (peak_idx + fft_size // 2) % fft_size
+        # Most frames contain only noise, so their median peak tracks the
+        # noise floor
+        if len(peak_mags):
+            self._detect_noise.update(float(np.median(peak_mags)))
+        return DetectionResult(
+            peak_bins=peak_bins,
+            peak_mags=peak_mags,
+            peak_freqs=self.fft_freqs[peak_bins],
+            threshold=self.detect_threshold,
+        )
+
+    def _detect_beeps_loop(self, samples: SamplesT) -> tuple[list[float], FloatArray]:
+        """Frame-by-frame version of :meth:`detect_beeps`
+
+        This is kept as a reference for :attr:`~.common.ProcessConfig.batch_detection`
+        being disabled and for benchmarking
+
+        Returns:
+            The peak frequencies of the frames containing a beep (as in
+            :attr:`.DetectionResult.beep_freqs`) and the peak magnitude of
+            every frame (as in :attr:`.DetectionResult.peak_mags`)
+        """
+        fft_size = self.fft_size
+        f = self.fft_freqs
+        num_ffts = len(samples) // fft_size
+        peaks = []
+        for i in range(num_ffts):
+            fft = np.abs(np.fft.fftshift(get_backend().fft(samples[i*fft_size:(i+1)*fft_size]))) / fft_size
+            peaks.append((np.max(fft), f[np.argmax(fft)]))
+        if len(peaks):
+            self._detect_noise.update(float(np.median([mag for mag, _ in peaks])))
+        threshold = self.detect_threshold
+        peak_mags = np.array([mag for mag, _ in peaks])
+        return [freq for mag, freq in peaks if mag > threshold], peak_mags
+
+    def process(self, samples: SamplesT) -> list[BeepEvent]:
         
         # look for the presence of a beep within the chunk and :
         # (1) if beep found calculate the offset
         # (2) if beep not found iterate the counters and move on
 
-        start_time = time.time()
-        fft_size = self.fft_size
-        f = np.linspace(self.sample_rate/-2, self.sample_rate/2, fft_size)
-        num_ffts = len(samples) // fft_size # // is an integer division which rounds down
-        fft_thresh = 0.1
-        beep_freqs = []
-        for i in range(num_ffts):
-            fft = np.abs(np.fft.fftshift(np.fft.fft(samples[i*fft_size:(i+1)*fft_size]))) / fft_size
-            if np.max(fft) > fft_thresh:
-                beep_freqs.append(np.linspace(self.sample_rate/-2, self.sample_rate/2, fft_size)[np.argmax(fft)])
-        finish_time = time.time()
+        # Reject chunks with no more energy than the noise before doing
+        # any FFTs (unless a beep from the last chunk still needs its
+        # falling edge)
+        self.stats.increment('chunks')
+        with self.stats.stage('gate'):
+            candidate = self.check_energy(samples)
+        audit = False
+        if not candidate and not self.beep_pending:
+            self._gate_rejects += 1
+            audit = self._gate_rejects % self.gate_audit_interval == 0
+            if not audit:
+                self.stats.increment('gate_rejected')
+                self.skip(samples.size)
+                return []
+
+        with self.stats.stage('detect'):
+            if self.config.batch_detection:
+                result = self.detect_beeps(samples)
+                if self.probe is not None:
+                    self.probe.add_detection(self, samples, result)
+                beep_freqs, peak_mags = result.beep_freqs, result.peak_mags
+            else:
+                beep_freqs, peak_mags = self._detect_beeps_loop(samples)
+            if len(beep_freqs):
+                self.update_beep_level(float(np.max(peak_mags)))
 
         # if not beeps increment and exit early
-        if len(beep_freqs) == 0:
-            self.stateful_index += (samples.size/100) + 14
-            return
-        
-        #plt.plot(f,fft)
-        # print(beep_freqs)
-        # #plt.show()
-
-        t = self.time_array
-        samples = samples * self.phasor
-        # next two lines are band pass filter?
-        h = self.fir
-        samples = signal.convolve(samples, h, 'valid')
-        # decimation
-        samples = samples[::100]
-        # recalculation of sample rate due to decimation
-        sample_rate = self.sample_rate/100
-        samples_for_snr = samples
-        samples = np.abs(samples)
+        # (unless a beep from the last chunk still needs its falling edge)
+        if audit and len(beep_freqs):
+            self.stats.increment('gate_missed')
+            self.gate_enabled = False
+        if len(beep_freqs) == 0 and not self.beep_pending:
+            self.stats.increment('detect_rejected')
+            self.skip(samples.size)
+            return []
+        self.stats.increment('escalated')
+
+        with self.stats.stage('mix'):
+            samples = self.mixer.process(samples)
+        # filter and decimate
+        with self.stats.stage('decimate'):
+            samples = self.decimator.process(samples)
+        return self.process_decimated(samples, self.decimated_rate)
+
+    def _reset_edge_state(self):
+        self._smooth_zi = np.zeros(self.smoothing_len - 1, dtype=self.config.real_dtype)
+        self._last_high = False
+        self._rising_edge: int|None = None
+        self._history: SamplesT = np.zeros(0, dtype=self.config.dtype)
+
+    def seek(self, sample_index: int):
+        """Set the position of the next chunk to *sample_index* (in
+        samples at the input rate) and reset the processing state
+
+        *sample_index* must be a multiple of the decimation factor.
+        """
+        factor = self.decimator.factor
+        if sample_index % factor != 0:
+            raise ValueError(f'sample_index must be a multiple of {factor}')
+        self._decimator = None
+        self.mixer.seek(sample_index)
+        self.stateful_index = sample_index // factor
+        self.stateful_rising_edge = None
+        self._reset_edge_state()
+
+    def skip(self, num_samples: int):
+        """Advance past *num_samples* (at the input rate) without processing
+        them, such as those dropped by an overrun
+
+        Any beep in progress is abandoned.
+        """
+        self.mixer.skip(num_samples)
+        self.skip_decimated(self.decimator.skip(num_samples))
+
+    def skip_decimated(self, num_samples: int):
+        """Advance :attr:`stateful_index` by *num_samples* without processing
+
+        Any edge detection state carried from the previous chunk is cleared.
+        """
+        self.stateful_index += num_samples
+        self._reset_edge_state()
+
+    def process_decimated(self, samples: SamplesT, sample_rate: float) -> list[BeepEvent]:
+        """Find the beeps within a chunk of samples that have already been
+        mixed down to baseband, filtered and decimated
+
+        The smoothing filter and edge state are kept between calls, so beeps
+        that straddle the boundary between two chunks are still found.
+
+        Arguments:
+            samples: The decimated samples
+            sample_rate: Sample rate of the decimated samples
+
+        Returns:
+            A :class:`BeepEvent` for each beep whose falling edge was found
+        """
+        events: list[BeepEvent] = []
+        if samples.size == 0:
+            return events
+        start_time = time.perf_counter()
+        n = self.smoothing_len
         # smoothing
-        samples = signal.convolve(samples, [1]*10, 'valid')/10
-        # max_samp = np.max(samples)
-
-        # samples /= np.max(samples)
-        #plt.plot(samples)
-        #plt.show()
-
-        # Get a boolean array for all samples higher or lower than the threshold
-        low_samples = samples < self.threshold
-        high_samples = samples >= self.threshold
-
-        # Compute the rising edge and falling edges by comparing the current value to the next with
-        # the boolean operator & (if both are true the result is true) and converting this to an index
-        # into the current array
-        rising_edge_idx = np.nonzero(low_samples[:-1] & np.roll(high_samples, -1)[:-1])[0]
-        falling_edge_idx = np.nonzero(high_samples[:-1] & np.roll(low_samples, -1)[:-1])[0]
-
-        if len(rising_edge_idx) == 0 or len(falling_edge_idx) == 0:
-            self.stateful_index += samples.size + 14
-            return
-        #print(f"passed len test for idx's")
-        if rising_edge_idx[0] > falling_edge_idx[0]:
-            falling_edge_idx = falling_edge_idx[1:]
-
-        # Remove stray rising edge at the end
-        if rising_edge_idx[-1] > falling_edge_idx[-1]:
-            rising_edge_idx = rising_edge_idx[:-1]
-
-        # rising_edge_diff = np.diff(rising_edge_idx)
-        # time_between_rising_edge = sample_rate / rising_edge_diff * 60
-
-        # pulse_widths = falling_edge_idx - rising_edge_idx
-        # rssi_idxs = list(np.arange(r, r + p) for r, p in zip(rising_edge_idx, pulse_widths))
-        # rssi = [np.mean(samples[r]) * max_samp for r in rssi_idxs]
-
-        # for t, r in zip(time_between_rising_edge, rssi):
-        #     print(f"BPM: {t:.02f}")
-        #     print(f"rssi: {r:.02f}")
-        # self.stateful_index += len(samples)
-        # print(f"stateful index : {self.stateful_index}")
-
-        #print(f"stateful rising edge : {self.stateful_rising_edge}")
-        #print(f" samples size : {samples.size}")
-        #print(f"rising edge idx [0] : {rising_edge_idx[0]}")
-        #print(f" stateful index : {self.stateful_index}")
-        #print("*****************************************")
-
-        samples_between =  (rising_edge_idx[0]+self.stateful_index) - self.stateful_rising_edge
-        time_between = 1/sample_rate * samples_between
-        BPM = 60 / time_between
-        self.stateful_rising_edge = self.stateful_index + rising_edge_idx[0]
-        SNR = snr(samples_for_snr, rising_edge_idx[0]-5, falling_edge_idx[0]+5)
-        BEEP_DURATION = (falling_edge_idx[0]-rising_edge_idx[0]) / sample_rate
-        
-        print(f" BPM : {BPM: 5.2f} |  SNR : {SNR: 5.2f}  | BEEP_DURATION : {BEEP_DURATION: 5.4f} sec")
+        real_dtype = self._smooth_zi.dtype
+        smoothed, self._smooth_zi = signal.lfilter(
+            np.full(n, 1/n, dtype=real_dtype), real_dtype.type(1), np.abs(samples),
+            zi=self._smooth_zi,
+        )
+        # Beeps are short compared to a chunk, so the median follows the
+        # noise floor
+        self._edge_noise.update(float(np.median(smoothed)))
+        if self.probe is not None:
+            self.probe.add_smoothed(self, smoothed, sample_rate)
+
+        # Get a boolean array for all samples higher than the threshold and
+        # find where it changes state (including from the end of the last chunk)
+        high_samples = smoothed >= self.edge_threshold
+        edge_idx = np.flatnonzero(np.diff(high_samples, prepend=self._last_high))
+        self._last_high = bool(high_samples[-1])
+
+        # The complex samples from this chunk and the one before it (used to
+        # calculate the SNR)
+        samples_for_snr = np.concatenate((self._history, samples))
+        snr_start = self.stateful_index - self._history.size
+        self._history = samples
+
+        for idx in edge_idx:
+            # Subtract the moving average delay to get the edge index
+            # within the unsmoothed samples (which can't be before the
+            # start of the stream)
+            edge = max(self.stateful_index + int(idx) - n, 0)
+            if high_samples[idx]:
+                self._rising_edge = edge
+                continue
+            rising_edge = self._rising_edge
+            if rising_edge is None:
+                continue
+            self._rising_edge = None
+            falling_edge = edge
+            if (falling_edge - rising_edge) / sample_rate < self.beep_duration / 2:
+                # Too short to be a beep (noise crossing the threshold)
+                continue
+
+            BPM = calculate_bpm(rising_edge, self.stateful_rising_edge, sample_rate)
+            self.stateful_rising_edge = rising_edge
+            SNR = snr(
+                samples_for_snr,
+                max(rising_edge - snr_start - 5, 0),
+                falling_edge - snr_start + 5,
+            )
+            BEEP_DURATION = (falling_edge - rising_edge) / sample_rate
+
+            event = BeepEvent(
+                index=rising_edge, sample_rate=sample_rate, bpm=BPM, snr=float(SNR),
+                duration=BEEP_DURATION, channel=self.channel,
+                carrier_freq=self.carrier_freq,
+            )
+            if self.verbose:
+                print(event)
+            events.append(event)
+
         # increment sample count
-        self.stateful_index += samples.size + 14
+        self.stateful_index += samples.size
+        self.stats.stage('edge').add(time.perf_counter() - start_time)
+        return events
@@ -1,44 +1,87 @@
 from __future__ import annotations
-from typing import Self, TypeAlias, TYPE_CHECKING
+from typing import Any, Iterator, Self, TextIO, TYPE_CHECKING
+from dataclasses import dataclass
 import argparse
 import asyncio
-import concurrent.futures
+import collections
+import contextlib
+import dataclasses
+import enum
+import sys
+import threading
 import numpy as np
-import rtlsdr
-
-RtlSdr: TypeAlias = rtlsdr.rtlsdraio.RtlSdrAio
-
+import numpy.typing as npt
 import time
 
 from kiwitracker.common import SamplesT, SampleConfig, ProcessConfig
-from kiwitracker.sample_processor import SampleProcessor
+from kiwitracker.channelizer import ChannelizerProcessor, make_processor
+from kiwitracker.capture import CaptureHeader, CaptureWriter, CaptureFile
+from kiwitracker.offline import run_offline
+from kiwitracker.stats import PipelineStats, StatsWriter
+from kiwitracker.chicktimer import ChickTimerDecoder
+from kiwitracker.sample_processor import SampleProcessor, BeepEvent
+from kiwitracker.scan import ScanScheduler, ScanResult
+from kiwitracker.sink import SqliteSink
+from kiwitracker.simulated import Simulation, SimulatedSdr
+from kiwitracker.rawiq import RAW_IQ_DTYPE, RawIQT, is_raw_iq, num_samples, convert_raw_iq
+from kiwitracker.recorder import TriggeredRecorder
+from kiwitracker.eventbus import EventBus
+from kiwitracker import fftbackend
+
+if TYPE_CHECKING:
+    from rtlsdr.rtlsdraio import RtlSdrAio as RtlSdr
+
+
+def import_rtlsdr() -> type[RtlSdr]:
+    """Import :mod:`rtlsdr` and get its :class:`~rtlsdr.rtlsdraio.RtlSdrAio` class
+
+    This is only done once a device is opened, so processing recordings
+    (and starting worker processes) doesn't pay for loading the driver and
+    libusb.
+    """
+    from rtlsdr.rtlsdraio import RtlSdrAio
+    return RtlSdrAio
+
+
+def __getattr__(name: str) -> Any:
+    if name == 'RtlSdr':
+        return import_rtlsdr()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 class SampleReader:
     sample_config: SampleConfig
 
-    sdr: RtlSdr|None = None
-    """RtlSdr instance"""
+    sdr: RtlSdr|SimulatedSdr|None = None
+    """RtlSdr instance (or a :class:`~.simulated.SimulatedSdr` if
+    :attr:`~.common.SampleConfig.simulation` is set)
+    """
 
     aio_qsize: int = 100
 
+    stats: PipelineStats
+    """Counters for the samples read, buffer depth and overruns"""
+
     def __init__(
         self,
         sample_config: SampleConfig,
-        buffer: SampleBuffer|None = None
+        buffer: SampleBuffer|None = None,
+        stats: PipelineStats|None = None
     ):
         self.sample_config = sample_config
         self._buffer = buffer
+        if stats is None:
+            stats = PipelineStats(sample_config.sample_rate)
+        self.stats = stats
         self._running_sync = False
         self._running_async = False
-        self.aio_queue: asyncio.Queue[SamplesT|None] = asyncio.Queue(maxsize=self.aio_qsize)
+        self.aio_queue: asyncio.Queue[SamplesT|RawIQT|None] = asyncio.Queue(maxsize=self.aio_qsize)
         self._read_future: asyncio.Future|None = None
         self._aio_streaming = False
         self._aio_loop: asyncio.AbstractEventLoop|None = None
-        self._callback_tasks: set[asyncio.Task] = set()
-        self._callback_futures: set[concurrent.futures.Future] = set()
-        self._wrapped_futures: set[asyncio.Future] = set()
-        self._cleanup_task: asyncio.Task|None = None
+        self._pending_chunks: collections.deque[SamplesT|RawIQT] = collections.deque()
+        self._drain_scheduled = False
+        self._drain_lock = threading.Lock()
 
     @property
     def sample_rate(self): return self.sample_config.sample_rate
@@ -52,6 +95,16 @@ class SampleReader:
     @property
     def gain(self): return self.sample_config.gain
 
+    @property
+    def dtype(self): return self.sample_config.dtype
+
+    @property
+    def raw_iq(self) -> bool:
+        """True if raw bytes are read from the device (see
+        :attr:`.SampleConfig.raw_iq`)
+        """
+        config = self.sample_config
+        return config.raw_iq and config.simulation is None
 
     @property
     def gain_values_db(self) -> list[float]:
@@ -79,12 +132,15 @@ class SampleReader:
         self._ensure_sync()
         if self.sdr is None:
             raise RuntimeError('SampleReader not open')
+        if self.raw_iq:
+            raw = np.frombuffer(self.sdr.read_bytes(self.num_samples * 2), dtype=RAW_IQ_DTYPE)
+            return convert_raw_iq(raw, dtype=self.dtype)
         samples = self.sdr.read_samples(self.num_samples)
         if TYPE_CHECKING:
             # This is just because `read_samples()`` can return a list
             # if numpy isn't installed
             assert isinstance(samples, np.ndarray)
-        return samples
+        return samples.astype(self.dtype, copy=False)
 
     async def open_stream(self):
         self._ensure_async()
@@ -96,14 +152,52 @@ class SampleReader:
         loop = asyncio.get_running_loop()
         self._aio_loop = loop
         self._aio_streaming = True
-        fut = loop.run_in_executor(
-            None,
-            self.sdr.read_samples_async,
-            self._async_callback,
-            self.num_samples,
-        )
+        if self.raw_iq:
+            fut = loop.run_in_executor(
+                None,
+                self.sdr.read_bytes_async,
+                self._async_bytes_callback,
+                self.num_samples * 2,
+            )
+        else:
+            fut = loop.run_in_executor(
+                None,
+                self.sdr.read_samples_async,
+                self._async_callback,
+                self.num_samples,
+            )
         self._read_future = asyncio.ensure_future(fut)
-        self._cleanup_task = asyncio.create_task(self._bg_task_loop())
+
+    @property
+    def stream_finished(self) -> bool:
+        """True if the stream was opened and the device has stopped sending
+        samples (such as at the end of a simulation)
+        """
+        fut = self._read_future
+        return fut is not None and fut.done()
+
+    async def get_window(
+        self,
+        count: int,
+        poll_interval: float = 1,
+        out: SamplesT|None = None
+    ) -> SamplesT|None:
+        """Get *count* samples from the :attr:`buffer` (copied into *out* if
+        given, as in :meth:`SampleBuffer.get`)
+
+        Returns ``None`` once :attr:`stream_finished` is True and fewer than
+        *count* samples remain (checked every *poll_interval* seconds while
+        waiting).
+        """
+        buffer = self.buffer
+        if buffer is None:
+            raise RuntimeError('buffer is not set')
+        while True:
+            try:
+                return await buffer.get(count, timeout=poll_interval, out=out)
+            except asyncio.QueueEmpty:
+                if self.stream_finished:
+                    return None
 
     async def close_stream(self):
         if not self._aio_streaming:
@@ -111,10 +205,6 @@ class SampleReader:
         self._aio_streaming = False
         if self.sdr is not None:
             self.sdr.cancel_read_async()
-        t = self._cleanup_task
-        self._cleanup_task = None
-        if t is not None:
-            await t
         t = self._read_future
         self._read_future = None
         if t is not None:
@@ -129,58 +219,70 @@ class SampleReader:
                 self.aio_queue.task_done()
             except asyncio.QueueEmpty:
                 break
+        self._pending_chunks.clear()
         await self.aio_queue.put(None)
-        self._wrap_futures()
-        if len(self._wrapped_futures):
-            await asyncio.gather(*self._wrapped_futures)
 
 
     def _async_callback(self, samples: SamplesT, *args):
+        # NOTE: This is called from the thread running `read_samples_async()`
         if not self._aio_streaming:
             return
+        self._handle_chunk(samples.astype(self.dtype, copy=False))
 
-        async def add_to_queue(samples: SamplesT):
-            q = self.buffer if self.buffer is not None else self.aio_queue
+    def _async_bytes_callback(self, data, *args):
+        # NOTE: This is called from the thread running `read_bytes_async()`.
+        #       `data` is the device's own buffer, which is reused once this
+        #       returns
+        if not self._aio_streaming:
+            return
+        raw = np.frombuffer(data, dtype=RAW_IQ_DTYPE)
+        if self.buffer is None:
+            raw = raw.copy()
+        self._handle_chunk(raw)
+
+    def _handle_chunk(self, samples: SamplesT|RawIQT):
+        buffer = self.buffer
+        if buffer is not None:
+            # The buffer is written to directly from this thread
+            sample_size = num_samples(samples)
             try:
-                if self.buffer is None:
-                    self.aio_queue.put_nowait(samples)
-                else:
-                    await self.buffer.put_nowait(samples)
+                dropped = buffer.put_threadsafe(samples)
             except asyncio.QueueFull:
-                print(f'buffer overrun: {q.qsize()=}')
-
-        if self._aio_loop is None:
+                self.stats.record_overrun(sample_size)
+            else:
+                if dropped:
+                    self.stats.record_dropped(dropped)
+                self.stats.record_read(sample_size, len(buffer))
             return
-        fut = asyncio.run_coroutine_threadsafe(
-            add_to_queue(samples),
-            self._aio_loop,
-        )
-        self._callback_futures.add(fut)
-
-    def _wrap_futures(self):
-        fut: concurrent.futures.Future
-        for fut in self._callback_futures.copy():
-            self._wrapped_futures.add(asyncio.wrap_future(fut))
-            self._callback_futures.discard(fut)
-
-    async def _wait_for_futures(self, timeout: float = .01):
-        done: set[asyncio.Future]
-        done, pending = await asyncio.wait(
-            self._wrapped_futures,
-            timeout=timeout,
-            return_when=asyncio.FIRST_COMPLETED,
-        )
 
-        for fut in done:
-            self._wrapped_futures.discard(fut)
-
-    async def _bg_task_loop(self):
-        while self._aio_streaming:
-            self._wrap_futures()
-            if len(self._wrapped_futures):
-                await self._wait_for_futures()
-            if not len(self._wrapped_futures) and not len(self._callback_futures):
-                await asyncio.sleep(.1)
+        # Otherwise hand the chunk to the event loop for `aio_queue`,
+        # scheduling a single call for any chunks that arrive before it runs
+        loop = self._aio_loop
+        if loop is None:
+            return
+        with self._drain_lock:
+            self._pending_chunks.append(samples)
+            if self._drain_scheduled:
+                return
+            self._drain_scheduled = True
+        loop.call_soon_threadsafe(self._drain_pending)
+
+    def _drain_pending(self):
+        # Move chunks from the callback thread into `aio_queue` (within the
+        # event loop)
+        with self._drain_lock:
+            self._drain_scheduled = False
+            chunks = list(self._pending_chunks)
+            self._pending_chunks.clear()
+        for samples in chunks:
+            try:
+                self.aio_queue.put_nowait(samples)
+            except asyncio.QueueFull:
+                self.stats.record_overrun(num_samples(samples))
+            else:
+                self.stats.record_read(
+                    num_samples(samples), self.aio_queue.qsize() * self.num_samples,
+                )
 
 
     def _ensure_sync(self):
@@ -200,11 +302,7 @@ class SampleReader:
 
     def _open(self):
         assert self.sdr is None
-        if TYPE_CHECKING:
-            # NOTE: Another workaround for the above TYPE_CHECKING stuff
-            #       (just ignore for now)
-            assert RtlSdr is not None
-        sdr = self.sdr = RtlSdr()
+        sdr = self.sdr = self._create_sdr()
         sdr.sample_rate = self.sample_rate
         sdr.center_freq = self.center_freq
         sdr.gain = self.gain
@@ -215,6 +313,15 @@ class SampleReader:
         print(f'{sdr.sample_rate=}, {sdr.center_freq=}, {sdr.gain=}')
         print(f'{self.gain_values_db=}')
 
+    def _create_sdr(self) -> RtlSdr|SimulatedSdr:
+        config = self.sample_config
+        if config.simulation is not None:
+            return SimulatedSdr(config.simulation)
+        sdr_class = import_rtlsdr()
+        if config.serial_number is not None:
+            return sdr_class(serial_number=config.serial_number)
+        return sdr_class(device_index=config.device_index)
+
     def close(self):
         """Close the device if it's currently open
         """
@@ -262,7 +369,9 @@ class SampleReader:
     async def __aexit__(self, *args):
         await self.aclose()
 
-    async def __anext__(self) -> SamplesT:
+    async def __anext__(self) -> SamplesT|RawIQT:
+        # Chunks are raw bytes if `raw_iq` is set (so they can be recorded
+        # without converting them)
         if not self._aio_streaming:
             raise StopAsyncIteration
         if self.buffer is not None:
@@ -280,11 +389,62 @@ class SampleReader:
 
 
 
+class OverrunPolicy(enum.Enum):
+    """What :meth:`SampleBuffer.put_threadsafe` does when the buffer is full
+    """
+
+    DROP_NEWEST = 'drop-newest'
+    """Discard the incoming samples"""
+
+    DROP_OLDEST = 'drop-oldest'
+    """Discard the oldest samples in the buffer to make room"""
+
+    BLOCK = 'block'
+    """Wait up to :attr:`SampleBuffer.block_timeout` for room, then discard
+    the incoming samples
+    """
+
+
+@dataclass
+class Gap:
+    """A run of samples dropped by a :class:`SampleBuffer`
+    """
+
+    position: int
+    """Index (from the start of the stream) of the first dropped sample"""
+
+    count: int
+    """Number of samples dropped"""
+
+    offset: int = 0
+    """Index within the samples returned by :meth:`SampleBuffer.get` that
+    the gap comes before (see :attr:`SampleBuffer.last_gaps`)
+    """
+
+
 class SampleBuffer:
     """Buffer for samples with thread-safe reads and writes
 
     Behavior is similar to :class:`queue.Queue`, with the exception of
     the ``task_done()`` and ``join()`` methods (which are not present).
+
+    Samples are stored in a preallocated ring buffer. For a bounded buffer
+    (:attr:`maxsize` greater than zero), the storage is allocated at twice
+    :attr:`maxsize` so the arrays returned by :meth:`get` can be views into
+    it. These views remain valid until the next call to :meth:`get`. With
+    :attr:`OverrunPolicy.DROP_OLDEST`, writes can overtake the last read, so
+    :meth:`get` always returns a copy instead.
+
+    The ring indices are guarded by a :class:`threading.Lock` that is only
+    held while copying, so :meth:`put_threadsafe` can write directly from
+    another thread (such as the sdr's callback). Waiting coroutines are woken
+    with a single :meth:`~asyncio.loop.call_soon_threadsafe` call per batch of
+    writes rather than one per write.
+
+    Samples dropped by :meth:`put_threadsafe` (according to the
+    :attr:`overrun_policy`) are recorded as :class:`Gap` objects. After each
+    :meth:`get`, :attr:`last_gaps` has any gaps within (or just before) the
+    returned samples so the stream position of every sample is known.
     """
 
     maxsize: int
@@ -292,12 +452,247 @@ class SampleBuffer:
     buffer length is infinite
     """
 
-    def __init__(self, maxsize: int = 0) -> None:
+    initial_capacity: int = 2 ** 20
+    """Number of samples to initially allocate if :attr:`maxsize` is not set
+    (the storage will grow as needed)
+    """
+
+    overrun_policy: OverrunPolicy
+    """What :meth:`put_threadsafe` does when the buffer is full"""
+
+    block_timeout: float
+    """Maximum time (in seconds) :meth:`put_threadsafe` waits for room with
+    :attr:`OverrunPolicy.BLOCK`
+    """
+
+    last_gaps: list[Gap]
+    """Gaps within the samples returned by the last call to :meth:`get`
+    (with :attr:`Gap.offset` relative to them)
+    """
+
+    last_position: int
+    """Stream index of the first sample returned by the last call to
+    :meth:`get` (after any gap at its start)
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        dtype: npt.DTypeLike = np.complex128,
+        overrun_policy: OverrunPolicy|str = OverrunPolicy.DROP_NEWEST,
+        block_timeout: float = 0.1
+    ) -> None:
         self.maxsize = maxsize
-        self._samples: SamplesT = np.zeros(0, dtype=np.complex128)
-        self._lock: asyncio.Lock = asyncio.Lock()
-        self._notify_w = asyncio.Condition(self._lock)
-        self._notify_r = asyncio.Condition(self._lock)
+        self.overrun_policy = OverrunPolicy(overrun_policy)
+        self.block_timeout = block_timeout
+        capacity = maxsize * 2 if maxsize > 0 else self.initial_capacity
+        self._storage: SamplesT = np.zeros(capacity, dtype=dtype)
+        self._read_index = 0
+        self._size = 0
+        self._mutex = threading.Lock()
+        self._space_cond = threading.Condition(self._mutex)
+        # Stream positions of the next sample to be written and read
+        self._write_position = 0
+        self._read_position = 0
+        self._gaps: collections.deque[Gap] = collections.deque()
+        self.last_gaps = []
+        self.last_position = 0
+        self._loop: asyncio.AbstractEventLoop|None = None
+        self._wakeup_pending = False
+        self._data_event = asyncio.Event()
+        self._space_event = asyncio.Event()
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Data type of the stored samples"""
+        return self._storage.dtype
+
+    @property
+    def read_position(self) -> int:
+        """Stream index of the next sample to be read (counting any dropped
+        samples before it)
+        """
+        return self._read_position
+
+    @property
+    def capacity(self) -> int:
+        """Number of samples currently allocated for storage"""
+        return self._storage.size
+
+    @property
+    def _views_safe(self) -> bool:
+        # Whether a view returned by `get()` is left alone until the next
+        # read. Dropping the oldest samples moves the read index forward
+        # (by up to maxsize), so new writes could land on the view.
+        return self.maxsize > 0 and self.overrun_policy != OverrunPolicy.DROP_OLDEST
+
+    def _grow(self, min_capacity: int):
+        capacity = max(self.capacity * 2, min_capacity)
+        storage = np.zeros(capacity, dtype=self._storage.dtype)
+        self._copy_out(self._size, storage[:self._size])
+        self._storage = storage
+        self._read_index = 0
+
+    def _can_write(self, sample_size: int) -> bool:
+        if self.maxsize <= 0:
+            return True
+        return len(self) < self.maxsize - sample_size
+
+    def _write(self, samples: SamplesT|RawIQT):
+        sample_size = num_samples(samples)
+        if self._size + sample_size > self.capacity:
+            # Only possible if maxsize is not set
+            self._grow(self._size + sample_size)
+        capacity = self.capacity
+        start = (self._read_index + self._size) % capacity
+        first = min(sample_size, capacity - start)
+        storage = self._storage
+        if is_raw_iq(samples):
+            # Convert straight into the storage
+            convert_raw_iq(samples[:first*2], out=storage[start:start+first])
+            if first < sample_size:
+                convert_raw_iq(samples[first*2:], out=storage[:sample_size-first])
+        else:
+            storage[start:start+first] = samples[:first]
+            if first < sample_size:
+                storage[:sample_size-first] = samples[first:sample_size]
+        self._size += sample_size
+        self._write_position += sample_size
+
+    def _drop_newest(self, count: int):
+        # Record `count` samples as dropped at the current write position
+        gaps = self._gaps
+        if gaps and gaps[-1].position + gaps[-1].count == self._write_position:
+            gaps[-1].count += count
+        else:
+            gaps.append(Gap(self._write_position, count))
+        self._write_position += count
+
+    def _advance(self, count: int) -> list[Gap]:
+        # Move the read position past `count` stored samples (and any gaps
+        # between them), returning those gaps with their offsets set
+        position = self._read_position
+        gaps = self._gaps
+        result = []
+        offset = 0
+        # A gap immediately after the last sample is left for the next read
+        while gaps and gaps[0].position - position < count - offset:
+            gap = gaps.popleft()
+            offset += gap.position - position
+            result.append(dataclasses.replace(gap, offset=offset))
+            position = gap.position + gap.count
+        self._read_position = position + count - offset
+        self._read_index = (self._read_index + count) % self.capacity
+        self._size -= count
+        self._space_cond.notify_all()
+        return result
+
+    def _drop_oldest(self, count: int):
+        # Discard the oldest `count` stored samples, merging them and any
+        # gaps they contain into one gap
+        start = self._read_position
+        self._advance(count)
+        end = self._read_position
+        gaps = self._gaps
+        if gaps and gaps[0].position == end:
+            end += gaps.popleft().count
+        gaps.appendleft(Gap(start, end - start))
+        # The next read begins with the gap
+        self._read_position = start
+
+    def _try_write(self, samples: SamplesT|RawIQT) -> bool:
+        with self._mutex:
+            if not self._can_write(num_samples(samples)):
+                return False
+            self._write(samples)
+            return True
+
+    def _copy_out(self, count: int, out: SamplesT):
+        start = self._read_index
+        first = min(count, self.capacity - start)
+        out[:first] = self._storage[start:start+first]
+        if first < count:
+            out[first:count] = self._storage[:count-first]
+
+    def _read(self, count: int, out: SamplesT|None) -> SamplesT:
+        start = self._read_index
+        if out is not None:
+            self._copy_out(count, out)
+            samples = out
+        elif self._views_safe and start + count <= self.capacity:
+            samples = self._storage[start:start+count]
+        else:
+            samples = np.empty(count, dtype=self._storage.dtype)
+            self._copy_out(count, samples)
+        first_position = self._read_position
+        gaps = self._advance(count)
+        if gaps and gaps[0].offset == 0:
+            first_position = gaps[0].position + gaps[0].count
+        self.last_gaps = gaps
+        self.last_position = first_position
+        return samples
+
+    def _try_read(self, count: int, out: SamplesT|None) -> SamplesT|None:
+        with self._mutex:
+            if len(self) < count:
+                return None
+            return self._read(count, out)
+
+    def _wakeup(self):
+        # Called within the event loop after one or more writes from
+        # `put_threadsafe()`
+        with self._mutex:
+            self._wakeup_pending = False
+        self._data_event.set()
+
+    async def _wait(self, event: asyncio.Event, timeout: float|None):
+        # Wait for `event` to be set by the other side. The caller re-checks
+        # its condition afterwards since another waiter may have been first.
+        event.clear()
+        async with asyncio.timeout(timeout):
+            await event.wait()
+
+    def put_threadsafe(self, samples: SamplesT|RawIQT) -> int:
+        """Append new samples to the end of the buffer from any thread
+        (other than the event loop's)
+
+        *samples* may also be raw bytes from the sdr (see :mod:`~.rawiq`),
+        which are converted directly into the buffer's storage.
+
+        If there is not enough space, the :attr:`overrun_policy` is applied
+        and the dropped samples are recorded as a :class:`Gap`.
+
+        Returns:
+            The number of older samples dropped to make room (with
+            :attr:`OverrunPolicy.DROP_OLDEST`)
+
+        Raises:
+            QueueFull: If the new samples were dropped
+        """
+        sample_size = num_samples(samples)
+        dropped = 0
+        with self._mutex:
+            if not self._can_write(sample_size):
+                policy = self.overrun_policy
+                if policy == OverrunPolicy.BLOCK:
+                    self._space_cond.wait_for(
+                        lambda: self._can_write(sample_size), self.block_timeout,
+                    )
+                elif policy == OverrunPolicy.DROP_OLDEST and sample_size < self.maxsize:
+                    dropped = self._size - (self.maxsize - sample_size - 1)
+                    self._drop_oldest(dropped)
+                if not self._can_write(sample_size):
+                    self._drop_newest(sample_size)
+                    raise asyncio.QueueFull()
+            self._write(samples)
+            loop = self._loop
+            if loop is None or self._wakeup_pending:
+                # Either nothing has waited yet or a wakeup is already
+                # scheduled that will see these samples
+                return dropped
+            self._wakeup_pending = True
+        loop.call_soon_threadsafe(self._wakeup)
+        return dropped
 
     async def put(
         self,
@@ -319,24 +714,17 @@ class SampleBuffer:
         Raises:
             QueueFull: If a timeout occurs waiting for available write space
         """
-
-        async with self._lock:
-            sample_size = samples.size
-            def can_write():
-                return len(self) < self.maxsize - sample_size
-            if not can_write():
-                if not block:
-                    raise asyncio.QueueFull()
-                if timeout is not None:
-                    try:
-                        async with asyncio.timeout(timeout):
-                            await self._notify_w.wait_for(can_write)
-                    except asyncio.TimeoutError:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        try:
+            async with asyncio.timeout(timeout):
+                while not self._try_write(samples):
+                    if not block:
                         raise asyncio.QueueFull()
-                else:
-                    await self._notify_w.wait_for(can_write)
-            self._samples = np.concatenate((self._samples, samples))
-            self._notify_r.notify_all()
+                    await self._wait(self._space_event, None)
+        except asyncio.TimeoutError:
+            raise asyncio.QueueFull()
+        self._data_event.set()
 
     async def put_nowait(self, samples: SamplesT):
         """Equivalent to ``put(samples, block=False)``
@@ -347,7 +735,8 @@ class SampleBuffer:
         self,
         count: int,
         block: bool = True,
-        timeout: float|None = None
+        timeout: float|None = None,
+        out: SamplesT|None = None
     ) -> SamplesT:
         """Get *count* number of samples and remove them from the buffer
 
@@ -359,33 +748,34 @@ class SampleBuffer:
         Otherwise (if *block* is False), return the samples if immediately
         available (raising :class:`~asyncio.QueueEmpty`) if necessary)
 
+        If *out* is given, the samples are copied into it and it is returned.
+        Otherwise the result will be a view into the buffer's storage if
+        possible (see :class:`SampleBuffer`) or a new array (always with
+        :attr:`OverrunPolicy.DROP_OLDEST`).
+
         Raises:
             QueueEmpty: If a timeout occurs waiting for samples
         """
-        def has_enough_samples():
-            return len(self) >= count
-
-        async with self._lock:
-            if not has_enough_samples():
-                if not block:
-                    raise asyncio.QueueEmpty()
-                if timeout is not None:
-                    try:
-                        async with asyncio.timeout(timeout):
-                            await self._notify_w.wait_for(has_enough_samples)
-                    except asyncio.TimeoutError:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        try:
+            async with asyncio.timeout(timeout):
+                while True:
+                    samples = self._try_read(count, out)
+                    if samples is not None:
+                        break
+                    if not block:
                         raise asyncio.QueueEmpty()
-                else:
-                    await self._notify_r.wait_for(has_enough_samples)
-            samples = self._samples[:count]
-            self._samples = self._samples[count:]
-            self._notify_w.notify_all()
-            return samples
+                    await self._wait(self._data_event, None)
+        except asyncio.TimeoutError:
+            raise asyncio.QueueEmpty()
+        self._space_event.set()
+        return samples
 
-    async def get_nowait(self, count: int) -> SamplesT:
+    async def get_nowait(self, count: int, out: SamplesT|None = None) -> SamplesT:
         """Equivalent to ``get(count, block=False)``
         """
-        return await self.get(count, block=False)
+        return await self.get(count, block=False, out=out)
 
     def qsize(self) -> int:
         return len(self)
@@ -399,8 +789,7 @@ class SampleBuffer:
         return False
 
     def __len__(self) -> int:
-        return self._samples.size
-
+        return self._size
 
 
 def main():
@@ -408,12 +797,21 @@ def main():
     p.add_argument(
         '-f', '--from-file',
         dest='infile',
-        help='Read samples from the given filename and process them',
+        help='Read samples from the given filename and process them '
+             '(a capture file, ".npy" or raw "rtl_sdr" ".bin" file)',
     )
     p.add_argument(
         '-o', '--outfile',
         dest='outfile',
-        help='Read samples from the device and save to the given filename',
+        help='Read samples from the device and stream them to the given '
+             'capture filename',
+    )
+    p.add_argument(
+        '-j', '--jobs',
+        dest='jobs',
+        type=int,
+        help='Process the "-f/--from-file" recording (or a directory of '
+             'recordings) in parallel using this number of worker processes',
     )
     p.add_argument(
         '-m', '--max-samples',
@@ -421,6 +819,39 @@ def main():
         type=int,
         help='Number of samples to read when "-o/--outfile" is specified',
     )
+    p.add_argument(
+        '--db',
+        dest='db_file',
+        help='Log each beep to the given SQLite database filename',
+    )
+    p.add_argument(
+        '--record-beeps',
+        dest='record_dir',
+        help='Save the samples around each beep (and periodic noise '
+             'snapshots) to capture files in the given directory. These can '
+             'be processed later with "-f/--from-file"',
+    )
+    p.add_argument(
+        '--noise-interval',
+        dest='noise_interval',
+        type=float,
+        default=600,
+        help='Seconds between each noise snapshot saved by "--record-beeps" '
+             '(0 to disable) (default: %(default)s)',
+    )
+    p.add_argument(
+        '--stats',
+        dest='stats_file',
+        help='Periodically write pipeline statistics (stage timings, buffer '
+             'depth, overruns) as JSON lines to the given filename ("-" for stdout)',
+    )
+    p.add_argument(
+        '--stats-interval',
+        dest='stats_interval',
+        type=float,
+        default=10,
+        help='Seconds between each line written to "--stats" (default: %(default)s)',
+    )
 
     s_group = p.add_argument_group('Sampling')
     s_group.add_argument(
@@ -449,6 +880,55 @@ def main():
         '--bias-tee', dest='bias_tee', action='store_true',
         help='Enable bias tee',
     )
+    s_group.add_argument(
+        '--dtype', dest='dtype', choices=['complex64', 'complex128'],
+        default='complex128',
+        help='Data type for samples (default: %(default)s)',
+    )
+    s_group.add_argument(
+        '--raw-iq', dest='raw_iq', action=argparse.BooleanOptionalAction,
+        default=SampleConfig.raw_iq,
+        help='Read raw 8-bit samples from the sdr and convert them directly '
+             'into the sample buffer. With "-o/--outfile", the raw samples are '
+             'recorded (2 bytes per sample) (default: %(default)s)',
+    )
+    s_group.add_argument(
+        '--overrun-policy', dest='overrun_policy',
+        choices=[p.value for p in OverrunPolicy], default=OverrunPolicy.DROP_NEWEST.value,
+        help='What to do with incoming samples when processing falls behind '
+             'and the buffer is full (default: %(default)s)',
+    )
+    s_group.add_argument(
+        '--device', dest='devices', action='append', default=[],
+        metavar='INDEX[:CENTER_FREQ]',
+        help='Use the sdr at the given device index (optionally with its own '
+             'center frequency). May be given multiple times to run several '
+             'devices at once, each in its own process',
+    )
+    s_group.add_argument(
+        '--device-serial', dest='device_serials', action='append', default=[],
+        metavar='SERIAL[:CENTER_FREQ]',
+        help='Use the sdr with the given serial number (as with "--device")',
+    )
+    s_group.add_argument(
+        '--simulate', dest='simulate', action='store_true',
+        help='Use simulated devices with an 80 BPM transmitter on each of '
+             '"--channels" (or the first channel within the span)',
+    )
+    s_group.add_argument(
+        '--replay', dest='replay', metavar='FILENAME',
+        help='Use simulated devices which stream the given recording as if '
+             'it were live (a capture file, ".npy" or raw "rtl_sdr" ".bin" file)',
+    )
+    s_group.add_argument(
+        '--loop', dest='loop', action='store_true',
+        help='Repeat the "--replay" recording',
+    )
+    s_group.add_argument(
+        '--rate', dest='rate', type=float, default=1,
+        help='Speed of simulated devices as a multiple of real time, to '
+             'find how much headroom the processing has (default: %(default)s)',
+    )
 
     p_group = p.add_argument_group('Processing')
     p_group.add_argument(
@@ -456,22 +936,119 @@ def main():
         default=ProcessConfig.carrier_freq,
         help='Carrier frequency to process (default: %(default)s)',
     )
+    p_group.add_argument(
+        '--channels', dest='channels', type=int, nargs='+',
+        help='Process the given channel numbers at once (instead of "--carrier")',
+    )
+    p_group.add_argument(
+        '--all-channels', dest='all_channels', action='store_true',
+        help='Process every channel within the sampled bandwidth at once',
+    )
+    p_group.add_argument(
+        '--fft-backend', dest='fft_backend',
+        choices=['auto', *fftbackend.BACKENDS], default='scipy',
+        help='FFT implementation to use ("auto" picks the fastest on this '
+             'host at startup) (default: %(default)s)',
+    )
+    p_group.add_argument(
+        '--fft-workers', dest='fft_workers', type=int,
+        help='Number of threads for each FFT (default: number of cpus)',
+    )
+    p_group.add_argument(
+        '--scan', dest='scan', action='store_true',
+        help='Periodically scan the sampled bandwidth for active channels and '
+             'only process those (implies "--all-channels")',
+    )
+    p_group.add_argument(
+        '--scan-interval', dest='scan_interval', type=float, default=3600,
+        help='Seconds between each channel scan (default: %(default)s)',
+    )
+    p_group.add_argument(
+        '--scan-duration', dest='scan_duration', type=float, default=10,
+        help='Length of each channel scan in seconds (default: %(default)s)',
+    )
+    p_group.add_argument(
+        '--dsp-workers', dest='dsp_workers', type=int,
+        help='Process the samples from the sdr in this number of separate '
+             'processes (fed through shared memory), dividing the channels '
+             'between them',
+    )
 
     args = p.parse_args()
+    if args.dsp_workers is not None and args.scan:
+        p.error('"--scan" can not be used with "--dsp-workers"')
+    if args.record_dir is not None and args.dsp_workers is not None:
+        p.error('"--record-beeps" can not be used with "--dsp-workers"')
 
     sample_config = SampleConfig(
         sample_rate=args.sample_rate, center_freq=args.center_freq,
         gain=args.gain, bias_tee_enable=args.bias_tee, read_size=args.chunk_size,
+        dtype=np.dtype(args.dtype), raw_iq=args.raw_iq,
+    )
+    simulation = None
+    if args.replay is not None:
+        simulation = Simulation(filename=args.replay, loop=args.loop, rate=args.rate)
+    elif args.simulate:
+        simulation = Simulation(rate=args.rate)
+    device_configs = get_device_configs(
+        sample_config, args.devices, args.device_serials, simulation, args.channels,
     )
+    if len(device_configs) == 1:
+        sample_config = device_configs[0]
+    elif args.record_dir is not None:
+        p.error('"--record-beeps" can only be used with a single device')
+    channels = args.channels
+    if args.all_channels or args.scan:
+        channels = sample_config.channels_in_span()
+    scan_interval = args.scan_interval if args.scan else None
     process_config = ProcessConfig(
         sample_config=sample_config, carrier_freq=args.carrier,
+        channels=channels,
     )
 
-    if args.infile is not None:
-        run_from_disk(
+    if args.fft_backend == 'auto':
+        # Time the batch of FFTs done for beep detection on each chunk
+        fft_size = SampleProcessor(process_config).fft_size
+        backend = fftbackend.select_fastest(
+            (process_config.num_samples_to_process // fft_size, fft_size),
+            sample_config.dtype, workers=args.fft_workers,
+        )
+        print(f'Using FFT backend: {backend.name}')
+    else:
+        fftbackend.set_backend(args.fft_backend, args.fft_workers)
+
+    if len(device_configs) > 1:
+        # Imported here since `multi` uses this module
+        from kiwitracker.multi import DeviceConfig, run_devices
+        devices = []
+        for config in device_configs:
+            in_span = config.channels_in_span()
+            devices.append(DeviceConfig(
+                ProcessConfig(
+                    sample_config=config,
+                    channels=[ch for ch in args.channels or in_span if ch in in_span],
+                ),
+                overrun_policy=OverrunPolicy(args.overrun_policy),
+            ))
+        with open_sink(args.db_file) as sink:
+            run_devices(devices, sink=sink)
+    elif args.infile is not None and args.jobs is not None:
+        run_offline(
             process_config=process_config,
             filename=args.infile,
+            max_workers=args.jobs,
         )
+    elif args.infile is not None:
+        with open_stats_file(args.stats_file) as stats_fd, open_sink(args.db_file) as sink:
+            run_from_disk(
+                process_config=process_config,
+                filename=args.infile,
+                stats_fd=stats_fd,
+                stats_interval=args.stats_interval,
+                sink=sink,
+                scan_interval=scan_interval,
+                scan_duration=args.scan_duration,
+            )
     elif args.outfile is not None:
         assert args.max_samples is not None
         asyncio.run(
@@ -481,63 +1058,372 @@ def main():
                 max_samples=args.max_samples,
             )
         )
+    elif args.dsp_workers is not None:
+        # Imported here since `pipeline` uses this module
+        from kiwitracker.pipeline import run_pipeline
+        with open_stats_file(args.stats_file) as stats_fd, open_sink(args.db_file) as sink:
+            asyncio.run(
+                run_pipeline(
+                    sample_config=sample_config,
+                    process_config=process_config,
+                    num_workers=args.dsp_workers,
+                    stats_fd=stats_fd,
+                    stats_interval=args.stats_interval,
+                    sink=sink,
+                    overrun_policy=args.overrun_policy,
+                )
+            )
     else:
-        asyncio.run(
-            run_main(sample_config=sample_config, process_config=process_config)
-        )
+        with open_stats_file(args.stats_file) as stats_fd, open_sink(args.db_file) as sink:
+            asyncio.run(
+                run_main(
+                    sample_config=sample_config,
+                    process_config=process_config,
+                    stats_fd=stats_fd,
+                    stats_interval=args.stats_interval,
+                    sink=sink,
+                    scan_interval=scan_interval,
+                    scan_duration=args.scan_duration,
+                    overrun_policy=args.overrun_policy,
+                    record_dir=args.record_dir,
+                    noise_interval=args.noise_interval or None,
+                )
+            )
 
 
-async def run_readonly(sample_config: SampleConfig, filename: str, max_samples: int):
-    chunk_size = sample_config.read_size
-    nrows = max_samples // sample_config.read_size
-    if nrows * chunk_size < max_samples:
-        nrows += 1
-    samples = np.zeros((nrows, chunk_size), dtype=np.complex128)
-    sample_config = SampleConfig(read_size=chunk_size)
-    reader = SampleReader(sample_config)
+def get_device_configs(
+    sample_config: SampleConfig,
+    devices: list[str],
+    serials: list[str],
+    simulation: Simulation|None,
+    channels: list[int]|None
+) -> list[SampleConfig]:
+    """Create a :class:`~.common.SampleConfig` for each ``--device`` and
+    ``--device-serial`` argument (given as ``"INDEX[:CENTER_FREQ]"`` and
+    ``"SERIAL[:CENTER_FREQ]"``)
+
+    If neither were given, *sample_config* is used for device 0.
+
+    If *simulation* is given, every device is simulated with a copy of it.
+    A simulation without a recording gets a transmitter on each of *channels*
+    within the device's span (see :meth:`.Simulation.for_channels`). One that
+    replays a recording uses the sample rate and center frequency the file
+    was recorded with.
+    """
+    def parse(spec: str) -> tuple[str, float]:
+        name, _, freq = spec.partition(':')
+        return name, float(freq) if freq else sample_config.center_freq
+
+    configs = []
+    for spec in devices:
+        index, freq = parse(spec)
+        configs.append(dataclasses.replace(
+            sample_config, device_index=int(index), center_freq=freq,
+        ))
+    for spec in serials:
+        serial, freq = parse(spec)
+        configs.append(dataclasses.replace(
+            sample_config, serial_number=serial, center_freq=freq,
+        ))
+    if not configs:
+        configs.append(sample_config)
+    if simulation is None:
+        return configs
+    simulated = []
+    for i, config in enumerate(configs):
+        if simulation.filename is not None:
+            capture = CaptureFile(simulation.filename)
+            config = dataclasses.replace(
+                config,
+                sample_rate=capture.sample_rate or config.sample_rate,
+                center_freq=capture.center_freq or config.center_freq,
+            )
+            device_sim = simulation
+        else:
+            device_sim = Simulation.for_channels(
+                config, channels, rate=simulation.rate, duration=simulation.duration,
+            )
+        simulated.append(dataclasses.replace(config, device_index=i, simulation=device_sim))
+    return simulated
 
-    async with reader:
-        await reader.open_stream()
-        i = 0
-        count = 0
-        async for _samples in reader:
-            if count == 0:
-                print(f'{_samples.size=}')
-            samples[i,:] = _samples
-            count += _samples.size
-            # print(f'{i}\t{reader.aio_queue.qsize()=}\t{count=}')
-            i += 1
-            if count >= max_samples:
-                break
-    samples = samples.flatten()[:max_samples]
-    np.save(filename, samples)
 
+@contextlib.contextmanager
+def open_stats_file(filename: str|None) -> Iterator[TextIO|None]:
+    """Open the ``--stats`` output (``None`` if not given)
+    """
+    if filename is None:
+        yield None
+    elif filename == '-':
+        yield sys.stdout
+    else:
+        with open(filename, 'a') as fd:
+            yield fd
 
-def run_from_disk(process_config: ProcessConfig, filename: str):
-    samples = np.load(filename)
-    processor = SampleProcessor(process_config)
-    for ix in range(0, samples.size, processor.num_samples_to_process ):
-        start_time = time.time()
-        processor.process(samples[ix:ix+processor.num_samples_to_process])
-        finish_time = time.time()
-        print(f" run time is {finish_time-start_time}")
 
+@contextlib.contextmanager
+def open_sink(filename: str|None) -> Iterator[SqliteSink|None]:
+    """Open the ``--db`` database (``None`` if not given)
+    """
+    if filename is None:
+        yield None
+    else:
+        with SqliteSink(filename) as sink:
+            yield sink
 
-async def run_main(sample_config: SampleConfig, process_config: ProcessConfig):
+
+def report_events(
+    events: list[BeepEvent],
+    decoder: ChickTimerDecoder,
+    sink: SqliteSink|None
+):
+    """Print the events returned by a processor, decode any Chick Timer
+    sequences and send the events to *sink* (if given)
+    """
+    for event in events:
+        print(event)
+    for ct_event in decoder.process(events):
+        print(ct_event)
+    if sink is not None:
+        sink.put(events)
+
+
+def process_window(
+    processor: SampleProcessor|ChannelizerProcessor,
+    samples: SamplesT,
+    gaps: list[Gap]
+) -> list[BeepEvent]:
+    """Process a window of samples from a :class:`SampleBuffer`, skipping
+    over the *gaps* within it (from :attr:`SampleBuffer.last_gaps`) so the
+    processor's sample clock stays in step with the stream
+    """
+    if not gaps:
+        return processor.process(samples)
+    events = []
+    start = 0
+    for gap in gaps:
+        if gap.offset > start:
+            events.extend(processor.process(samples[start:gap.offset]))
+        processor.skip(gap.count)
+        start = gap.offset
+    if start < samples.size:
+        events.extend(processor.process(samples[start:]))
+    return events
+
+
+def make_scheduler(
+    processor: SampleProcessor|ChannelizerProcessor,
+    scan_interval: float|None,
+    scan_duration: float
+) -> ScanScheduler|None:
+    """Create a :class:`~.scan.ScanScheduler` for *processor* if
+    *scan_interval* is given
+
+    No channels are enabled until the first scan completes.
+    """
+    if scan_interval is None:
+        return None
+    if not isinstance(processor, ChannelizerProcessor):
+        raise ValueError('Channel scans require a ChannelizerProcessor')
+    processor.enabled_channels = []
+    return ScanScheduler(
+        processor.config.sample_config, interval=scan_interval, duration=scan_duration,
+    )
+
+
+def timed_scan(
+    scheduler: ScanScheduler,
+    samples: SamplesT,
+    stats: PipelineStats
+) -> ScanResult|None:
+    """Pass *samples* to :meth:`.ScanScheduler.scan`, timing it as the
+    ``'scan'`` stage in *stats*
+
+    Returns:
+        The result of the scan, if one finished with these samples
+    """
+    with stats.stage('scan'):
+        return scheduler.scan(samples)
+
+
+def update_scan(
+    scheduler: ScanScheduler,
+    processor: ChannelizerProcessor,
+    num_samples: int,
+    events: list[BeepEvent],
+    result: ScanResult|None
+):
+    """Update the active channels of *processor* after *num_samples* were
+    processed (and scanned if *result* came from :meth:`.ScanScheduler.scan`)
+    """
+    if result is not None:
+        print(result)
+    processor.enabled_channels = scheduler.advance(
+        num_samples, [event.channel for event in events],
+    )
+
+
+async def run_readonly(sample_config: SampleConfig, filename: str, max_samples: int):
     reader = SampleReader(sample_config)
-    processor = SampleProcessor(process_config)
-    buffer = SampleBuffer(maxsize=processor.num_samples_to_process * 3)
-    reader.buffer = buffer
+    # Raw samples are recorded as they are (2 bytes per sample)
+    header = CaptureHeader(
+        sample_rate=sample_config.sample_rate,
+        center_freq=sample_config.center_freq,
+        dtype=RAW_IQ_DTYPE if reader.raw_iq else np.dtype(sample_config.dtype),
+    )
 
-    async with reader:
-        await reader.open_stream()
-        while True:
-            samples = await buffer.get(processor.num_samples_to_process)
-            start_time = time.time()
-            print(f" start time is {time.time()}")
-            await asyncio.to_thread(processor.process, samples)
-            finish_time = time.time() - start_time
-            print(f" prcoessor took : {finish_time}")
+    with CaptureWriter(filename, header) as writer:
+        async with reader:
+            await reader.open_stream()
+            async for _samples in reader:
+                if writer.num_samples == 0:
+                    print(f'{_samples.size=}')
+                remaining = max_samples - writer.num_samples
+                if is_raw_iq(_samples):
+                    remaining *= 2
+                writer.write(_samples[:remaining])
+                if writer.num_samples >= max_samples:
+                    break
+
+
+def run_from_disk(
+    process_config: ProcessConfig,
+    filename: str,
+    stats_fd: TextIO|None = None,
+    stats_interval: float = 10,
+    sink: SqliteSink|None = None,
+    scan_interval: float|None = None,
+    scan_duration: float = 10
+):
+    capture = CaptureFile(filename)
+    # Use the sample rate and center frequency the file was recorded with
+    process_config = capture.apply_to_config(process_config)
+    stats = PipelineStats(process_config.sample_config.sample_rate)
+    processor = make_processor(process_config, stats=stats)
+    scheduler = make_scheduler(processor, scan_interval, scan_duration)
+    decoder = ChickTimerDecoder()
+    writer = None
+    if stats_fd is not None:
+        writer = StatsWriter(stats, stats_fd, interval=stats_interval)
+    chunks = capture.iter_stream(processor.num_samples_to_process, process_config.dtype)
+    position = 0
+    for chunk_position, chunk in chunks:
+        # Segmented captures (from a TriggeredRecorder) skip the samples
+        # between segments
+        skipped = chunk_position - position
+        if skipped > 0:
+            processor.skip(skipped)
+        position = chunk_position + chunk.size
+        start_time = time.perf_counter()
+        scan_result = None
+        if scheduler is not None and scheduler.scanning:
+            scan_result = timed_scan(scheduler, chunk, stats)
+        events = processor.process(chunk)
+        stats.record_processed(chunk.size, time.perf_counter() - start_time)
+        if scheduler is not None:
+            update_scan(scheduler, processor, chunk.size + max(skipped, 0), events, scan_result)
+        report_events(events, decoder, sink)
+        if writer is not None:
+            writer.poll()
+    if writer is not None:
+        writer.write()
+
+
+async def run_main(
+    sample_config: SampleConfig,
+    process_config: ProcessConfig,
+    stats_fd: TextIO|None = None,
+    stats_interval: float = 10,
+    sink: SqliteSink|None = None,
+    scan_interval: float|None = None,
+    scan_duration: float = 10,
+    stats: PipelineStats|None = None,
+    overrun_policy: OverrunPolicy|str = OverrunPolicy.DROP_NEWEST,
+    record_dir: str|None = None,
+    noise_interval: float|None = 600,
+    bus: EventBus|None = None
+):
+    """Read samples from the sdr and process them as they arrive
+
+    If *record_dir* is given, the samples around each beep (and a snapshot
+    of the noise every *noise_interval* seconds) are saved there by a
+    :class:`~.recorder.TriggeredRecorder`.
+
+    The beeps found are also published to *bus* (if given), which is closed
+    when the stream ends so its subscribers finish.
+    """
+    if stats is None:
+        stats = PipelineStats(sample_config.sample_rate)
+    reader = SampleReader(sample_config, stats=stats)
+    processor = make_processor(process_config, stats=stats)
+    recorder = None
+    if record_dir is not None:
+        # Raw samples are recorded as 8-bit (as with "-o/--outfile")
+        recorder = TriggeredRecorder(
+            record_dir, sample_config, processor.num_samples_to_process,
+            dtype=RAW_IQ_DTYPE if reader.raw_iq else None,
+            noise_interval=noise_interval,
+        )
+    buffer = SampleBuffer(
+        maxsize=processor.num_samples_to_process * 3, dtype=sample_config.dtype,
+        overrun_policy=overrun_policy,
+    )
+    reader.buffer = buffer
+    stats.buffer_maxsize = buffer.maxsize
+    scheduler = make_scheduler(processor, scan_interval, scan_duration)
+    decoder = ChickTimerDecoder()
+    writer = writer_task = None
+    if stats_fd is not None:
+        writer = StatsWriter(stats, stats_fd, interval=stats_interval)
+        writer_task = asyncio.create_task(writer.run())
+
+    # Wall-clock time of the first sample (set when the first window arrives)
+    stream_start: float|None = None
+
+    try:
+        async with reader:
+            await reader.open_stream()
+            while True:
+                samples = await reader.get_window(processor.num_samples_to_process)
+                if samples is None:
+                    break
+                gaps = buffer.last_gaps
+                if stream_start is None:
+                    stream_start = time.time() - samples.size / sample_config.sample_rate
+                start_time = time.perf_counter()
+                if scheduler is not None and scheduler.scanning:
+                    # Scan in another thread alongside the processor (both
+                    # only read the samples)
+                    events, scan_result = await asyncio.gather(
+                        asyncio.to_thread(process_window, processor, samples, gaps),
+                        asyncio.to_thread(timed_scan, scheduler, samples, stats),
+                    )
+                else:
+                    events = await asyncio.to_thread(process_window, processor, samples, gaps)
+                    scan_result = None
+                stats.record_processed(samples.size, time.perf_counter() - start_time)
+                if scheduler is not None:
+                    assert isinstance(processor, ChannelizerProcessor)
+                    num_samples = samples.size + sum(gap.count for gap in gaps)
+                    update_scan(scheduler, processor, num_samples, events, scan_result)
+                for event in events:
+                    event.wall_time = stream_start + event.time
+                report_events(events, decoder, sink)
+                if bus is not None:
+                    bus.publish(events)
+                if recorder is not None:
+                    # The window is only valid until the next read
+                    await asyncio.to_thread(
+                        recorder.add, samples, buffer.read_position, gaps, events, stream_start,
+                    )
+        if writer is not None:
+            writer.write()
+    finally:
+        if writer_task is not None:
+            writer_task.cancel()
+        if recorder is not None:
+            recorder.close()
+        if bus is not None:
+            bus.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,230 @@
+from __future__ import annotations
+from typing import Iterable
+from dataclasses import dataclass, field
+import math
+
+import numpy as np
+from scipy import signal
+
+from kiwitracker.common import (
+    SamplesT, FloatArray, SampleConfig, CHANNEL_SPACING, channel_freq,
+)
+from kiwitracker.fftbackend import get_backend
+
+
+@dataclass
+class ScanResult:
+    """Results from a :class:`ChannelScanner`
+    """
+
+    channels: list[int]
+    """The channels within the scanned span"""
+
+    snr: FloatArray
+    """Peak power of each channel relative to the noise floor (in dB)"""
+
+    threshold: float
+    """The SNR (in dB) a channel must reach to be considered active"""
+
+    duration: float
+    """Length of time scanned (in seconds)"""
+
+    @property
+    def active_channels(self) -> list[int]:
+        """Channels with a peak of at least :attr:`threshold` above the noise"""
+        return [ch for ch, snr in zip(self.channels, self.snr) if snr >= self.threshold]
+
+    def __str__(self) -> str:
+        active = ', '.join(
+            f'CH{ch:02d} ({snr:.1f} dB)'
+            for ch, snr in zip(self.channels, self.snr) if snr >= self.threshold
+        )
+        return f" SCAN | {self.duration:.1f} sec | active: {active or 'none'}"
+
+
+class ChannelScanner:
+    """Find the channels carrying beeps by scanning the whole sampled span
+
+    Each :attr:`fft_size` frame is windowed and its power spectrum added to
+    a running average (as in Welch's method) and to a peak-hold spectrum.
+    Beeps are short, so they barely raise the average but show up in the
+    peak-hold. A channel's SNR is the peak-hold power near its frequency
+    relative to the average noise floor of the whole span.
+    """
+
+    sample_config: SampleConfig
+
+    fft_size: int
+    """FFT length (the smallest power of 2 giving bins no wider than
+    ``bin_width``)
+    """
+
+    threshold: float = 15
+    """SNR (in dB) a channel must reach to be considered active. The peak-hold
+    of noise alone is around 10 dB above the average for a 10 second scan
+    """
+
+    search_width: float = 0.3 * CHANNEL_SPACING
+    """Distance (in Hz) either side of a channel's frequency to look for its
+    peak
+    """
+
+    def __init__(self, sample_config: SampleConfig, bin_width: float = 1000) -> None:
+        self.sample_config = sample_config
+        fs = sample_config.sample_rate
+        self.fft_size = 2 ** math.ceil(math.log2(fs / bin_width))
+        self._window = signal.get_window('hann', self.fft_size).astype(sample_config.real_dtype)
+        freqs = np.fft.fftfreq(self.fft_size, 1 / fs)
+        self.channels = sample_config.channels_in_span()
+        self._channel_bins = []
+        for ch in self.channels:
+            offset = channel_freq(ch) - sample_config.center_freq
+            self._channel_bins.append(
+                np.flatnonzero(np.abs(freqs - offset) <= self.search_width)
+            )
+        self.reset()
+
+    @property
+    def duration(self) -> float:
+        """Length of time (in seconds) scanned since the last :meth:`reset`"""
+        return self._num_frames * self.fft_size / self.sample_config.sample_rate
+
+    def reset(self):
+        self._power_sum = np.zeros(self.fft_size)
+        self._peak_hold = np.zeros(self.fft_size)
+        self._num_frames = 0
+
+    def process(self, samples: SamplesT):
+        """Add *samples* to the scan (any remainder after the last full frame
+        is ignored)
+        """
+        num_frames = len(samples) // self.fft_size
+        if num_frames == 0:
+            return
+        frames = samples[:num_frames*self.fft_size].reshape(num_frames, self.fft_size)
+        spectrum = get_backend().fft(frames * self._window, axis=1)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        self._power_sum += power.sum(axis=0)
+        np.maximum(self._peak_hold, power.max(axis=0), out=self._peak_hold)
+        self._num_frames += num_frames
+
+    def result(self) -> ScanResult:
+        """Get the :class:`ScanResult` for everything scanned since the last
+        :meth:`reset`
+        """
+        if self._num_frames == 0:
+            raise ValueError('Nothing has been scanned')
+        noise = np.median(self._power_sum / self._num_frames)
+        snr = np.array([
+            10 * np.log10(self._peak_hold[bins].max() / noise) for bins in self._channel_bins
+        ])
+        return ScanResult(
+            channels=list(self.channels),
+            snr=snr,
+            threshold=self.threshold,
+            duration=self.duration,
+        )
+
+
+@dataclass
+class ActiveChannelCache:
+    """Channels known to be active, each expiring after :attr:`ttl` seconds
+    unless refreshed
+
+    Times are in seconds on any clock (the stream time is used by
+    :class:`ScanScheduler` so recordings behave the same as live samples).
+    """
+
+    ttl: float
+    """Time (in seconds) a channel remains active after it was last seen"""
+
+    expires: dict[int, float] = field(default_factory=dict)
+    """Expiration time for each channel"""
+
+    def add(self, channels: Iterable[int], now: float):
+        """Mark *channels* as active as of *now*
+        """
+        for ch in channels:
+            self.expires[ch] = now + self.ttl
+
+    def active(self, now: float) -> list[int]:
+        """Evict any expired channels and return the remaining ones
+        """
+        expired = [ch for ch, t in self.expires.items() if t <= now]
+        for ch in expired:
+            del self.expires[ch]
+        return sorted(self.expires)
+
+
+class ScanScheduler:
+    """Runs a :class:`ChannelScanner` every :attr:`interval` seconds and
+    keeps an :class:`ActiveChannelCache` of the results
+
+    Scans start immediately and last :attr:`duration` seconds. In between,
+    channels are kept active by :meth:`advance` as long as beeps are found
+    on them.
+    """
+
+    interval: float
+    """Time (in seconds) between the start of each scan"""
+
+    duration: float
+    """Length (in seconds) of each scan"""
+
+    cache: ActiveChannelCache
+
+    def __init__(
+        self,
+        sample_config: SampleConfig,
+        interval: float = 3600,
+        duration: float = 10,
+        ttl: float|None = None
+    ) -> None:
+        self.sample_config = sample_config
+        self.interval = interval
+        self.duration = duration
+        if ttl is None:
+            ttl = interval * 2
+        self.scanner = ChannelScanner(sample_config)
+        self.cache = ActiveChannelCache(ttl)
+        self._num_samples = 0
+        self._next_scan = 0
+
+    @property
+    def time(self) -> float:
+        """Stream time (in seconds) of the samples given to :meth:`advance`"""
+        return self._num_samples / self.sample_config.sample_rate
+
+    @property
+    def scanning(self) -> bool:
+        """True if the next samples should be given to :meth:`scan`"""
+        return self.time >= self._next_scan
+
+    def scan(self, samples: SamplesT) -> ScanResult|None:
+        """Add *samples* to the current scan
+
+        This only uses the scanner, so it may run in another thread alongside
+        the processor.
+
+        Returns:
+            The :class:`ScanResult` if the scan is complete
+        """
+        self.scanner.process(samples)
+        if self.scanner.duration < self.duration:
+            return None
+        result = self.scanner.result()
+        self.scanner.reset()
+        self._next_scan = self.time + self.interval
+        self.cache.add(result.active_channels, self.time)
+        return result
+
+    def advance(self, num_samples: int, channels: Iterable[int|None] = ()) -> list[int]:
+        """Advance the stream time by *num_samples* and refresh the cache
+        entries of *channels* (those beeps were found on)
+
+        Returns:
+            The currently active channels
+        """
+        self._num_samples += num_samples
+        self.cache.add([ch for ch in channels if ch is not None], self.time)
+        return self.cache.active(self.time)
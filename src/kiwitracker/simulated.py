@@ -0,0 +1,180 @@
+from __future__ import annotations
+from typing import Any, Callable, Iterator, Self, Sequence
+from dataclasses import dataclass, field
+import threading
+import time
+
+import numpy as np
+
+from kiwitracker.common import SamplesT, SampleConfig, channel_freq
+from kiwitracker.capture import CaptureFile
+from kiwitracker.synth import Transmitter, iter_synthesize
+
+
+@dataclass
+class Simulation:
+    """Settings for a :class:`SimulatedSdr`
+    """
+
+    transmitters: list[Transmitter] = field(default_factory=list)
+    """The transmitters to synthesize (with offsets relative to the sdr's
+    center frequency)
+    """
+
+    filename: str|None = None
+    """If set, samples are replayed from this recording (any format read by
+    :class:`~.capture.CaptureFile`) instead of being synthesized
+    """
+
+    loop: bool = False
+    """If True, the :attr:`filename` recording is repeated until
+    :attr:`duration` is reached
+    """
+
+    rate: float = 1
+    """Speed of the stream as a multiple of real time (``10`` sends samples
+    ten times faster than the device would)
+    """
+
+    duration: float = 3600
+    """Length of the stream (in seconds). Streaming stops after this"""
+
+    snr_db: float = 20
+    """Noise level (see :func:`~.synth.iter_synthesize`)"""
+
+    seed: int|None = 0
+    """Random seed for the noise"""
+
+    @classmethod
+    def for_channels(
+        cls,
+        sample_config: SampleConfig,
+        channels: Sequence[int]|None = None,
+        bpm: float = 80,
+        **kwargs
+    ) -> Self:
+        """Create a simulation with a transmitter on each of the given
+        *channels* that is within the span of *sample_config* (or only the
+        first channel in the span if *channels* is not given)
+        """
+        in_span = sample_config.channels_in_span()
+        if channels is None:
+            channels = in_span[:1]
+        transmitters = [
+            Transmitter(channel_freq(ch) - sample_config.center_freq, bpm=bpm)
+            for ch in channels if ch in in_span
+        ]
+        return cls(transmitters=transmitters, **kwargs)
+
+
+class SimulatedSdr:
+    """Stand-in for :class:`rtlsdr.RtlSdrAio` which streams synthesized
+    samples (see :mod:`~.synth`) or a recording in real time (or faster)
+
+    Only the parts of the device API used by :class:`~.sample_reader.SampleReader`
+    are implemented.
+    """
+
+    simulation: Simulation
+
+    sample_rate: float = 2.048e6
+    center_freq: float = 100e6
+    gain: str|float = 'auto'
+
+    gain_values: list[int] = [
+        0, 9, 14, 27, 37, 77, 87, 125, 144, 157, 166, 197, 207, 229, 254,
+        280, 297, 328, 338, 364, 372, 386, 402, 421, 434, 439, 445, 480, 496,
+    ]
+    """Gains supported by the (simulated) tuner in tenths of a dB"""
+
+    bias_tee: bool = False
+
+    def __init__(self, simulation: Simulation) -> None:
+        self.simulation = simulation
+        self._sync_chunks: Iterator[SamplesT]|None = None
+        self._cancel = threading.Event()
+
+    def set_bias_tee(self, enabled: bool):
+        self.bias_tee = enabled
+
+    def _iter_chunks(self, num_samples: int) -> Iterator[SamplesT]:
+        sim = self.simulation
+        if sim.filename is not None:
+            return self._iter_recording(num_samples)
+        return iter_synthesize(
+            sim.transmitters, sim.duration, self.sample_rate, num_samples,
+            snr_db=sim.snr_db, seed=sim.seed,
+        )
+
+    def _iter_recording(self, num_samples: int) -> Iterator[SamplesT]:
+        sim = self.simulation
+        assert sim.filename is not None
+        capture = CaptureFile(sim.filename)
+        if capture.size == 0:
+            return
+        remaining = int(sim.duration * self.sample_rate)
+        pos = 0
+        while remaining > 0:
+            size = min(num_samples, remaining)
+            parts = []
+            while size > 0:
+                if pos >= capture.size:
+                    if not sim.loop:
+                        break
+                    pos = 0
+                part = capture.read(pos, size)
+                pos += part.size
+                size -= part.size
+                parts.append(part)
+            if not parts:
+                return
+            chunk = np.concatenate(parts) if len(parts) > 1 else parts[0]
+            remaining -= chunk.size
+            yield chunk
+            if size > 0:
+                # End of the recording
+                return
+
+    def read_samples(self, num_samples: int) -> SamplesT:
+        """Get the next *num_samples* (without waiting for them to "arrive")
+
+        Raises:
+            EOFError: If the end of the simulation was reached
+        """
+        if self._sync_chunks is None:
+            self._sync_chunks = self._iter_chunks(num_samples)
+        try:
+            return next(self._sync_chunks)
+        except StopIteration:
+            raise EOFError('End of simulation')
+
+    def read_samples_async(
+        self,
+        callback: Callable[[SamplesT, Any], None],
+        num_samples: int
+    ):
+        """Call *callback* with each chunk of *num_samples* at the time it
+        would have arrived from a real device (sped up by
+        :attr:`Simulation.rate`)
+
+        This blocks until :meth:`cancel_read_async` is called or the end of
+        the simulation is reached.
+        """
+        self._cancel.clear()
+        start_time = time.monotonic()
+        stream_rate = self.sample_rate * self.simulation.rate
+        num_read = 0
+        for chunk in self._iter_chunks(num_samples):
+            num_read += chunk.size
+            delay = start_time + num_read / stream_rate - time.monotonic()
+            if delay > 0 and self._cancel.wait(delay):
+                break
+            if self._cancel.is_set():
+                break
+            callback(chunk, self)
+
+    def cancel_read_async(self):
+        self._cancel.set()
+
+    def close(self):
+        self.cancel_read_async()
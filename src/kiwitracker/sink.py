@@ -0,0 +1,169 @@
+from __future__ import annotations
+from typing import Iterable, Self
+from pathlib import Path
+import math
+import queue
+import sqlite3
+import threading
+import time
+
+from kiwitracker.sample_processor import BeepEvent
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS beeps (
+    id INTEGER PRIMARY KEY,
+    sample_index INTEGER NOT NULL,
+    sample_rate REAL NOT NULL,
+    time REAL NOT NULL,
+    wall_time REAL,
+    channel INTEGER,
+    carrier_freq REAL,
+    bpm REAL,
+    snr REAL,
+    duration REAL
+)
+"""
+
+_INSERT = """
+INSERT INTO beeps (
+    sample_index, sample_rate, time, wall_time, channel, carrier_freq,
+    bpm, snr, duration
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class SqliteSink:
+    """Write :class:`~.sample_processor.BeepEvent` objects to a SQLite
+    database from a background thread
+
+    :meth:`put` only appends the events to a bounded queue, so it never
+    waits on the database. The writer thread inserts them in batches, once
+    :attr:`batch_size` events are waiting or every :attr:`flush_interval`
+    seconds. If the queue fills (the disk can't keep up), further events are
+    dropped and counted in :attr:`dropped`.
+    """
+
+    filename: Path
+
+    maxsize: int
+    """Maximum number of :meth:`put` calls waiting to be written"""
+
+    batch_size: int
+    """Number of events to collect before writing them"""
+
+    flush_interval: float
+    """Maximum time (in seconds) events are held before being written"""
+
+    dropped: int
+    """Number of events dropped because the queue was full"""
+
+    written: int
+    """Number of events written to the database"""
+
+    def __init__(
+        self,
+        filename: str|Path,
+        maxsize: int = 1000,
+        batch_size: int = 500,
+        flush_interval: float = 1
+    ) -> None:
+        self.filename = Path(filename)
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue: queue.Queue[list[BeepEvent]|None] = queue.Queue(maxsize=maxsize)
+        self._thread: threading.Thread|None = None
+
+    def open(self):
+        assert self._thread is None
+        # Create the table here so errors are raised to the caller
+        with sqlite3.connect(self.filename) as conn:
+            conn.execute(_SCHEMA)
+        conn.close()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Write any remaining events and stop the writer thread
+
+        If the writer thread has died (from a database error), any events
+        still queued are discarded and counted in :attr:`dropped`.
+        """
+        t = self._thread
+        if t is None:
+            return
+        self._thread = None
+        # Waiting on a full queue would never end if the thread has died,
+        # so keep checking on it
+        while t.is_alive():
+            try:
+                self._queue.put(None, timeout=self.flush_interval)
+                break
+            except queue.Full:
+                pass
+        t.join()
+        while True:
+            try:
+                events = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if events is not None:
+                self.dropped += len(events)
+
+    def put(self, events: Iterable[BeepEvent]):
+        """Queue *events* to be written (without blocking)
+        """
+        events = list(events)
+        if not len(events):
+            return
+        try:
+            self._queue.put_nowait(events)
+        except queue.Full:
+            self.dropped += len(events)
+
+    def _write(self, conn: sqlite3.Connection, batch: list[BeepEvent]):
+        rows = [
+            (
+                e.index, e.sample_rate, e.time, e.wall_time, e.channel,
+                e.carrier_freq, None if math.isnan(e.bpm) else e.bpm, e.snr, e.duration,
+            )
+            for e in batch
+        ]
+        with conn:
+            conn.executemany(_INSERT, rows)
+        self.written += len(rows)
+
+    def _run(self):
+        conn = sqlite3.connect(self.filename)
+        try:
+            batch: list[BeepEvent] = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                timeout = max(deadline - time.monotonic(), 0)
+                try:
+                    events = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    events = []
+                if events is None:
+                    break
+                batch.extend(events)
+                now = time.monotonic()
+                if len(batch) >= self.batch_size or now >= deadline:
+                    if len(batch):
+                        self._write(conn, batch)
+                        batch = []
+                    deadline = now + self.flush_interval
+            if len(batch):
+                self._write(conn, batch)
+        finally:
+            conn.close()
+
+    def __enter__(self) -> Self:
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,276 @@
+from __future__ import annotations
+from typing import Any, TextIO, Self
+import asyncio
+import json
+import sys
+import time
+
+
+class StageTimer:
+    """Accumulates the time spent in one processing stage
+
+    Used as a context manager around the stage::
+
+        with stats.stage('detect'):
+            ...
+
+    Only :func:`time.perf_counter` and a few additions are done on each use,
+    so it is cheap enough to leave enabled in the hot path.
+    """
+
+    name: str
+
+    count: int
+    """Number of times the stage has run since the last :meth:`reset`"""
+
+    total: float
+    """Total time (in seconds) spent in the stage since the last :meth:`reset`"""
+
+    max: float
+    """Longest single run (in seconds) since the last :meth:`reset`"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._start = 0.
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, elapsed: float):
+        """Add a single run of the stage taking *elapsed* seconds
+        """
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def __enter__(self) -> Self:
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.add(time.perf_counter() - self._start)
+
+    def to_dict(self) -> dict[str, float]:
+        mean = self.total / self.count if self.count else 0.
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': mean,
+            'max': self.max,
+        }
+
+
+class PipelineStats:
+    """Counters and per-stage timers describing the health of the pipeline
+
+    A single instance is shared by the :class:`~.sample_reader.SampleReader`
+    and the processor(s). The sample, overrun and dropped sample counters are
+    running totals. The stage timers, :attr:`busy_time` and
+    :attr:`max_buffer_depth` cover the interval since the last call to
+    :meth:`snapshot` (with ``reset=True``).
+    """
+
+    sample_rate: float|None
+    """Input sample rate, used to calculate :attr:`load`"""
+
+    samples_read: int
+    """Number of samples received from the sdr"""
+
+    chunks_read: int
+    """Number of chunks received from the sdr"""
+
+    overruns: int
+    """Number of times samples were dropped because the buffer was full"""
+
+    dropped_samples: int
+    """Total number of samples dropped by the :attr:`overruns`"""
+
+    buffer_depth: int
+    """Number of samples in the buffer after the last write"""
+
+    max_buffer_depth: int
+    """Largest :attr:`buffer_depth` seen in the current interval"""
+
+    buffer_maxsize: int
+    """The :attr:`~.sample_reader.SampleBuffer.maxsize` of the buffer
+    (if known)
+    """
+
+    samples_processed: int
+    """Number of samples given to the processor"""
+
+    busy_time: float
+    """Time (in seconds) spent processing in the current interval"""
+
+    stages: dict[str, StageTimer]
+    """:class:`StageTimer` for each stage name"""
+
+    counters: dict[str, int]
+    """Running totals incremented by :meth:`increment` (such as the number
+    of ``'chunks'`` checked for beeps and how many of them were
+    ``'escalated'`` to full processing)
+    """
+
+    def __init__(self, sample_rate: float|None = None) -> None:
+        self.sample_rate = sample_rate
+        self.samples_read = 0
+        self.chunks_read = 0
+        self.overruns = 0
+        self.dropped_samples = 0
+        self.buffer_depth = 0
+        self.max_buffer_depth = 0
+        self.buffer_maxsize = 0
+        self.samples_processed = 0
+        self.stages = {}
+        self.counters = {}
+        self._reset_interval()
+        self._start_time = time.time()
+
+    def _reset_interval(self):
+        self.busy_time = 0.
+        self._interval_samples = 0
+        self._interval_start = time.monotonic()
+        self.max_buffer_depth = self.buffer_depth
+        for timer in self.stages.values():
+            timer.reset()
+
+    def stage(self, name: str) -> StageTimer:
+        """Get the :class:`StageTimer` for the given stage name (creating it
+        if necessary)
+        """
+        timer = self.stages.get(name)
+        if timer is None:
+            timer = self.stages[name] = StageTimer(name)
+        return timer
+
+    def increment(self, name: str, count: int = 1):
+        """Add *count* to the counter *name*
+        """
+        self.counters[name] = self.counters.get(name, 0) + count
+
+    @property
+    def escalated_fraction(self) -> float|None:
+        """Fraction of the chunks checked for beeps that went on to the full
+        (mix, filter and edge detection) path
+        """
+        chunks = self.counters.get('chunks', 0)
+        if not chunks:
+            return None
+        return self.counters.get('escalated', 0) / chunks
+
+    def record_read(self, num_samples: int, buffer_depth: int):
+        """Record a chunk of *num_samples* written to the buffer, leaving
+        *buffer_depth* samples in it
+        """
+        self.chunks_read += 1
+        self.samples_read += num_samples
+        self.buffer_depth = buffer_depth
+        if buffer_depth > self.max_buffer_depth:
+            self.max_buffer_depth = buffer_depth
+
+    def record_overrun(self, num_samples: int):
+        """Record a chunk of *num_samples* dropped because the buffer was full
+        """
+        self.chunks_read += 1
+        self.samples_read += num_samples
+        self.overruns += 1
+        self.dropped_samples += num_samples
+
+    def record_dropped(self, num_samples: int):
+        """Record *num_samples* already in the buffer that were dropped to make
+        room for a new chunk
+        """
+        self.overruns += 1
+        self.dropped_samples += num_samples
+
+    def record_processed(self, num_samples: int, elapsed: float):
+        """Record *num_samples* processed in *elapsed* seconds
+        """
+        self.samples_processed += num_samples
+        self._interval_samples += num_samples
+        self.busy_time += elapsed
+
+    @property
+    def load(self) -> float|None:
+        """Processing time in the current interval as a fraction of the
+        real time those samples span
+
+        Values approaching 1 mean processing is close to falling behind.
+        """
+        if not self.sample_rate or not self._interval_samples:
+            return None
+        return self.busy_time / (self._interval_samples / self.sample_rate)
+
+    def snapshot(self, reset: bool = True) -> dict[str, Any]:
+        """Get the current values as a JSON-serializable dict
+
+        If *reset* is True, a new interval is started.
+        """
+        now = time.time()
+        data = {
+            'time': now,
+            'uptime': now - self._start_time,
+            'interval': time.monotonic() - self._interval_start,
+            'samples_read': self.samples_read,
+            'chunks_read': self.chunks_read,
+            'overruns': self.overruns,
+            'dropped_samples': self.dropped_samples,
+            'buffer_depth': self.buffer_depth,
+            'max_buffer_depth': self.max_buffer_depth,
+            'buffer_maxsize': self.buffer_maxsize,
+            'samples_processed': self.samples_processed,
+            'busy_time': self.busy_time,
+            'load': self.load,
+            'counters': dict(self.counters),
+            'escalated_fraction': self.escalated_fraction,
+            'stages': {name: timer.to_dict() for name, timer in self.stages.items()},
+        }
+        if reset:
+            self._reset_interval()
+        return data
+
+
+class StatsWriter:
+    """Periodically write :meth:`PipelineStats.snapshot` as JSON lines
+    """
+
+    stats: PipelineStats
+
+    interval: float
+    """Time (in seconds) between each line"""
+
+    def __init__(
+        self,
+        stats: PipelineStats,
+        fd: TextIO = sys.stdout,
+        interval: float = 10
+    ) -> None:
+        self.stats = stats
+        self.fd = fd
+        self.interval = interval
+        self._last_write = time.monotonic()
+
+    def write(self):
+        """Write a snapshot immediately (starting a new interval)
+        """
+        self.fd.write(json.dumps(self.stats.snapshot()) + '\n')
+        self.fd.flush()
+        self._last_write = time.monotonic()
+
+    def poll(self):
+        """Write a snapshot if :attr:`interval` has elapsed since the last one
+        (for use within synchronous loops)
+        """
+        if time.monotonic() - self._last_write >= self.interval:
+            self.write()
+
+    async def run(self):
+        """Write a snapshot every :attr:`interval` seconds until cancelled
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            self.write()
@@ -0,0 +1,148 @@
+from __future__ import annotations
+from typing import Iterator, Sequence
+from dataclasses import dataclass
+import math
+
+import numpy as np
+import numpy.typing as npt
+
+from kiwitracker.common import SamplesT, FloatArray
+from kiwitracker.chicktimer import (
+    ChickTimer, CT_PAUSE, CT_DIGIT_GAP, CT_BEEP_INTERVAL,
+)
+
+
+BEEP_DURATION: float = 0.017
+"""Duration (in seconds) of each synthesized beep"""
+
+
+def bpm_beep_times(bpm: float, start: float, stop: float) -> FloatArray:
+    """Get the beep times (in seconds) for a transmitter in a background
+    mode of *bpm* from *start* to *stop*
+    """
+    return np.arange(start, stop, 60 / bpm)
+
+
+def chick_timer_beep_times(ct: ChickTimer, start: float) -> FloatArray:
+    """Get the beep times (in seconds) for a Chick Timer sequence
+
+    *start* is the time the sequence begins (after the initial
+    :data:`~.chicktimer.CT_PAUSE`)
+    """
+    times = []
+    t = start
+    for tens, ones in ct.to_beep_counts():
+        for count in (tens, ones):
+            for _ in range(count):
+                times.append(t)
+                t += CT_BEEP_INTERVAL
+            t += CT_DIGIT_GAP - CT_BEEP_INTERVAL
+        t += CT_PAUSE - CT_DIGIT_GAP
+    return np.array(times)
+
+
+@dataclass
+class Transmitter:
+    """A simulated transmitter
+    """
+
+    carrier_offset: float
+    """Offset of the carrier from the sdr's center frequency (in Hz)"""
+
+    bpm: float = 80
+    """Background mode beats per minute (30, 46-48 or 80)"""
+
+    amplitude: float = 1.0
+    """Amplitude of the carrier during a beep"""
+
+    start: float = 0.1
+    """Time (in seconds) of the first beep"""
+
+    chick_timer: ChickTimer|None = None
+    """If set, transmit this Chick Timer sequence at :attr:`chick_timer_start`
+    (background beeps stop during the sequence)
+    """
+
+    chick_timer_start: float = 0
+    """Time (in seconds) of the last background beep before the
+    :attr:`chick_timer` sequence
+    """
+
+    def beep_times(self, duration: float) -> FloatArray:
+        """Get the time (in seconds) for every beep within *duration*
+        """
+        if self.chick_timer is None:
+            return bpm_beep_times(self.bpm, self.start, duration)
+        before = bpm_beep_times(self.bpm, self.start, self.chick_timer_start + 1e-9)
+        ct_start = before[-1] + CT_PAUSE if before.size else self.chick_timer_start
+        ct_times = chick_timer_beep_times(self.chick_timer, ct_start)
+        # The final group is followed by a pause, then background mode resumes
+        after = bpm_beep_times(self.bpm, ct_times[-1] + CT_PAUSE, duration)
+        times = np.concatenate((before, ct_times, after))
+        return times[times < duration]
+
+
+def iter_synthesize(
+    transmitters: Sequence[Transmitter],
+    duration: float,
+    sample_rate: float,
+    chunk_size: int,
+    snr_db: float = 20,
+    beep_duration: float = BEEP_DURATION,
+    dtype: npt.DTypeLike = np.complex128,
+    seed: int|None = 0
+) -> Iterator[SamplesT]:
+    """Synthesize IQ samples for the given transmitters in chunks of
+    *chunk_size* (the last chunk may be shorter)
+
+    Noise is added with a power of *snr_db* below a carrier with an amplitude
+    of 1 (measured over the full sample bandwidth).
+    """
+    rng = np.random.default_rng(seed)
+    num_samples = int(duration * sample_rate)
+    noise_std = math.sqrt(10 ** (-snr_db / 10) / 2)
+    beep_len = round(beep_duration * sample_rate)
+    beep_starts = [
+        np.round(tx.beep_times(duration) * sample_rate).astype(np.int64)
+        for tx in transmitters
+    ]
+    real_dtype = np.finfo(dtype).dtype
+
+    for start in range(0, num_samples, chunk_size):
+        size = min(chunk_size, num_samples - start)
+        chunk = np.empty(size, dtype=dtype)
+        chunk.real = rng.standard_normal(size, dtype=real_dtype)
+        chunk.imag = rng.standard_normal(size, dtype=real_dtype)
+        chunk *= noise_std
+        n = np.arange(start, start + size)
+        for tx, starts in zip(transmitters, beep_starts):
+            # Beeps overlapping this chunk
+            lo = np.searchsorted(starts, start - beep_len, side='right')
+            hi = np.searchsorted(starts, start + size, side='left')
+            for beep_start in starts[lo:hi]:
+                i0 = max(beep_start - start, 0)
+                i1 = min(beep_start + beep_len - start, size)
+                t = n[i0:i1] / sample_rate
+                chunk[i0:i1] += tx.amplitude * np.exp(2j*np.pi*tx.carrier_offset*t)
+        yield chunk
+
+
+def synthesize(
+    transmitters: Sequence[Transmitter],
+    duration: float,
+    sample_rate: float,
+    snr_db: float = 20,
+    beep_duration: float = BEEP_DURATION,
+    dtype: npt.DTypeLike = np.complex128,
+    seed: int|None = 0
+) -> SamplesT:
+    """Synthesize *duration* seconds of IQ samples for the given transmitters
+
+    See :func:`iter_synthesize`
+    """
+    num_samples = int(duration * sample_rate)
+    chunks = iter_synthesize(
+        transmitters, duration, sample_rate, max(num_samples, 1),
+        snr_db=snr_db, beep_duration=beep_duration, dtype=dtype, seed=seed,
+    )
+    return np.concatenate(list(chunks) or [np.zeros(0, dtype=dtype)])
@@ -0,0 +1,79 @@
+import numpy as np
+
+from kiwitracker.chicktimer import ChickTimer, ChickTimerDecoder, CT_PAUSE
+from kiwitracker.synth import Transmitter, bpm_beep_times, chick_timer_beep_times
+
+
+CT_A = ChickTimer.from_values([3, 12, 0, 7, 45, 59, 10, 99])
+CT_B = ChickTimer.from_values([0, 1, 20, 2, 30, 8, 60, 5])
+
+
+def jitter(times: np.ndarray, seed: int = 0) -> np.ndarray:
+    # Errors in the detected beep times
+    rng = np.random.default_rng(seed)
+    return times + rng.uniform(-0.02, 0.02, times.size)
+
+
+def background(start: float, last: float) -> np.ndarray:
+    # Beeps at 80 BPM ending with one at *last*
+    return np.arange(last, start, -0.75)[::-1]
+
+
+def test_values():
+    assert CT_A.to_values() == [3, 12, 0, 7, 45, 59, 10, 99]
+    assert CT_A.to_beep_counts()[:2] == [(1, 4), (2, 3)]
+
+
+def test_decode_channels():
+    transmitters = {
+        11: Transmitter(0, bpm=80, start=0.2, chick_timer=CT_A, chick_timer_start=5),
+        21: Transmitter(0, bpm=47, start=0.5, chick_timer=CT_B, chick_timer_start=8),
+    }
+    beeps = []
+    for ch, tx in transmitters.items():
+        beeps.extend((t, ch) for t in jitter(tx.beep_times(150), ch))
+    beeps.sort()
+
+    decoder = ChickTimerDecoder()
+    results = [decoder.add_beep(t, ch) for t, ch in beeps]
+    events = sorted(
+        (event for event in results if event is not None), key=lambda e: e.channel,
+    )
+    assert [(e.channel, e.chick_timer) for e in events] == [(11, CT_A), (21, CT_B)]
+    for event in events:
+        tx = transmitters[event.channel]
+        ct_start = bpm_beep_times(tx.bpm, tx.start, tx.chick_timer_start + 1e-9)[-1] + CT_PAUSE
+        assert abs(event.time - ct_start) < 0.05
+    assert str(events[0]) == ' CH11 | CT : 03 12 00 07 45 59 10 99'
+
+
+def test_interrupted_sequence():
+    first = chick_timer_beep_times(CT_A, 10)
+    # A missed beep part way through the first sequence abandons it
+    first = np.delete(first, 20)
+    second_start = first[-1] + 60
+    times = np.concatenate([
+        background(0, 10 - CT_PAUSE),
+        first,
+        background(first[-1] + CT_PAUSE, second_start - CT_PAUSE),
+        chick_timer_beep_times(CT_B, second_start),
+        bpm_beep_times(80, second_start + 100, second_start + 110),
+    ])
+    decoder = ChickTimerDecoder()
+    events = [e for e in (decoder.add_beep(t) for t in jitter(times)) if e is not None]
+    assert len(events) == 1
+    assert events[0].channel is None
+    assert events[0].chick_timer == CT_B
+    assert abs(events[0].time - second_start) < 0.05
+
+
+def test_reset():
+    times = chick_timer_beep_times(CT_A, 10)
+    decoder = ChickTimerDecoder()
+    decoder.add_beep(10 - CT_PAUSE)
+    for t in times[:30]:
+        assert decoder.add_beep(t) is None
+    # Starting over (after a gap in the samples) needs another pause
+    decoder.reset()
+    assert all(decoder.add_beep(t) is None for t in times[30:])
+    assert decoder.add_beep(times[-1] + CT_PAUSE) is None
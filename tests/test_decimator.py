@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from kiwitracker.decimator import Decimator
+
+
+FACTORS = [8, 4]
+
+
+def make_samples(size: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal(size) + 1j*rng.standard_normal(size)
+
+
+def process_chunks(decimator: Decimator, samples: np.ndarray, sizes) -> np.ndarray:
+    out = []
+    start = 0
+    for size in sizes:
+        out.append(decimator.process(samples[start:start+size]))
+        start += size
+    out.append(decimator.process(samples[start:]))
+    return np.concatenate(out)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_chunk_sizes(seed: int):
+    samples = make_samples(20_000)
+    expected = Decimator(FACTORS).process(samples)
+    assert expected.size == samples.size // 32
+
+    # Random chunk sizes, including empty and single samples
+    rng = np.random.default_rng(seed)
+    sizes = rng.choice([0, 1, 7, 31, 32, 33, 500, 1023], size=60)
+    result = process_chunks(Decimator(FACTORS), samples, sizes)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_skip():
+    a, b = make_samples(5_000, 1), make_samples(7_000, 2)
+    num_skipped = 3_001
+    # Skipping clears the history, which is the same as having processed
+    # zeros (once more than a filter length of them have passed)
+    expected = Decimator(FACTORS).process(
+        np.concatenate([a, np.zeros(num_skipped), b])
+    )
+
+    decimator = Decimator(FACTORS)
+    out_a = process_chunks(decimator, a, [1_000, 333])
+    skipped = decimator.skip(num_skipped)
+    out_b = process_chunks(decimator, b, [17, 4_000])
+    assert out_a.size + skipped + out_b.size == expected.size
+    np.testing.assert_array_equal(out_a, expected[:out_a.size])
+    np.testing.assert_allclose(out_b, expected[out_a.size+skipped:], rtol=0, atol=1e-12)
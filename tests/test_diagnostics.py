@@ -0,0 +1,46 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from kiwitracker.benchmark import bench_import
+from kiwitracker.common import SampleConfig, ProcessConfig
+from kiwitracker.capture import CaptureHeader, CaptureWriter
+from kiwitracker.synth import Transmitter, iter_synthesize
+
+
+SAMPLE_RATE = 256_000
+CENTER_FREQ = 160_270_968
+
+
+@pytest.mark.parametrize('module', [
+    'kiwitracker', 'kiwitracker.offline', 'kiwitracker.pipeline', 'kiwitracker.diagnostics',
+])
+def test_lazy_imports(module: str):
+    # Plotting, the sdr driver and pyfftw are only imported when used
+    assert bench_import(module, repeat=1)['heavy_modules'] == []
+
+
+def test_run_diagnostics(tmp_path: Path):
+    pytest.importorskip('matplotlib')
+    from kiwitracker.diagnostics import run_diagnostics
+
+    filename = tmp_path / 'synth.kcap'
+    header = CaptureHeader(
+        sample_rate=SAMPLE_RATE, center_freq=CENTER_FREQ, dtype=np.dtype(np.complex64),
+    )
+    # Beeps in every other chunk
+    tx = Transmitter(carrier_offset=-40_968, bpm=30, start=0.3)
+    with CaptureWriter(filename, header) as writer:
+        for chunk in iter_synthesize([tx], 8, SAMPLE_RATE, 2 ** 18, dtype=np.complex64):
+            writer.write(chunk)
+    process_config = ProcessConfig(
+        sample_config=SampleConfig(), carrier_freq=CENTER_FREQ - 40_968,
+    )
+
+    run_diagnostics(process_config, str(filename), outdir=str(tmp_path / 'plots'), max_plots=3)
+    assert sorted(p.name for p in (tmp_path / 'plots').iterdir()) == [
+        'chunk_00000.png', 'chunk_00002.png', 'chunk_00004.png',
+    ]
+    run_diagnostics(process_config, str(filename), outdir=str(tmp_path / 'all'), all_chunks=True)
+    assert len(list((tmp_path / 'all').iterdir())) == 8
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from kiwitracker.common import SampleConfig, ProcessConfig
+from kiwitracker.channelizer import make_processor
+from kiwitracker.synth import Transmitter, synthesize
+
+
+SAMPLE_RATE = 256_000
+CENTER_FREQ = 160_270_968
+
+BPM_TOLERANCE = 0.05
+"""Maximum difference in BPM between complex64 and complex128"""
+
+SNR_TOLERANCE = 0.1
+"""Maximum difference in SNR (in dB) between complex64 and complex128"""
+
+
+def process(samples: np.ndarray, dtype, channels: list[int]|None):
+    sample_config = SampleConfig(sample_rate=SAMPLE_RATE, center_freq=CENTER_FREQ, dtype=dtype)
+    process_config = ProcessConfig(
+        sample_config=sample_config, carrier_freq=CENTER_FREQ - 40_968, channels=channels,
+    )
+    processor = make_processor(process_config)
+    chunk_size = processor.num_samples_to_process
+    samples = samples.astype(dtype)
+    events = []
+    for start in range(0, samples.size, chunk_size):
+        events.extend(processor.process(samples[start:start+chunk_size]))
+    return events
+
+
+@pytest.mark.parametrize('channels', [None, [11, 21]])
+def test_complex64_matches_complex128(channels: list[int]|None):
+    transmitters = [
+        Transmitter(carrier_offset=-40_968, bpm=80, start=0.3),
+        Transmitter(carrier_offset=59_032, bpm=47, start=0.55),
+    ]
+    samples = synthesize(transmitters, 10, SAMPLE_RATE, snr_db=20)
+    expected = process(samples, np.complex128, channels)
+    events = process(samples, np.complex64, channels)
+    assert len(expected) >= 12
+    assert len(events) == len(expected)
+    for event, ref in zip(events, expected):
+        assert event.channel == ref.channel
+        assert abs(event.time - ref.time) <= 1 / ref.sample_rate
+        assert event.snr == pytest.approx(ref.snr, abs=SNR_TOLERANCE)
+        if np.isfinite(ref.bpm):
+            assert event.bpm == pytest.approx(ref.bpm, abs=BPM_TOLERANCE)
+    # The background beeps are at the expected rates
+    for tx, ch in zip(transmitters, channels or [None]):
+        bpms = [e.bpm for e in events if e.channel == ch][1:]
+        assert bpms == pytest.approx([tx.bpm] * len(bpms), abs=0.5)
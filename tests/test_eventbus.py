@@ -0,0 +1,113 @@
+import asyncio
+
+from kiwitracker.eventbus import DropPolicy, EventBus
+from kiwitracker.sample_processor import BeepEvent
+
+
+def make_events(start: int, count: int) -> list[BeepEvent]:
+    return [
+        BeepEvent(index=i, sample_rate=16_000, bpm=80, snr=10, duration=0.017)
+        for i in range(start, start + count)
+    ]
+
+
+def indices(events) -> list[int]:
+    return [event.index for event in events]
+
+
+def drain(sub) -> list[BeepEvent]:
+    events = []
+    while sub.qsize():
+        events.append(sub.get_nowait())
+    return events
+
+
+def test_drop_oldest():
+    bus = EventBus()
+    sub = bus.subscribe('slow', maxsize=5, policy=DropPolicy.DROP_OLDEST)
+    bus.publish(make_events(0, 3))
+    bus.publish(make_events(3, 4))
+    assert sub.dropped == 2
+    assert indices(drain(sub)) == [2, 3, 4, 5, 6]
+
+    # A single batch larger than the subscription keeps only its newest
+    bus.publish(make_events(10, 8))
+    assert sub.dropped == 5
+    assert indices(drain(sub)) == [13, 14, 15, 16, 17]
+    assert bus.dropped == {'slow': 5}
+
+
+def test_drop_newest():
+    bus = EventBus()
+    sub = bus.subscribe('slow', maxsize=5, policy='drop-newest')
+    bus.publish(make_events(0, 3))
+    bus.publish(make_events(3, 4))
+    assert sub.dropped == 2
+    assert indices(drain(sub)) == [0, 1, 2, 3, 4]
+
+
+def test_fan_out():
+    async def run():
+        bus = EventBus()
+        fast = bus.subscribe('fast', maxsize=100)
+        slow = bus.subscribe('slow', maxsize=3)
+
+        async def read_all(sub):
+            return indices([event async for event in sub])
+
+        reader = asyncio.create_task(read_all(fast))
+        for i in range(4):
+            bus.publish(make_events(i * 2, 2))
+            await asyncio.sleep(0)
+        bus.close()
+        # The slow subscriber only loses its own events
+        return await reader, indices(drain(slow)), bus.dropped
+
+    fast, slow, dropped = asyncio.run(run())
+    assert fast == list(range(8))
+    assert slow == [5, 6, 7]
+    assert dropped == {'fast': 0, 'slow': 5}
+
+
+def test_close_ends_iteration():
+    async def run():
+        bus = EventBus()
+        sub = bus.subscribe()
+        received = []
+
+        async def read():
+            async for event in sub:
+                received.append(event.index)
+
+        task = asyncio.create_task(read())
+        bus.publish(make_events(0, 2))
+        await asyncio.sleep(0)
+        bus.close()
+        await asyncio.wait_for(task, 1)
+        # Nothing is added after closing
+        bus.publish(make_events(2, 1))
+        late = bus.subscribe()
+        return received, sub.qsize(), late.closed, await late.get()
+
+    received, remaining, late_closed, late_event = asyncio.run(run())
+    assert received == [0, 1]
+    assert remaining == 0
+    assert late_closed
+    assert late_event is None
+
+
+def test_subscription_close():
+    async def run():
+        bus = EventBus()
+        sub = bus.subscribe()
+        other = bus.subscribe()
+        bus.publish(make_events(0, 1))
+        sub.close()
+        bus.publish(make_events(1, 1))
+        return [event.index async for event in sub], other.qsize(), len(bus.subscriptions)
+
+    events, other_size, num_subs = asyncio.run(run())
+    # Events waiting when a subscription closes can still be read
+    assert events == [0]
+    assert other_size == 2
+    assert num_subs == 1
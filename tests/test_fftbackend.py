@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from kiwitracker import fftbackend
+from kiwitracker.fftbackend import BACKENDS, FFTBackend
+
+
+def make_input(shape, dtype=np.complex64, seed=0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(shape) + 1j*rng.standard_normal(shape)).astype(dtype)
+
+
+def test_abstract():
+    with pytest.raises(TypeError):
+        FFTBackend()
+
+
+@pytest.mark.parametrize('name', fftbackend.available_backends())
+@pytest.mark.parametrize('axis', [0, -1])
+def test_matches_numpy(name: str, axis: int):
+    backend = BACKENDS[name](2)
+    x = make_input((64, 256))
+    result = backend.fft(x, axis=axis)
+    assert result.dtype == np.complex64
+    np.testing.assert_allclose(result, np.fft.fft(x, axis=axis), rtol=1e-4, atol=1e-3)
+
+
+@pytest.mark.parametrize('name', fftbackend.available_backends())
+def test_threads(name: str):
+    # Threads sharing a backend (and the same plans) must not mix up
+    # each other's results
+    backend = BACKENDS[name](1)
+    inputs = [make_input((16, 4096), seed=i) for i in range(8)]
+    expected = [np.fft.fft(x) for x in inputs]
+
+    def run(i: int) -> bool:
+        return all(
+            np.allclose(backend.fft(inputs[i]), expected[i], rtol=1e-4, atol=1e-3)
+            for _ in range(20)
+        )
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert all(pool.map(run, range(len(inputs))))
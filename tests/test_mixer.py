@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from kiwitracker.mixer import Mixer, phasor_table, lowpass_taps
+
+
+SAMPLE_RATE = 256_000
+FREQ = -40_968.3
+
+
+def make_samples(size: int, seed: int = 0) -> np.ndarray:
+    # Unit magnitude, so the tolerance is on the phase
+    rng = np.random.default_rng(seed)
+    return np.exp(2j*np.pi*rng.random(size))
+
+
+def expected_mix(samples: np.ndarray, start: int = 0) -> np.ndarray:
+    # Wrap the phase in extended precision first (otherwise the reference
+    # itself drifts by ~1e-11 within 100k samples)
+    n = np.arange(start, start + samples.size, dtype=np.longdouble)
+    cycles = np.mod(n * FREQ / SAMPLE_RATE, 1).astype(np.float64)
+    return samples * np.exp(2j*np.pi*cycles)
+
+
+def test_phase_continuous():
+    samples = make_samples(40_000)
+    mixer = Mixer(SAMPLE_RATE, FREQ)
+    rng = np.random.default_rng(1)
+    out = []
+    position = 0
+    while position < samples.size:
+        size = int(rng.choice([0, 1, 3, 1000, 4097, 16384]))
+        out.append(mixer.process(samples[position:position+size]))
+        position += size
+    np.testing.assert_allclose(np.concatenate(out), expected_mix(samples), rtol=0, atol=1e-11)
+
+
+def test_seek_and_skip():
+    samples = make_samples(30_000)
+    mixer = Mixer(SAMPLE_RATE, FREQ)
+    out = mixer.process(samples[:1000])
+    mixer.skip(12_345)
+    np.testing.assert_allclose(
+        mixer.process(samples[13_345:20_000]), expected_mix(samples[13_345:20_000], 13_345),
+        rtol=0, atol=1e-11,
+    )
+    mixer.seek(25_001)
+    np.testing.assert_allclose(
+        mixer.process(samples[25_001:]), expected_mix(samples[25_001:], 25_001),
+        rtol=0, atol=1e-11,
+    )
+    # Seeking back gives the same output as the first time through
+    mixer.seek(0)
+    np.testing.assert_allclose(mixer.process(samples[:1000]), out, rtol=0, atol=1e-11)
+
+
+def test_cached_arrays_read_only():
+    table = phasor_table(SAMPLE_RATE, FREQ, 1024, np.dtype(np.complex64))
+    assert phasor_table(SAMPLE_RATE, FREQ, 1024, np.dtype(np.complex64)) is table
+    taps = lowpass_taps(63, 0.1, np.dtype(np.float32))
+    assert lowpass_taps(63, 0.1, np.dtype(np.float32)) is taps
+    for arr in [table, taps]:
+        assert not arr.flags.writeable
+        with pytest.raises(ValueError):
+            arr[0] = 0
+    # The mixer's output is a new (writable) array
+    out = Mixer(SAMPLE_RATE, FREQ, np.complex64).process(np.ones(1024, np.complex64))
+    assert out.flags.writeable
+    assert not np.shares_memory(out, table)
@@ -0,0 +1,77 @@
+from pathlib import Path
+import math
+import sqlite3
+
+import numpy as np
+
+from kiwitracker.common import SampleConfig, ProcessConfig
+from kiwitracker.sample_processor import BeepEvent
+from kiwitracker.simulated import Simulation
+from kiwitracker.synth import Transmitter
+from kiwitracker.sink import SqliteSink
+from kiwitracker.multi import DeviceConfig, EventMerger, run_devices
+
+
+SAMPLE_RATE = 256_000
+CENTER_FREQ = 160_270_968
+
+
+def make_event(wall_time: float, channel: int = 0) -> BeepEvent:
+    return BeepEvent(
+        index=0, sample_rate=SAMPLE_RATE, channel=channel, carrier_freq=0,
+        bpm=80, snr=10, duration=0.017, wall_time=wall_time,
+    )
+
+
+def test_merger_out_of_order_watermarks():
+    merger = EventMerger(['a', 'b'])
+
+    # Nothing is released until every device has reported past it
+    assert merger.add('a', [make_event(1.0), make_event(3.0)], 3.5) == []
+    assert merger.add('b', [make_event(2.0, 1)], 2.5) == [
+        make_event(1.0), make_event(2.0, 1),
+    ]
+
+    # A watermark that goes backwards is ignored (so 'a' stays at 3.5)
+    assert merger.add('b', [], 1.0) == []
+    assert merger.add('a', [make_event(4.0)], 2.0) == []
+    released = merger.add('b', [make_event(3.2, 1)], 5.0)
+    assert [e.wall_time for e in released] == [3.0, 3.2]
+    assert merger.add('a', [make_event(6.0)], 7.0) == [make_event(4.0)]
+
+    # Once a device stops, the others are no longer held back by it
+    assert merger.finish('b') == [make_event(6.0)]
+    assert merger.finish('a') == []
+
+
+def test_run_devices(tmp_path: Path):
+    duration, rate = 12, 4
+    transmitters = {
+        11: (Transmitter(carrier_offset=-40_968, bpm=80, start=0.3), 80),
+        21: (Transmitter(carrier_offset=59_032, bpm=47, start=0.55), 47),
+    }
+    devices = []
+    for i, (ch, (tx, _)) in enumerate(transmitters.items()):
+        sample_config = SampleConfig(
+            sample_rate=SAMPLE_RATE, center_freq=CENTER_FREQ, dtype=np.complex64,
+            device_index=i,
+            simulation=Simulation(transmitters=[tx], rate=rate, duration=duration),
+        )
+        devices.append(DeviceConfig(ProcessConfig(sample_config=sample_config, channels=[ch])))
+
+    filename = tmp_path / 'beeps.db'
+    with SqliteSink(filename) as sink:
+        run_devices(devices, sink=sink)
+    with sqlite3.connect(filename) as conn:
+        rows = conn.execute('SELECT wall_time, channel, bpm FROM beeps ORDER BY id').fetchall()
+    conn.close()
+
+    wall_times = [row[0] for row in rows]
+    assert wall_times == sorted(wall_times)
+    for ch, (tx, bpm) in transmitters.items():
+        ch_rows = [row for row in rows if row[1] == ch]
+        expected = len(tx.beep_times(duration))
+        assert expected - 2 <= len(ch_rows) <= expected
+        bpms = [row[2] for row in ch_rows if row[2] is not None and not math.isnan(row[2])]
+        assert bpms
+        assert all(abs(b - bpm) < 0.5 for b in bpms)
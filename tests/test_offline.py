@@ -0,0 +1,72 @@
+from pathlib import Path
+import math
+
+import numpy as np
+import pytest
+
+from kiwitracker.common import SampleConfig, ProcessConfig
+from kiwitracker.capture import CaptureHeader, CaptureWriter, CaptureFile
+from kiwitracker.synth import Transmitter, iter_synthesize
+from kiwitracker.offline import make_offline_processor, process_recordings
+
+
+SAMPLE_RATE = 256_000
+CENTER_FREQ = 160_270_968
+DURATION = 20
+
+
+@pytest.fixture(scope='module')
+def recording(tmp_path_factory) -> Path:
+    filename = tmp_path_factory.mktemp('offline') / 'synth.kcap'
+    transmitters = [
+        Transmitter(carrier_offset=-40_968, bpm=80, start=0.3),
+        Transmitter(carrier_offset=59_032, bpm=47, start=0.55),
+    ]
+    header = CaptureHeader(
+        sample_rate=SAMPLE_RATE, center_freq=CENTER_FREQ, dtype=np.dtype(np.complex64),
+    )
+    with CaptureWriter(filename, header) as writer:
+        for chunk in iter_synthesize(
+            transmitters, DURATION, SAMPLE_RATE, 2 ** 18, snr_db=20, dtype=np.complex64,
+        ):
+            writer.write(chunk)
+    return filename
+
+
+def process_serial(process_config: ProcessConfig, filename: Path):
+    capture = CaptureFile(filename)
+    process_config = capture.apply_to_config(process_config)
+    processor = make_offline_processor(process_config)
+    chunk_size = processor.num_samples_to_process
+    events = []
+    for chunk in capture.iter_chunks(chunk_size, process_config.dtype):
+        events.extend(processor.process(chunk))
+    return events
+
+
+def summarize(events) -> list[tuple]:
+    return [
+        (
+            event.channel, event.index,
+            None if math.isnan(event.bpm) else round(event.bpm, 6),
+            round(event.duration, 6),
+        )
+        for event in sorted(events, key=lambda e: (e.time, e.channel or 0))
+    ]
+
+
+@pytest.mark.parametrize('channels', [None, [11, 21]])
+@pytest.mark.parametrize('warmup_chunks', [None, 2])
+def test_parallel_matches_serial(recording: Path, channels: list[int]|None, warmup_chunks: int|None):
+    sample_config = SampleConfig(sample_rate=SAMPLE_RATE, center_freq=CENTER_FREQ, dtype=np.complex64)
+    process_config = ProcessConfig(
+        sample_config=sample_config, carrier_freq=CENTER_FREQ - 40_968, channels=channels,
+    )
+    serial = process_serial(process_config, recording)
+    result = process_recordings(
+        process_config, [recording], segment_duration=3, max_workers=2,
+        warmup_chunks=warmup_chunks,
+    )
+    parallel = result.recordings[recording]
+    assert len(serial) > 0
+    assert summarize(parallel) == summarize(serial)
@@ -0,0 +1,144 @@
+import asyncio
+import math
+import pickle
+
+import numpy as np
+import pytest
+
+from kiwitracker.common import SampleConfig, ProcessConfig, channel_freq
+from kiwitracker.channelizer import ChannelizerProcessor, make_processor
+from kiwitracker.eventbus import EventBus
+from kiwitracker.pipeline import (
+    SharedRing, split_channels, channelize_window, process_bin_window, run_pipeline,
+)
+from kiwitracker.sample_reader import Gap, OverrunPolicy, process_window, run_main
+from kiwitracker.simulated import Simulation
+from kiwitracker.synth import Transmitter, iter_synthesize
+
+
+SAMPLE_RATE = 256_000
+CENTER_FREQ = 160_270_968
+CHANNELS = [11, 21]
+
+
+def summarize(events) -> list[tuple]:
+    return sorted(
+        (
+            event.channel, event.index,
+            None if math.isnan(event.bpm) else round(event.bpm, 6),
+            round(event.duration, 6),
+        )
+        for event in events
+    )
+
+
+def test_shared_ring():
+    ring = SharedRing(3, 4, np.complex64, num_readers=2)
+    try:
+        for seq in range(3):
+            assert not ring.full
+            ring.slot(seq)[:] = seq
+            ring.write_seq += 1
+        assert ring.full
+
+        # Every reader must release a slot before it is reused
+        ring.release(0, 0)
+        assert ring.full
+        ring.release(1, 1)
+        assert not ring.full
+        ring.write_seq += 1
+        assert ring.full
+
+        # Slots wrap around
+        assert np.shares_memory(ring.slot(3), ring.slot(0))
+
+        # A stopped reader no longer holds up the writer
+        ring.remove_reader(0)
+        assert not ring.full
+
+        # A copy attaches to the same memory
+        other = pickle.loads(pickle.dumps(ring))
+        try:
+            assert other.slot_shape == (4,)
+            other.slot(2)[:] = 7
+            assert np.all(ring.slot(2) == 7)
+        finally:
+            other.close()
+    finally:
+        ring.close()
+
+
+def test_bin_window_matches_process():
+    sample_config = SampleConfig(sample_rate=SAMPLE_RATE, center_freq=CENTER_FREQ, dtype=np.complex64)
+    process_config = ProcessConfig(sample_config=sample_config, channels=CHANNELS)
+    transmitters = [
+        Transmitter(channel_freq(11) - CENTER_FREQ, bpm=80, start=0.3),
+        Transmitter(channel_freq(21) - CENTER_FREQ, bpm=47, start=0.55),
+    ]
+    samples = np.concatenate(list(iter_synthesize(
+        transmitters, 12, SAMPLE_RATE, 2 ** 18, dtype=np.complex64,
+    )))
+    reference = make_processor(process_config)
+    reference.verbose = False
+    front = ChannelizerProcessor(process_config)
+    configs = split_channels(process_config, 2)
+    workers = [make_processor(config) for config in configs]
+    columns = [[front.channels.index(ch) for ch in config.channels] for config in configs]
+    for worker in workers:
+        worker.verbose = False
+    window_size = reference.num_samples_to_process
+    out = np.empty((window_size // front.channelizer.decimation + 20, len(CHANNELS)), np.complex64)
+
+    expected, found = [], []
+    position = 0
+    while position < samples.size:
+        window = samples[position:position+window_size]
+        # Drop some samples part way through every third window
+        gaps = []
+        if position // window_size % 3 == 1:
+            gaps = [Gap(position + 1000, 5000, 1000)]
+            window = np.concatenate([window[:1000], samples[position+6000:position+window_size]])
+        position += window.size + sum(gap.count for gap in gaps)
+        expected.extend(process_window(reference, window, gaps))
+        size, bin_gaps = channelize_window(front, window, gaps, out)
+        for worker, cols in zip(workers, columns):
+            found.extend(process_bin_window(worker, out[:size,cols], bin_gaps))
+    assert len(expected) > 20
+    assert summarize(found) == summarize(expected)
+
+
+async def collect_events(run, bus: EventBus):
+    sub = bus.subscribe(maxsize=10_000)
+
+    async def read_all():
+        return [event async for event in sub]
+
+    events, _ = await asyncio.gather(read_all(), run)
+    return events
+
+
+@pytest.mark.parametrize('channels', [None, CHANNELS])
+def test_run_pipeline_matches_run_main(channels: list[int]|None):
+    sample_config = SampleConfig(sample_rate=SAMPLE_RATE, center_freq=CENTER_FREQ, dtype=np.complex64)
+    sample_config.simulation = Simulation.for_channels(
+        sample_config, CHANNELS, rate=4, duration=10,
+    )
+    process_config = ProcessConfig(
+        sample_config=sample_config, carrier_freq=channel_freq(11), channels=channels,
+    )
+    policy = OverrunPolicy.BLOCK
+
+    bus = EventBus()
+    expected = asyncio.run(collect_events(
+        run_main(sample_config, process_config, overrun_policy=policy, bus=bus), bus,
+    ))
+    bus = EventBus()
+    found = asyncio.run(collect_events(
+        run_pipeline(sample_config, process_config, num_workers=2, overrun_policy=policy, bus=bus),
+        bus,
+    ))
+    assert len(expected) >= 10
+    assert summarize(found) == summarize(expected)
+    # The events from the workers are merged back into time order
+    wall_times = [event.wall_time for event in found]
+    assert wall_times == sorted(wall_times)
@@ -0,0 +1,79 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from kiwitracker.rawiq import RAW_IQ_DTYPE, convert_raw_iq, to_raw_iq, num_samples
+from kiwitracker.sample_reader import SampleBuffer
+
+
+def rtlsdr_scaling(raw: np.ndarray) -> np.ndarray:
+    # The conversion in `rtlsdr.RtlSdr.packed_bytes_to_iq()`
+    iq = raw.astype(np.float64).view(np.complex128)
+    iq /= 127.5
+    iq -= (1 + 1j)
+    return iq
+
+
+def make_raw(size: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size, dtype=RAW_IQ_DTYPE)
+
+
+@pytest.mark.parametrize('dtype', [np.complex64, np.complex128])
+def test_matches_rtlsdr(dtype):
+    raw = np.concatenate([np.arange(256, dtype=RAW_IQ_DTYPE), make_raw(10_000)])
+    samples = convert_raw_iq(raw, dtype=dtype)
+    assert samples.dtype == dtype
+    assert samples.size == num_samples(raw) == 5_128
+    # Only rounding differences (before subtracting 1) from computing in the
+    # output's precision
+    atol = 2 * np.finfo(dtype).eps
+    np.testing.assert_allclose(samples, rtlsdr_scaling(raw), rtol=0, atol=atol)
+
+    # A trailing odd byte is ignored
+    assert convert_raw_iq(raw[:11], dtype=dtype).size == 5
+
+    # Converting into part of a larger array
+    out = np.zeros(samples.size + 10, dtype=dtype)
+    assert np.shares_memory(convert_raw_iq(raw, out=out), out)
+    np.testing.assert_array_equal(out[:samples.size], samples)
+    assert not np.any(out[samples.size:])
+
+
+@pytest.mark.parametrize('dtype', [np.complex64, np.complex128])
+def test_round_trip(dtype):
+    raw = np.concatenate([np.arange(256, dtype=RAW_IQ_DTYPE), make_raw(10_000)])
+    np.testing.assert_array_equal(to_raw_iq(convert_raw_iq(raw, dtype=dtype)), raw)
+
+    # Anything else is quantized to within half a step, and clipped
+    rng = np.random.default_rng(1)
+    samples = (rng.uniform(-1.2, 1.2, 1000) + 1j*rng.uniform(-1.2, 1.2, 1000)).astype(dtype)
+    result = convert_raw_iq(to_raw_iq(samples), dtype=dtype)
+    clipped = np.clip(samples.real, -1, 1) + 1j*np.clip(samples.imag, -1, 1)
+    np.testing.assert_allclose(result.real, clipped.real, rtol=0, atol=0.5/127.5 + 1e-6)
+    np.testing.assert_allclose(result.imag, clipped.imag, rtol=0, atol=0.5/127.5 + 1e-6)
+
+
+def test_sample_buffer_raw():
+    # Raw bytes (as read with --raw-iq) are converted as they are written,
+    # including across the end of the buffer's storage
+    raw = make_raw(1_200)
+    expected = convert_raw_iq(raw, dtype=np.complex64)
+
+    async def run():
+        buffer = SampleBuffer(maxsize=256, dtype=np.complex64)
+        assert buffer.capacity == 512
+        result = []
+        for start, stop in [(0, 200), (200, 400), (400, 600)]:
+            await asyncio.to_thread(buffer.put_threadsafe, raw[start*2:stop*2])
+            result.append(np.array(await buffer.get(stop - start)))
+        # Raw bytes and complex samples can be mixed
+        await asyncio.to_thread(buffer.put_threadsafe, expected[:10])
+        result.append(np.array(await buffer.get(10)))
+        return np.concatenate(result), buffer.read_position
+
+    samples, position = asyncio.run(run())
+    assert position == 610
+    np.testing.assert_array_equal(samples[:600], expected)
+    np.testing.assert_array_equal(samples[600:], expected[:10])
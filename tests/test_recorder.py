@@ -0,0 +1,136 @@
+from pathlib import Path
+import sqlite3
+
+import numpy as np
+import pytest
+
+from kiwitracker.common import SampleConfig, ProcessConfig
+from kiwitracker.capture import CaptureFile, CaptureSegment, index_filename
+from kiwitracker.recorder import TriggeredRecorder
+from kiwitracker.sample_processor import BeepEvent, SampleProcessor
+from kiwitracker.sample_reader import run_from_disk
+from kiwitracker.sink import SqliteSink
+from kiwitracker.synth import Transmitter, iter_synthesize
+
+
+SAMPLE_RATE = 256_000
+CENTER_FREQ = 160_270_968
+
+
+def make_event(index: int, sample_rate: float, channel: int|None = None, duration: float = 0.02):
+    return BeepEvent(
+        index=index, sample_rate=sample_rate, bpm=80, snr=10, duration=duration,
+        channel=channel,
+    )
+
+
+def ramp_recorder(tmp_path: Path, **kwargs) -> TriggeredRecorder:
+    # A stream where each sample's value is its index, at 1000 samples/sec
+    sample_config = SampleConfig(sample_rate=1000, center_freq=CENTER_FREQ, dtype=np.complex64)
+    kwargs.setdefault('noise_interval', None)
+    return TriggeredRecorder(tmp_path, sample_config, 100, **kwargs)
+
+
+def feed_ramp(recorder: TriggeredRecorder, num_windows: int, events: dict[int, list[BeepEvent]]):
+    for i in range(num_windows):
+        window = np.arange(i * 100, (i + 1) * 100).astype(np.complex64)
+        recorder.add(window, (i + 1) * 100, [], events.get(i, []))
+
+
+def read_segments(directory: Path) -> list[tuple[CaptureSegment, np.ndarray]]:
+    result = []
+    for filename in sorted(directory.glob('*.kcap')):
+        capture = CaptureFile(filename)
+        for segment in CaptureSegment.read_index(index_filename(filename)):
+            result.append((segment, capture.read(segment.offset, segment.count, np.complex64)))
+    return result
+
+
+def test_pre_and_post_trigger(tmp_path: Path):
+    with ramp_recorder(tmp_path, pre_trigger=0.05, post_trigger=0.03) as recorder:
+        # Reported a window after the beep's rising edge at sample 420
+        feed_ramp(recorder, 10, {5: [make_event(420, 1000, channel=3)]})
+    [(segment, samples)] = read_segments(tmp_path)
+    assert (segment.position, segment.count) == (370, 100)
+    assert segment.kind == 'beep'
+    assert segment.channels == [3]
+    np.testing.assert_array_equal(samples.real, np.arange(370, 470))
+
+
+def test_overlapping_triggers_merge(tmp_path: Path):
+    with ramp_recorder(tmp_path, pre_trigger=0.05, post_trigger=0.03) as recorder:
+        feed_ramp(recorder, 12, {
+            5: [make_event(420, 1000, channel=3)],
+            6: [make_event(450, 1000, channel=4)],
+            # Separate from the others
+            9: [make_event(800, 1000, channel=3)],
+        })
+    segments = read_segments(tmp_path)
+    assert [(s.position, s.stop, s.channels) for s, _ in segments] == [
+        (370, 500, [3, 4]), (750, 850, [3]),
+    ]
+    # The segments are stored back to back
+    assert [s.offset for s, _ in segments] == [0, 130]
+    for segment, samples in segments:
+        np.testing.assert_array_equal(samples.real, np.arange(segment.position, segment.stop))
+
+
+def test_noise_snapshots(tmp_path: Path):
+    with ramp_recorder(tmp_path, noise_interval=0.5, noise_duration=0.05) as recorder:
+        feed_ramp(recorder, 12, {})
+    segments = read_segments(tmp_path)
+    assert [(s.kind, s.position, s.count) for s, _ in segments] == [
+        ('noise', 50, 50), ('noise', 550, 50), ('noise', 1050, 50),
+    ]
+
+
+def test_file_rollover(tmp_path: Path):
+    with ramp_recorder(tmp_path, pre_trigger=0.01, post_trigger=0.01, file_duration=1) as recorder:
+        feed_ramp(recorder, 40, {
+            i: [make_event(i * 100 - 50, 1000)] for i in range(1, 40, 3)
+        })
+    files = sorted(tmp_path.glob('*.kcap'), key=lambda f: CaptureFile(f).start_index)
+    assert len(files) == 4
+    positions = []
+    for filename in files:
+        assert index_filename(filename).exists()
+        capture = CaptureFile(filename)
+        segments = CaptureSegment.read_index(index_filename(filename))
+        # Each file covers at most file_duration of the stream
+        assert segments[0].position == capture.start_index
+        assert segments[-1].position - capture.start_index < 1000
+        assert sum(s.count for s in segments) == capture.size
+        positions.extend(s.position for s in segments)
+    assert positions == [i * 100 - 60 for i in range(1, 40, 3)]
+
+
+def test_replay(tmp_path: Path):
+    sample_config = SampleConfig(sample_rate=SAMPLE_RATE, center_freq=CENTER_FREQ, dtype=np.complex64)
+    process_config = ProcessConfig(sample_config=sample_config, carrier_freq=CENTER_FREQ - 40_968)
+    processor = SampleProcessor(process_config)
+    processor.verbose = False
+    window_size = processor.num_samples_to_process
+    tx = Transmitter(carrier_offset=-40_968, bpm=80, start=0.3)
+    found = []
+    with TriggeredRecorder(tmp_path / 'rec', sample_config, window_size, noise_interval=5) as recorder:
+        position = 0
+        for window in iter_synthesize([tx], 20, SAMPLE_RATE, window_size, dtype=np.complex64):
+            events = processor.process(window)
+            position += window.size
+            recorder.add(window, position, [], events, stream_start=1e9)
+            found.extend(events)
+    [filename] = (tmp_path / 'rec').glob('*.kcap')
+    # Only the samples around the beeps (and the noise snapshots) are kept
+    assert CaptureFile(filename).size < position / 2
+
+    db_file = tmp_path / 'replay.db'
+    with SqliteSink(db_file) as sink:
+        run_from_disk(process_config, str(filename), sink=sink)
+    with sqlite3.connect(db_file) as conn:
+        rows = conn.execute('SELECT time, bpm FROM beeps ORDER BY id').fetchall()
+    conn.close()
+
+    # The beeps are found at the same times in the stream as they were live
+    assert len(rows) == len(found)
+    assert [time for time, _ in rows] == pytest.approx([e.time for e in found], abs=1e-3)
+    assert [bpm for _, bpm in rows[1:]] == pytest.approx([80] * (len(rows) - 1), abs=0.5)
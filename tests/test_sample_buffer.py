@@ -0,0 +1,45 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from kiwitracker.sample_reader import SampleBuffer, OverrunPolicy
+
+
+def ramp(start: int, count: int) -> np.ndarray:
+    return np.arange(start, start + count).astype(np.complex128)
+
+
+def put_all(buffer: SampleBuffer, chunks: list[np.ndarray]):
+    for chunk in chunks:
+        try:
+            buffer.put_threadsafe(chunk)
+        except asyncio.QueueFull:
+            pass
+
+
+@pytest.mark.parametrize('policy', list(OverrunPolicy))
+def test_window_not_overwritten(policy: OverrunPolicy):
+    # The window from get() must stay intact while it is processed, even as
+    # the sdr thread keeps writing (and dropping) samples
+    async def run():
+        buffer = SampleBuffer(maxsize=30, overrun_policy=policy, block_timeout=0)
+        await asyncio.to_thread(put_all, buffer, [ramp(0, 10)])
+        window = await buffer.get(10)
+        chunks = [ramp(10 + i * 5, 5) for i in range(12)]
+        await asyncio.to_thread(put_all, buffer, chunks)
+        return window
+
+    window = asyncio.run(run())
+    assert np.array_equal(window, ramp(0, 10))
+
+
+def test_drop_oldest_gaps():
+    buffer = SampleBuffer(maxsize=30, overrun_policy=OverrunPolicy.DROP_OLDEST)
+    put_all(buffer, [ramp(i * 5, 5) for i in range(12)])
+    samples = asyncio.run(buffer.get(len(buffer)))
+    # Each sample's stream position is known from the gaps
+    assert buffer.last_gaps[0].offset == 0
+    position = buffer.last_position
+    assert np.array_equal(samples, ramp(position, samples.size))
+    assert buffer.read_position == 60
@@ -0,0 +1,147 @@
+import math
+
+import numpy as np
+import pytest
+
+from kiwitracker.common import SampleConfig, ProcessConfig
+from kiwitracker.sample_processor import SampleProcessor, calculate_bpm
+from kiwitracker.offline import stitch_events
+from kiwitracker.synth import Transmitter, synthesize, iter_synthesize
+
+
+SAMPLE_RATE = 256_000
+CENTER_FREQ = 160_270_968
+
+
+def make_processor(**kwargs) -> SampleProcessor:
+    process_config = ProcessConfig(
+        sample_config=SampleConfig(sample_rate=SAMPLE_RATE, center_freq=CENTER_FREQ),
+        carrier_freq=CENTER_FREQ - 40_968,
+        **kwargs
+    )
+    processor = SampleProcessor(process_config)
+    processor.verbose = False
+    return processor
+
+
+def process(samples: np.ndarray) -> list:
+    processor = make_processor()
+    chunk_size = processor.num_samples_to_process
+    events = []
+    for start in range(0, samples.size, chunk_size):
+        events.extend(processor.process(samples[start:start+chunk_size]))
+    return events
+
+
+def test_calculate_bpm():
+    assert math.isnan(calculate_bpm(100, None, 1000))
+    assert math.isnan(calculate_bpm(100, 100, 1000))
+    assert calculate_bpm(850, 100, 1000) == pytest.approx(80)
+
+
+def test_beep_at_stream_start():
+    tx = Transmitter(carrier_offset=-40_968, bpm=80, start=0)
+    events = process(synthesize([tx], 3, SAMPLE_RATE, snr_db=20))
+    assert len(events) == 4
+    assert events[0].index == 0
+    assert math.isnan(events[0].bpm)
+    assert all(event.time >= 0 for event in events)
+    assert [event.bpm for event in events[1:]] == pytest.approx([80] * 3, abs=0.5)
+
+    stitched = stitch_events(events)
+    assert math.isnan(stitched[0].bpm)
+    assert [event.bpm for event in stitched[1:]] == pytest.approx([event.bpm for event in events[1:]])
+
+
+def process_with_gain_step(processor: SampleProcessor, transmitters: list[Transmitter]):
+    """Process 20 chunks, then 60 more at 10 times the amplitude (as if the
+    gain was changed), returning the thresholds after each part and the events
+    """
+    chunk_size = processor.num_samples_to_process
+    chunks = iter_synthesize(
+        transmitters, 80 * chunk_size / SAMPLE_RATE, SAMPLE_RATE, chunk_size, seed=1,
+    )
+    thresholds = []
+    events = []
+    for i, chunk in enumerate(chunks):
+        events.extend(processor.process(chunk if i < 20 else chunk * 10))
+        if i in (19, 79):
+            thresholds.append((processor.detect_threshold, processor.edge_threshold))
+    return thresholds, events
+
+
+@pytest.mark.parametrize('batch_detection', [True, False])
+def test_thresholds_track_gain(batch_detection: bool):
+    processor = make_processor(batch_detection=batch_detection)
+    tx = Transmitter(carrier_offset=-40_968, bpm=80, start=0.3)
+    (detect1, edge1), (detect2, edge2) = process_with_gain_step(processor, [tx])[0]
+    assert 8 < detect2 / detect1 < 11
+    assert 8 < edge2 / edge1 < 11
+
+
+def test_thresholds_match_without_batch_detection():
+    tx = Transmitter(carrier_offset=-40_968, bpm=80, start=0.3)
+    batched = process_with_gain_step(make_processor(batch_detection=True), [tx])
+    looped = process_with_gain_step(make_processor(batch_detection=False), [tx])
+    assert looped[0] == pytest.approx(batched[0])
+    assert [e.index for e in looped[1]] == [e.index for e in batched[1]]
+
+
+def test_noise_escalations():
+    processor = make_processor()
+    thresholds, events = process_with_gain_step(processor, [])
+    assert events == []
+    assert processor.stats.escalated_fraction < 0.1
+    assert 8 < thresholds[1][0] / thresholds[0][0] < 11
+
+
+@pytest.mark.parametrize('dtype', [np.complex64, np.complex128])
+def test_batched_detection_matches_loop(dtype):
+    tx = Transmitter(carrier_offset=-40_968, bpm=80, start=0.3)
+    samples = synthesize([tx], 1, SAMPLE_RATE, snr_db=10, dtype=dtype)
+    # Separate processors, as each updates its noise estimate
+    processor = make_processor()
+    batched = processor.detect_beeps(samples)
+    beep_freqs, peak_mags = make_processor()._detect_beeps_loop(samples)
+    assert 0 < len(beep_freqs) < len(peak_mags)
+    np.testing.assert_array_equal(batched.beep_freqs, beep_freqs)
+    np.testing.assert_allclose(batched.peak_mags, peak_mags, rtol=1e-5)
+    # The beep is found at the transmitter's frequency
+    bin_width = SAMPLE_RATE / processor.fft_size
+    assert np.all(np.abs(batched.beep_freqs - tx.carrier_offset) < bin_width)
+
+
+def test_energy_gate():
+    processor = make_processor()
+    chunk_size = processor.num_samples_to_process
+    # A single beep after 30 chunks of noise
+    tx = Transmitter(carrier_offset=-40_968, bpm=30, start=30 * chunk_size / SAMPLE_RATE + 0.05)
+    chunks = list(iter_synthesize([tx], 32 * chunk_size / SAMPLE_RATE, SAMPLE_RATE, chunk_size, seed=1))
+    for chunk in chunks[:30]:
+        assert processor.process(chunk) == []
+    counters = processor.stats.counters
+    # Every 13th rejected chunk still goes through the FFTs as an audit
+    assert counters['gate_rejected'] == 28
+    assert counters['detect_rejected'] == 2
+    assert 'escalated' not in counters
+
+    assert processor.check_energy(chunks[30])
+    assert len(processor.process(chunks[30])) == 1
+    assert counters['escalated'] == 1
+    assert processor.process(chunks[31]) == []
+    assert counters['gate_rejected'] == 29
+
+
+def test_energy_gate_missed():
+    # A gate that rejects everything is disabled by the first audit that
+    # finds a beep, so the rest are still found
+    processor = make_processor()
+    processor.gate_sigma = 1e6
+    tx = Transmitter(carrier_offset=-40_968, bpm=80, start=0.3)
+    events = process_with_gain_step(processor, [tx])[1]
+    counters = processor.stats.counters
+    assert counters['gate_missed'] == 1
+    assert not processor.gate_enabled
+    assert counters['gate_rejected'] == processor.gate_audit_interval - 1
+    assert counters['escalated'] == 80 - processor.gate_audit_interval + 1
+    assert len(events) > 90
@@ -0,0 +1,79 @@
+import numpy as np
+
+from kiwitracker.common import SampleConfig, channel_freq
+from kiwitracker.scan import ActiveChannelCache, ChannelScanner, ScanScheduler
+from kiwitracker.synth import Transmitter, iter_synthesize
+
+
+SAMPLE_RATE = 256_000
+CENTER_FREQ = 160_270_968
+
+
+def make_sample_config() -> SampleConfig:
+    return SampleConfig(sample_rate=SAMPLE_RATE, center_freq=CENTER_FREQ, dtype=np.complex64)
+
+
+def make_chunks(duration: float, chunk_size: int = 2 ** 16):
+    # Beeps on channel 11, and a weaker transmitter on channel 21
+    transmitters = [
+        Transmitter(channel_freq(11) - CENTER_FREQ, bpm=80, start=0.3),
+        Transmitter(channel_freq(21) - CENTER_FREQ, bpm=47, start=0.55, amplitude=0.3),
+    ]
+    return iter_synthesize(
+        transmitters, duration, SAMPLE_RATE, chunk_size, dtype=np.complex64, seed=2,
+    )
+
+
+def test_scanner():
+    sample_config = make_sample_config()
+    scanner = ChannelScanner(sample_config)
+    for chunk in make_chunks(10):
+        scanner.process(chunk)
+    result = scanner.result()
+    assert abs(result.duration - 10) < 0.01
+    assert result.channels == sample_config.channels_in_span()
+    assert result.active_channels == [11, 21]
+    snr = dict(zip(result.channels, result.snr))
+    assert snr[11] > snr[21] > result.threshold
+    assert 'CH11' in str(result)
+
+    # Noise alone stays below the threshold
+    scanner.reset()
+    for chunk in iter_synthesize([], 10, SAMPLE_RATE, 2 ** 16, dtype=np.complex64, seed=3):
+        scanner.process(chunk)
+    assert scanner.result().active_channels == []
+
+
+def test_cache_expires():
+    cache = ActiveChannelCache(ttl=10)
+    cache.add([11, 21], now=0)
+    cache.add([21], now=5)
+    assert cache.active(9.9) == [11, 21]
+    assert cache.active(10) == [21]
+    assert cache.expires == {21: 15}
+    assert cache.active(15) == []
+
+
+def test_scheduler():
+    scheduler = ScanScheduler(make_sample_config(), interval=20, duration=5, ttl=8)
+    results = []
+    active = []
+    for chunk in make_chunks(32):
+        if scheduler.scanning:
+            result = scheduler.scan(chunk)
+            if result is not None:
+                results.append((scheduler.time, result.active_channels))
+        # Beeps are only reported on channel 11
+        channels = scheduler.advance(chunk.size, [11, None])
+        active.append((scheduler.time, channels))
+    # The next scan starts 20 seconds after the first ended
+    [(t1, chs1), (t2, chs2)] = results
+    assert chs1 == chs2 == [11, 21]
+    assert 4.8 <= t1 < 5
+    assert t1 + 25 <= t2 < t1 + 25.3
+    # Channel 21 expires from the cache between scans
+    for t, chs in active:
+        if t1 < t < t1 + 8:
+            assert chs == [11, 21]
+        elif t1 + 8 <= t < t2:
+            assert chs == [11]
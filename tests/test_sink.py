@@ -0,0 +1,54 @@
+from pathlib import Path
+import sqlite3
+import threading
+
+import pytest
+
+from kiwitracker.sample_processor import BeepEvent
+from kiwitracker.sink import SqliteSink
+
+
+def make_events(count: int) -> list[BeepEvent]:
+    return [
+        BeepEvent(index=i, sample_rate=16_000, bpm=80, snr=10, duration=0.017)
+        for i in range(count)
+    ]
+
+
+def test_write(tmp_path: Path):
+    filename = tmp_path / 'beeps.db'
+    with SqliteSink(filename, batch_size=3) as sink:
+        for _ in range(4):
+            sink.put(make_events(2))
+    assert sink.written == 8
+    with sqlite3.connect(filename) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM beeps').fetchone() == (8,)
+    conn.close()
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_close_after_writer_died(tmp_path: Path):
+    sink = SqliteSink(tmp_path / 'beeps.db', maxsize=4, batch_size=1, flush_interval=0.05)
+    failed = threading.Event()
+
+    def fail(conn, batch):
+        failed.set()
+        raise sqlite3.OperationalError('disk I/O error')
+
+    sink._write = fail
+    sink.open()
+    sink.put(make_events(1))
+    assert failed.wait(5)
+    sink._thread.join(5)
+    assert not sink._thread.is_alive()
+
+    # Fill the queue so nothing more can be put on it
+    for _ in range(5):
+        sink.put(make_events(1))
+    assert sink.dropped == 1
+
+    closer = threading.Thread(target=sink.close)
+    closer.start()
+    closer.join(5)
+    assert not closer.is_alive()
+    assert sink.dropped == 5